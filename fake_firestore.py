@@ -0,0 +1,586 @@
+"""
+In-memory Firestore stand-in
+============================
+
+A small fake of the parts of the Firestore client used by
+`firebase_ai_integration.py`, so the pipeline can be exercised locally
+without credentials or network access.
+
+Usage:
+    from fake_firestore import FakeFirestore, FakeTimestamp
+    from firebase_ai_integration import FirebaseAIIntegration
+
+    db = FakeFirestore()
+    db.add_document('businesses', 'BIZ00001', {'businessName': 'Kedai Runcit'})
+    db.add_document('invoices', 'INV00001', {
+        'businessId': 'BIZ00001',
+        'createdAt': FakeTimestamp(datetime(2024, 1, 5)),
+        'total': 120.0,
+    })
+
+    integration = FirebaseAIIntegration()
+    integration.db = db
+    df = integration.fetch_businesses_from_firebase(bulk=True)
+"""
+
+import heapq
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from functools import total_ordering
+from typing import Dict, List, Any, Optional, Tuple
+
+import numpy as np
+
+
+class ServiceUnavailable(Exception):
+    """Transient error, named after `google.api_core.exceptions.ServiceUnavailable`"""
+
+
+class NotFound(Exception):
+    """Missing document, named after `google.api_core.exceptions.NotFound`"""
+
+
+@total_ordering
+class FakeTimestamp:
+    """Mimics a Firestore timestamp value exposing `to_datetime()`"""
+
+    def __init__(self, value: datetime):
+        self.value = value
+
+    def to_datetime(self) -> datetime:
+        return self.value
+
+    def __eq__(self, other):
+        return _comparable(self) == _comparable(other)
+
+    def __lt__(self, other):
+        return _comparable(self) < _comparable(other)
+
+    def __hash__(self):
+        return hash(self.value)
+
+    def __repr__(self):
+        return f"FakeTimestamp({self.value!r})"
+
+
+def _comparable(value: Any) -> Any:
+    """Unwrap timestamps so they compare against plain datetimes"""
+    if isinstance(value, FakeTimestamp):
+        return value.value
+    return value
+
+
+_OPERATORS = {
+    '==': lambda a, b: a == b,
+    '!=': lambda a, b: a != b,
+    '<': lambda a, b: a < b,
+    '<=': lambda a, b: a <= b,
+    '>': lambda a, b: a > b,
+    '>=': lambda a, b: a >= b,
+    'in': lambda a, b: a in b,
+}
+
+
+class ColumnarDocuments:
+    """Dict-like document store for a generated collection kept as numpy columns
+
+    Each column is a `(values, decode)` pair, or `(values, decode, encode)` where
+    `encode` maps a query value to the stored representation so `==` and `in`
+    filters on that field are answered from the column without building documents. A
+    document is built as a dict by decoding its row when it is read, so millions
+    of documents cost a few bytes per field instead of a Python dict each. Writes
+    are kept in an overlay.
+    """
+
+    def __init__(self, doc_ids: np.ndarray, columns: Dict[str, Tuple]):
+        order = np.argsort(doc_ids, kind='stable')
+        self._ids = np.asarray(doc_ids, dtype=np.bytes_)[order]
+        self._columns = [(name, spec[0][order], spec[1]) for name, spec in columns.items()]
+        self._encoders = {name: (spec[0][order], spec[2]) for name, spec in columns.items() if len(spec) > 2}
+        self._overlay: Dict[str, Dict] = {}
+        self._added: List[str] = []
+        self._overwritten: List[int] = []
+
+    def _row(self, doc_id: str) -> int:
+        key = doc_id.encode()
+        row = int(np.searchsorted(self._ids, key))
+        return row if row < len(self._ids) and self._ids[row] == key else -1
+
+    def _materialize(self, row: int) -> Dict:
+        return {name: decode(values[row]) for name, values, decode in self._columns}
+
+    def get(self, doc_id: str, default: Any = None) -> Any:
+        if doc_id in self._overlay:
+            return self._overlay[doc_id]
+        row = self._row(doc_id)
+        return self._materialize(row) if row >= 0 else default
+
+    def __getitem__(self, doc_id: str) -> Dict:
+        data = self.get(doc_id)
+        if data is None:
+            raise KeyError(doc_id)
+        return data
+
+    def __setitem__(self, doc_id: str, data: Dict):
+        if doc_id not in self._overlay:
+            row = self._row(doc_id)
+            if row < 0:
+                self._added.append(doc_id)
+            else:
+                self._overwritten.append(row)
+        self._overlay[doc_id] = data
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._overlay or self._row(doc_id) >= 0
+
+    def __len__(self) -> int:
+        return len(self._ids) + len(self._added)
+
+    def _encoded(self, field: str, op: str) -> bool:
+        return op in ('==', 'in') and field in self._encoders
+
+    def _mask(self, field: str, op: str, value: Any) -> np.ndarray:
+        values, encode = self._encoders[field]
+        if op == 'in':
+            return np.isin(values, [encode(item) for item in value])
+        return values == encode(value)
+
+    def items(self, filters: Optional[List] = None):
+        """Yield `(doc_id, data)` lazily, generated rows first, then added documents
+
+        Rows failing an encodable `==` or `in` filter in `filters` are skipped
+        without being built; callers still check the yielded documents against all
+        filters.
+        """
+        rows: Any = range(len(self._ids))
+        for field, op, value in filters or []:
+            if self._encoded(field, op):
+                mask = self._mask(field, op, value)
+                if self._overwritten:
+                    # Overwritten rows may have changed the field
+                    mask[self._overwritten] = True
+                rows = np.flatnonzero(mask) if isinstance(rows, range) else rows[mask[rows]]
+        for row in rows:
+            doc_id = self._ids[row].decode()
+            data = self._overlay.get(doc_id)
+            yield doc_id, data if data is not None else self._materialize(row)
+        for doc_id in list(self._added):
+            yield doc_id, self._overlay[doc_id]
+
+    def count(self, filters: List) -> Optional[int]:
+        """Number of documents matching `filters`, if they can be answered from the columns alone"""
+        if self._overlay or not all(self._encoded(field, op) for field, op, _ in filters):
+            return None
+        mask = np.ones(len(self._ids), dtype=bool)
+        for field, op, value in filters:
+            mask &= self._mask(field, op, value)
+        return int(np.count_nonzero(mask))
+
+
+class FakeDocumentSnapshot:
+    """Read-only view of a stored document"""
+
+    def __init__(self, reference: 'FakeDocumentReference', data: Optional[Dict]):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self) -> Optional[Dict]:
+        return dict(self._data) if self._data is not None else None
+
+    def get(self, field: str) -> Any:
+        return (self._data or {}).get(field)
+
+
+class FakeDocumentReference:
+    """Reference to a single document in a fake collection"""
+
+    def __init__(self, client: 'FakeFirestore', collection: str, doc_id: str):
+        self._client = client
+        self._collection = collection
+        self.id = doc_id
+
+    def get(self) -> FakeDocumentSnapshot:
+        self._client._round_trip()
+        self._client._count('reads')
+        data = self._client._collections.get(self._collection, {}).get(self.id)
+        return FakeDocumentSnapshot(self, data)
+
+    def update(self, data: Dict):
+        """Merge fields into an existing document; raises NotFound if it is missing"""
+        self._client._round_trip()
+        self._client._apply([('update', self, data)])
+
+    def set(self, data: Dict):
+        self._client._round_trip()
+        self._client._apply([('set', self, data)])
+
+
+DOCUMENT_ID = '__name__'
+# Aggregation queries are billed one read per this many matched index entries
+AGGREGATION_ENTRIES_PER_READ = 1000
+
+
+class FakeQuery:
+    """Filtered, ordered and paginated view over a fake collection
+
+    Like Firestore, results are ordered by the `order_by` fields with the
+    document ID as the final tie-break, documents missing an ordered field are
+    left out, `start_after` takes a snapshot or a `{field: value}` cursor over the
+    ordered fields, and `select` projects the returned documents to some fields.
+    """
+
+    def __init__(self, client: 'FakeFirestore', collection: str, filters: Optional[List] = None,
+                 fields: Optional[List[str]] = None, orders: Optional[List[Tuple[str, bool]]] = None,
+                 limit: Optional[int] = None, cursor: Optional[Dict] = None):
+        self._client = client
+        self._collection = collection
+        self._filters = filters or []
+        self._fields = fields
+        # (field, descending)
+        self._orders = orders or []
+        self._limit = limit
+        self._cursor = cursor
+
+    def _derive(self, **changes) -> 'FakeQuery':
+        options = {'filters': self._filters, 'fields': self._fields, 'orders': self._orders,
+                   'limit': self._limit, 'cursor': self._cursor, **changes}
+        return FakeQuery(self._client, self._collection, **options)
+
+    def where(self, field: str, op: str, value: Any) -> 'FakeQuery':
+        if op not in _OPERATORS:
+            raise ValueError(f"Unsupported operator: {op}")
+        return self._derive(filters=self._filters + [(field, op, value)])
+
+    def select(self, field_paths: List[str]) -> 'FakeQuery':
+        return self._derive(fields=list(field_paths))
+
+    def order_by(self, field_path: str, direction: str = 'ASCENDING') -> 'FakeQuery':
+        if direction not in ('ASCENDING', 'DESCENDING'):
+            raise ValueError(f"Unsupported direction: {direction}")
+        return self._derive(orders=self._orders + [(field_path, direction == 'DESCENDING')])
+
+    def limit(self, count: int) -> 'FakeQuery':
+        return self._derive(limit=count)
+
+    def start_after(self, document_fields: Any) -> 'FakeQuery':
+        if isinstance(document_fields, FakeDocumentSnapshot):
+            snapshot = document_fields
+            document_fields = {DOCUMENT_ID: snapshot.id}
+            for field, _ in self._orders:
+                if field != DOCUMENT_ID:
+                    document_fields[field] = snapshot._data[field]
+        return self._derive(cursor=dict(document_fields))
+
+    def _sort_key(self, doc_id: str, data: Dict) -> Optional[List]:
+        """Values of the ordered fields, or None if the document lacks one"""
+        key = []
+        for field, _ in self._orders:
+            if field == DOCUMENT_ID:
+                key.append(doc_id)
+            elif field in data:
+                key.append(_comparable(data[field]))
+            else:
+                return None
+        return key
+
+    def _ordered(self, items):
+        """Apply ordering, the `start_after` cursor and the limit to `(doc_id, data)` pairs"""
+        orders = self._orders
+        if all(field != DOCUMENT_ID for field, _ in orders):
+            orders = orders + [(DOCUMENT_ID, orders[-1][1] if orders else False)]
+            query = self._derive(orders=orders)
+        else:
+            query = self
+        cursor = None
+        if query._cursor is not None:
+            cursor = [_comparable(query._cursor[field]) for field, _ in orders if field in query._cursor]
+
+        def after_cursor(key: List) -> bool:
+            for value, bound, (_, descending) in zip(key, cursor, orders):
+                if value != bound:
+                    return (value < bound) if descending else (value > bound)
+            return False
+
+        keyed = []
+        for doc_id, data in items:
+            key = query._sort_key(doc_id, data)
+            if key is not None and (cursor is None or after_cursor(key)):
+                keyed.append((key, doc_id, data))
+        if orders == [(DOCUMENT_ID, False)] and self._limit is not None:
+            # Paging through a collection by ID only needs the next `limit` IDs
+            return [(doc_id, data) for _, doc_id, data in
+                    heapq.nsmallest(self._limit, keyed, key=lambda entry: entry[1])]
+        for position in reversed(range(len(orders))):
+            keyed.sort(key=lambda entry: entry[0][position], reverse=orders[position][1])
+        if self._limit is not None:
+            keyed = keyed[:self._limit]
+        return [(doc_id, data) for _, doc_id, data in keyed]
+
+    def _matches(self, data: Dict) -> bool:
+        for field, op, value in self._filters:
+            if field not in data:
+                return False
+            if not _OPERATORS[op](_comparable(data[field]), _comparable(value)):
+                return False
+        return True
+
+    def _items(self):
+        """Matching `(doc_id, data)` pairs in query order"""
+        documents = self._client._collections.get(self._collection, {})
+        # Plain dicts are snapshotted; columnar collections materialize rows lazily
+        if isinstance(documents, ColumnarDocuments):
+            items = documents.items(self._filters)
+        else:
+            items = list(documents.items())
+        items = ((doc_id, data) for doc_id, data in items if self._matches(data))
+        if self._orders or self._cursor is not None or self._limit is not None:
+            items = self._ordered(items)
+        return items
+
+    def _count_matches(self) -> int:
+        documents = self._client._collections.get(self._collection, {})
+        if (isinstance(documents, ColumnarDocuments) and not self._orders
+                and self._cursor is None and self._limit is None):
+            count = documents.count(self._filters)
+            if count is not None:
+                return count
+        return sum(1 for _ in self._items())
+
+    def count(self, alias: Optional[str] = None) -> 'FakeAggregationQuery':
+        return FakeAggregationQuery(self, alias or 'field_1')
+
+    def stream(self):
+        """Yield matching documents, billing one read per document (minimum one per query)"""
+        self._client._round_trip()
+        self._client._count('queries')
+        returned = 0
+        for doc_id, data in self._items():
+            returned += 1
+            self._client._count('reads')
+            if self._fields is not None:
+                data = {field: data[field] for field in self._fields if field in data}
+            yield FakeDocumentSnapshot(FakeDocumentReference(self._client, self._collection, doc_id), data)
+        if returned == 0:
+            self._client._count('reads')
+
+    def get(self) -> List[FakeDocumentSnapshot]:
+        return list(self.stream())
+
+
+class FakeAggregationResult:
+    """One value of an aggregation query result"""
+
+    def __init__(self, alias: str, value: Any):
+        self.alias = alias
+        self.value = value
+
+
+class FakeAggregationQuery:
+    """`count()` of a query's matches, computed server-side
+
+    Like Firestore, no documents are returned and the query is billed one read
+    per `AGGREGATION_ENTRIES_PER_READ` index entries it matches (minimum one).
+    """
+
+    def __init__(self, query: FakeQuery, alias: str):
+        self._query = query
+        self._alias = alias
+
+    def get(self) -> List[List[FakeAggregationResult]]:
+        client = self._query._client
+        client._round_trip()
+        client._count('queries')
+        count = self._query._count_matches()
+        client._count('reads', max(1, -(-count // AGGREGATION_ENTRIES_PER_READ)))
+        return [[FakeAggregationResult(self._alias, count)]]
+
+
+class FakeCollection(FakeQuery):
+    """Collection reference; an unfiltered query plus document access"""
+
+    def document(self, doc_id: str) -> FakeDocumentReference:
+        return FakeDocumentReference(self._client, self._collection, doc_id)
+
+
+class FakeWriteBatch:
+    """Atomic batch of writes applied on commit"""
+
+    def __init__(self, client: 'FakeFirestore'):
+        self._client = client
+        self._writes: List = []
+
+    def update(self, reference: FakeDocumentReference, data: Dict):
+        self._writes.append(('update', reference, data))
+
+    def set(self, reference: FakeDocumentReference, data: Dict):
+        self._writes.append(('set', reference, data))
+
+    def commit(self):
+        if len(self._writes) > 500:
+            raise ValueError("A batch may contain at most 500 writes")
+        self._client._round_trip()
+        self._client._apply(self._writes)
+
+
+class FakeFirestore:
+    """In-memory Firestore client holding collections as nested dicts
+
+    `latency` seconds are slept on every round trip (query or document get),
+    and a `transient_error_rate` fraction of round trips raise
+    `ServiceUnavailable` to exercise retry paths.
+    """
+
+    def __init__(self, latency: float = 0.0, transient_error_rate: float = 0.0, seed: Optional[int] = None):
+        self._collections: Dict[str, Dict[str, Dict]] = {}
+        self.latency = latency
+        self.transient_error_rate = transient_error_rate
+        self.stats = {'reads': 0, 'queries': 0, 'writes': 0}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _count(self, stat: str, amount: int = 1):
+        with self._lock:
+            self.stats[stat] += amount
+
+    def _round_trip(self):
+        if self.latency:
+            time.sleep(self.latency)
+        if self.transient_error_rate:
+            with self._lock:
+                failed = self._random.random() < self.transient_error_rate
+            if failed:
+                raise ServiceUnavailable("503 The service is currently unavailable")
+
+    def collection(self, name: str) -> FakeCollection:
+        return FakeCollection(self, name)
+
+    def batch(self) -> FakeWriteBatch:
+        return FakeWriteBatch(self)
+
+    def _apply(self, writes: List):
+        """Apply writes all-or-nothing, like a Firestore commit"""
+        with self._lock:
+            for op, reference, _ in writes:
+                if op == 'update' and reference.id not in self._collections.get(reference._collection, {}):
+                    raise NotFound(f"404 No document to update: {reference._collection}/{reference.id}")
+            for op, reference, data in writes:
+                documents = self._collections.setdefault(reference._collection, {})
+                if op == 'update':
+                    documents[reference.id] = {**documents[reference.id], **data}
+                else:
+                    documents[reference.id] = dict(data)
+            self.stats['writes'] += len(writes)
+
+    def add_document(self, collection: str, doc_id: str, data: Dict):
+        """Store a document directly, bypassing the write counters"""
+        self._collections.setdefault(collection, {})[doc_id] = dict(data)
+
+    def add_columnar(self, collection: str, doc_ids: np.ndarray, columns: Dict[str, Tuple]):
+        """Replace a collection with generated columns (see `ColumnarDocuments`)"""
+        self._collections[collection] = ColumnarDocuments(doc_ids, columns)
+
+    def reset_stats(self):
+        self.stats = {'reads': 0, 'queries': 0, 'writes': 0}
+
+
+def populate_synthetic(db: FakeFirestore, n_businesses: int, invoices_per_business: int = 20,
+                       seed: int = 42, start: datetime = datetime(2024, 1, 1), days: int = 365):
+    """Fill `businesses` and `invoices` with a reproducible synthetic population"""
+    rng = random.Random(seed)
+    industries = ['Technology', 'Retail', 'Food & Beverage', 'Manufacturing', 'Services']
+    statuses = ['paid', 'paid', 'paid', 'sent', 'overdue', 'draft']
+    for b in range(n_businesses):
+        business_id = f'BIZ{b:05d}'
+        db.add_document('businesses', business_id, {
+            'businessName': f'Business {b + 1}',
+            'industry': rng.choice(industries),
+            'creditScore': rng.randint(300, 900),
+        })
+        customers = [f'customer{c}@{business_id.lower()}.my' for c in range(rng.randint(1, 15))]
+        for i in range(rng.randint(0, invoices_per_business * 2)):
+            created = start + timedelta(days=rng.randint(0, days - 1))
+            db.add_document('invoices', f'{business_id}-INV{i:05d}', {
+                'businessId': business_id,
+                'createdAt': FakeTimestamp(created),
+                'total': round(rng.uniform(50, 5000), 2),
+                'customerEmail': rng.choice(customers),
+                'status': rng.choice(statuses),
+                'dueDate': created + timedelta(days=rng.randint(0, 40)),
+            })
+
+
+DEFAULT_STATUS_MIX = {'paid': 0.62, 'sent': 0.16, 'overdue': 0.14, 'draft': 0.08}
+
+
+def populate_tenant(db: FakeFirestore, n_businesses: int, invoices_per_business: int = 50,
+                    seed: int = 42, repeat_customer_rate: float = 0.7,
+                    status_mix: Optional[Dict[str, float]] = None,
+                    start: Optional[datetime] = None, days: int = 365) -> int:
+    """Fill `businesses` and `invoices` with a large synthetic tenant; returns the invoice count
+
+    Invoice volume per business is heavy-tailed (most businesses are small, a few
+    are large) around a mean of `invoices_per_business`. Roughly a
+    `repeat_customer_rate` fraction of each business's invoices go to customers it
+    has invoiced before, skewed towards a few regulars. Each business draws its own
+    payment status mix around `status_mix`. Invoices span the `days` before now
+    unless `start` is given, and are stored columnar, so ~10M invoices fit in a few
+    hundred MB.
+    """
+    rng = np.random.default_rng(seed)
+    start = start or datetime.now().replace(microsecond=0) - timedelta(days=days)
+    status_mix = status_mix or DEFAULT_STATUS_MIX
+    statuses = list(status_mix)
+    industries = ['Technology', 'Retail', 'Food & Beverage', 'Manufacturing', 'Services']
+
+    business_ids = np.array([f'BIZ{b:05d}' for b in range(n_businesses)], dtype=object)
+    business_index = {business_id: b for b, business_id in enumerate(business_ids)}
+    for b, business_id in enumerate(business_ids):
+        db.add_document('businesses', business_id, {
+            'businessName': f'Business {b + 1}',
+            'industry': industries[b % len(industries)],
+            'creditScore': int(rng.integers(300, 901)),
+        })
+
+    volume = rng.lognormal(0.0, 1.0, n_businesses)
+    counts = rng.poisson(volume / volume.mean() * invoices_per_business)
+    n_invoices = int(counts.sum())
+    business = np.repeat(np.arange(n_businesses, dtype=np.int32), counts)
+    position = np.arange(n_invoices) - np.repeat(np.cumsum(counts) - counts, counts)
+
+    # The first `pool` invoices of a business each bring a new customer; the rest
+    # pick from that pool, favouring low (regular) customer numbers
+    pool = np.maximum(1, np.round(counts * (1 - repeat_customer_rate))).astype(np.int64)[business]
+    repeat = np.floor(pool * rng.random(n_invoices) ** 2).astype(np.int64)
+    customer = np.where(position < pool, position, repeat)
+
+    # Per-business status mix drawn around the overall mix, then sampled per invoice
+    mix = rng.dirichlet(np.array([status_mix[s] for s in statuses]) * 20, n_businesses)
+    u = rng.random(n_invoices)
+    status = np.zeros(n_invoices, dtype=np.uint8)
+    cumulative = np.zeros(n_invoices)
+    for k in range(len(statuses) - 1):
+        cumulative += mix[business, k]
+        status += (u > cumulative).astype(np.uint8)
+
+    created = rng.integers(0, days * 24 * 3600, n_invoices)
+    due = created + rng.integers(0, 40 * 24 * 3600, n_invoices)
+    scale = rng.lognormal(6.0, 1.0, n_businesses)
+    total = np.round(rng.lognormal(np.log(scale)[business], 0.8), 2)
+
+    doc_ids = np.char.add(np.char.add(np.char.mod('BIZ%05d', business), '-INV'), np.char.mod('%05d', position))
+    stride = 1 << 24
+    db.add_columnar('invoices', doc_ids.astype(np.bytes_), {
+        'businessId': (business, lambda b: business_ids[b], lambda business_id: business_index.get(business_id, -1)),
+        'createdAt': (created, lambda s: FakeTimestamp(start + timedelta(seconds=int(s)))),
+        'total': (total, float),
+        'customerEmail': (business.astype(np.int64) * stride + customer,
+                          lambda c: f'customer{c % stride}@{business_ids[c // stride].lower()}.my'),
+        'status': (status, lambda k: statuses[k],
+                   lambda value: statuses.index(value) if value in statuses else len(statuses)),
+        'dueDate': (due, lambda s: start + timedelta(seconds=int(s))),
+    })
+    return n_invoices
@@ -17,36 +17,1273 @@ Requirements:
 
 import pandas as pd
 import numpy as np
+import argparse
+import cProfile
+import functools
+import hashlib
+import importlib.util
 import json
 import os
-from datetime import datetime, timedelta
-from typing import Dict, List, Any, Optional
+import random
+import shutil
+import sys
+import threading
+import time
+import zlib
+from array import array
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from contextlib import contextmanager, redirect_stderr, redirect_stdout
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Any, Iterator, Optional, Tuple, Union
+
+# Heavy optional libraries are only checked for here and imported in the code
+# paths that use them, so scoring runs don't pay for training/Firebase imports.
 
 # Firebase Admin SDK (install: pip install firebase-admin)
-try:
-    import firebase_admin
-    from firebase_admin import credentials, firestore
-    FIREBASE_AVAILABLE = True
-except ImportError:
+FIREBASE_AVAILABLE = importlib.util.find_spec('firebase_admin') is not None
+if not FIREBASE_AVAILABLE:
     print("Firebase Admin SDK not available. Install with: pip install firebase-admin")
-    FIREBASE_AVAILABLE = False
 
 # ML libraries
-try:
-    import xgboost as xgb
-    from sklearn.model_selection import train_test_split
-    from sklearn.metrics import classification_report, confusion_matrix
-    ML_AVAILABLE = True
-except ImportError:
+ML_AVAILABLE = all(importlib.util.find_spec(name) is not None for name in ('xgboost', 'sklearn'))
+if not ML_AVAILABLE:
     print("ML libraries not available. Install with: pip install scikit-learn xgboost")
-    ML_AVAILABLE = False
+
+# Columnar storage (optional, install: pip install pyarrow)
+PARQUET_AVAILABLE = importlib.util.find_spec('pyarrow') is not None
+
+# Features used by the XGBoost model, in model input order
+MODEL_FEATURES = ['customer_number', 'customer_order', 'amount', 'days_since_last_transaction', 'customer_stickiness']
+
+# Every input of the hard filters and the score; a business is rescored when one changes
+SCORING_FEATURES = MODEL_FEATURES + ['transaction_count', 'completion_rate', 'clearance_days']
+
+# Prediction columns and the Firestore fields they are written to
+PREDICTION_FIELDS = {
+    'predicted_credit_score': 'creditScore',
+    'predicted_category': 'creditCategory',
+    'filter_result': 'filterResult',
+    'feature_hash': 'aiFeatureHash',
+    'model_version': 'aiModelVersion',
+    'top_reasons': 'aiReasons',
+}
+
+# Prediction columns used to skip rescoring and unchanged write-backs; predictions files
+# only carry them with `--bookkeeping-columns`, the score cache always does
+BOOKKEEPING_COLUMNS = ['feature_hash', 'model_version', 'top_reasons']
+
+# Arrow types of predictions file columns, fixed so they don't depend on a chunk's values
+PREDICTION_COLUMN_TYPES = {
+    'business_id': 'string',
+    'business_name': 'string',
+    'industry': 'string',
+    **{feature: 'float64' for feature in SCORING_FEATURES},
+    'predicted_credit_score': 'float64',
+    'predicted_category': 'string',
+    'filter_result': 'string',
+    'feature_hash': 'uint64',
+    'model_version': 'string',
+    'top_reasons': 'string',
+    'run_id': 'string',
+}
+
+# Terms of the formula score (see `credit_score_terms_batch`) and their maximum points
+SCORE_TERM_MAX = {'customer': 150.0, 'order': 100.0, 'amount': 200.0, 'recency': 100.0, 'stickiness': 100.0}
+
+# Business profile fields read by the pipeline; profile scans fetch only these
+PROFILE_FIELDS = ['businessName', 'industry', 'creditScore']
+
+# Profiles per page of a `businesses` scan
+PROFILE_PAGE_SIZE = 500
+
+# Predictions file formats; Parquet and Arrow IPC need pyarrow
+OUTPUT_FORMATS = ['csv', 'parquet', 'arrow']
+
+# Run metrics file of `--metrics-json` given without a path, and of each shard worker
+RUN_METRICS_FILE = 'ai_run_metrics.json'
+
+# Saved model artifacts inside a model directory
+MODEL_FILE = 'model.ubj'
+MANIFEST_FILE = 'manifest.json'
+
+# Model class index -> credit category
+CREDIT_CATEGORIES = np.array(['poor', 'at_risk', 'good', 'excellent'], dtype=object)
+
+# XGBoost parameters shared by all training paths
+XGB_BASE_PARAMS = {
+    'max_depth': 5,
+    'learning_rate': 0.1,
+    'objective': 'multi:softprob',
+    'eval_metric': 'mlogloss',
+    'num_class': 4,
+    'subsample': 0.8,
+    'colsample_bytree': 0.8,
+    'random_state': 42
+}
+
+# Candidates tried by `train_xgboost_search` unless a grid is given
+DEFAULT_PARAM_GRID = {
+    'max_depth': [3, 5, 7],
+    'learning_rate': [0.05, 0.1],
+    'min_child_weight': [1, 5],
+}
+
+# Epoch microseconds: the date unit of `TransactionColumns` (missing dates are `_NO_DATE`)
+_EPOCH = datetime(1970, 1, 1)
+_EPOCH_UTC = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSECONDS_PER_DAY = 86400 * 10 ** 6
+_NO_DATE = np.iinfo(np.int64).min
+
+# Error class names (google.api_core.exceptions and friends) worth retrying
+TRANSIENT_ERROR_NAMES = {
+    'ServiceUnavailable', 'DeadlineExceeded', 'InternalServerError',
+    'TooManyRequests', 'ResourceExhausted', 'Aborted', 'GatewayTimeout',
+}
+
+def is_transient_error(error: Exception) -> bool:
+    """Return True for errors where retrying the same request may succeed"""
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    return type(error).__name__ in TRANSIENT_ERROR_NAMES
+
+def call_with_retries(func, max_retries: int = 3, base_delay: float = 0.2, max_delay: float = 5.0):
+    """Call `func()`, retrying transient errors with exponential backoff and jitter"""
+    attempt = 0
+    while True:
+        try:
+            return func()
+        except Exception as e:
+            if attempt >= max_retries or not is_transient_error(e):
+                raise
+            delay = min(max_delay, base_delay * (2 ** attempt))
+            time.sleep(delay * random.uniform(0.5, 1.0))
+            attempt += 1
+
+def firestore_document_size(path: List[str], data: Dict) -> int:
+    """Storage size of a document by Firestore's rules, an estimate of the bytes read
+    
+    `path` alternates collection and document IDs. Strings count their UTF-8 length
+    plus one, numbers and timestamps 8, booleans and null 1; maps and arrays add
+    up their contents, and every document carries 32 bytes of overhead.
+    """
+    def value_size(value: Any) -> int:
+        if value is None or isinstance(value, bool):
+            return 1
+        if isinstance(value, str):
+            return len(value.encode('utf-8')) + 1
+        if isinstance(value, bytes):
+            return len(value)
+        if isinstance(value, dict):
+            return sum(value_size(key) + value_size(item) for key, item in value.items())
+        if isinstance(value, (list, tuple)):
+            return sum(value_size(item) for item in value)
+        return 8
+    
+    return 16 + sum(value_size(segment) for segment in path) + value_size(data) + 32
+
+class TokenBucket:
+    """Thread-safe token bucket limiting requests per second"""
+    
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def acquire(self, tokens: float = 1.0):
+        """Block until `tokens` are available, then consume them"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait_time = (tokens - self.tokens) / self.rate
+            time.sleep(wait_time)
+
+class BusinessFeatureState:
+    """Running invoice aggregates for one business, enough to derive its AI features
+    
+    Invoices are folded in with `add`. Which invoices have been counted is
+    tracked for the whole collection by `update_features_incrementally`.
+    """
+    
+    def __init__(self):
+        self.customer_orders: Dict[str, int] = {}
+        self.customer_amounts: Dict[str, float] = {}
+        self.amount = 0
+        self.latest_invoice_date: Optional[datetime] = None
+        self.paid_count = 0
+        self.delay_sum = 0
+        self.delay_count = 0
+    
+    @property
+    def transaction_count(self) -> int:
+        return sum(self.customer_orders.values())
+    
+    def add(self, transaction: Dict):
+        """Fold one transaction (as built by `_invoice_to_transaction`) into the aggregates"""
+        customer = transaction['customer_email']
+        self.customer_orders[customer] = self.customer_orders.get(customer, 0) + 1
+        self.customer_amounts[customer] = self.customer_amounts.get(customer, 0) + transaction['invoice_amount']
+        self.amount += transaction['invoice_amount']
+        
+        invoice_date = transaction['invoice_date']
+        if self.latest_invoice_date is None or invoice_date > self.latest_invoice_date:
+            self.latest_invoice_date = invoice_date
+        
+        if transaction['payment_status'] in ['paid', 'Paid']:
+            self.paid_count += 1
+            if isinstance(transaction['due_date'], datetime):
+                self.delay_sum += max(0, (transaction['due_date'] - invoice_date).days)
+                self.delay_count += 1
+    
+    def to_features(self, current_date: Optional[datetime] = None) -> Optional[Dict]:
+        """Derive the `calculate_ai_features_from_firebase` feature dict, or None if empty"""
+        total_transactions = self.transaction_count
+        if total_transactions == 0:
+            return None
+        
+        current_date = current_date or datetime.now()
+        customer_number = len(self.customer_orders)
+        return {
+            'customer_number': customer_number,
+            'customer_order': np.mean(list(self.customer_orders.values())),
+            'amount': self.amount,
+            'days_since_last_transaction': (current_date - self.latest_invoice_date).days,
+            'customer_stickiness': 1 - (customer_number / total_transactions),
+            'transaction_count': total_transactions,
+            'completion_rate': self.paid_count / total_transactions,
+            'clearance_days': self.delay_sum / self.delay_count if self.delay_count else 15
+        }
+    
+    def to_dict(self) -> Dict:
+        return {
+            'customer_orders': self.customer_orders,
+            'customer_amounts': self.customer_amounts,
+            'amount': self.amount,
+            'latest_invoice_date': self.latest_invoice_date.isoformat() if self.latest_invoice_date else None,
+            'paid_count': self.paid_count,
+            'delay_sum': self.delay_sum,
+            'delay_count': self.delay_count,
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'BusinessFeatureState':
+        state = cls()
+        state.customer_orders = dict(data['customer_orders'])
+        state.customer_amounts = dict(data['customer_amounts'])
+        state.amount = data['amount']
+        state.latest_invoice_date = (datetime.fromisoformat(data['latest_invoice_date'])
+                                     if data['latest_invoice_date'] else None)
+        state.paid_count = data['paid_count']
+        state.delay_sum = data['delay_sum']
+        state.delay_count = data['delay_count']
+        return state
+
+def _epoch_microseconds(value: datetime) -> int:
+    """Microseconds since the epoch; aware datetimes are taken in UTC"""
+    delta = value - (_EPOCH_UTC if value.tzinfo else _EPOCH)
+    return (delta.days * 86400 + delta.seconds) * 10 ** 6 + delta.microseconds
+
+class TransactionColumns:
+    """Invoices of one or more businesses as typed columns instead of transaction dicts
+    
+    A transaction dict from `_invoice_to_transaction` costs several hundred bytes
+    with its datetimes and strings. Here an invoice takes 33 bytes of arrays:
+    business IDs, customer emails and statuses are interned to int32/uint8 codes
+    (at most 256 statuses), dates are int64 epoch microseconds and amounts
+    float64. The time unit is exact, so day differences match the datetime
+    arithmetic of the dict version, and float64 keeps summed amounts identical.
+    
+    Invoices are appended with `add`; `calculate_ai_features_columns` computes
+    features from the arrays without building a frame.
+    """
+    
+    __slots__ = ('business_ids', 'customers', 'statuses', '_business_index', '_customer_index', '_status_index',
+                 'business_codes', 'customer_codes', 'status_codes', 'invoice_us', 'due_us', 'amounts')
+    
+    # Column name -> numpy dtype of its array.array
+    COLUMNS = {
+        'business_codes': np.int32, 'customer_codes': np.int32, 'status_codes': np.uint8,
+        'invoice_us': np.int64, 'due_us': np.int64, 'amounts': np.float64,
+    }
+    
+    def __init__(self):
+        self.business_ids: List[str] = []
+        self.customers: List[str] = []
+        self.statuses: List[str] = []
+        self._business_index: Dict[str, int] = {}
+        self._customer_index: Dict[str, int] = {}
+        self._status_index: Dict[str, int] = {}
+        for name, dtype in self.COLUMNS.items():
+            setattr(self, name, array(np.dtype(dtype).char))
+    
+    def __len__(self) -> int:
+        return len(self.amounts)
+    
+    @staticmethod
+    def _intern(value: Any, index: Dict[Any, int], values: List[Any]) -> int:
+        code = index.get(value)
+        if code is None:
+            code = index[value] = len(values)
+            values.append(value)
+        return code
+    
+    def add(self, business_id: str, invoice_date: datetime, amount: float, customer_email: str,
+            status: str, due_date: Any = None):
+        """Append one invoice; a `due_date` that is not a datetime is stored as missing"""
+        self.business_codes.append(self._intern(business_id, self._business_index, self.business_ids))
+        self.customer_codes.append(self._intern(customer_email, self._customer_index, self.customers))
+        self.status_codes.append(self._intern(status, self._status_index, self.statuses))
+        self.invoice_us.append(_epoch_microseconds(invoice_date))
+        self.due_us.append(_epoch_microseconds(due_date) if isinstance(due_date, datetime) else _NO_DATE)
+        self.amounts.append(amount)
+    
+    @classmethod
+    def from_transactions(cls, transactions: List[Dict]) -> 'TransactionColumns':
+        """Build from transaction dicts (as from `_invoice_to_transaction`)"""
+        columns = cls()
+        for t in transactions:
+            columns.add(t['business_id'], t['invoice_date'], t['invoice_amount'], t['customer_email'],
+                        t['payment_status'], t['due_date'])
+        return columns
+    
+    @classmethod
+    def from_frame(cls, transactions: pd.DataFrame) -> 'TransactionColumns':
+        """Build from a transactions frame (see `to_frame`, `transactions_to_frame`)"""
+        columns = cls()
+        for name, source, values, index in (
+                ('business_codes', 'business_id', columns.business_ids, columns._business_index),
+                ('customer_codes', 'customer_email', columns.customers, columns._customer_index),
+                ('status_codes', 'payment_status', columns.statuses, columns._status_index)):
+            codes, uniques = pd.factorize(transactions[source].to_numpy(dtype=object), use_na_sentinel=False)
+            values.extend(uniques.tolist())
+            index.update((value, code) for code, value in enumerate(values))
+            getattr(columns, name).frombytes(codes.astype(cls.COLUMNS[name]).tobytes())
+        for name, source in (('invoice_us', 'invoice_date'), ('due_us', 'due_date')):
+            dates = pd.to_datetime(transactions[source])
+            if dates.dt.tz is not None:
+                dates = dates.dt.tz_convert('UTC').dt.tz_localize(None)
+            getattr(columns, name).frombytes(dates.to_numpy(dtype='datetime64[us]').view(np.int64).tobytes())
+        columns.amounts.frombytes(transactions['invoice_amount'].to_numpy(dtype=np.float64).tobytes())
+        return columns
+    
+    def arrays(self) -> Dict[str, np.ndarray]:
+        """Zero-copy numpy views of the columns
+        
+        The container cannot grow while views are alive; drop them before `add`.
+        """
+        return {name: np.frombuffer(getattr(self, name), dtype=dtype) for name, dtype in self.COLUMNS.items()}
+    
+    def business_counts(self) -> Dict[str, int]:
+        """Number of invoices per business ID"""
+        counts = np.bincount(self.arrays()['business_codes'], minlength=len(self.business_ids))
+        return dict(zip(self.business_ids, counts.tolist()))
+    
+    def business_latest(self) -> Dict[str, int]:
+        """`invoice_us` of the newest invoice per business ID"""
+        columns = self.arrays()
+        latest = np.full(len(self.business_ids), np.iinfo(np.int64).min)
+        np.maximum.at(latest, columns['business_codes'], columns['invoice_us'])
+        return {business_id: value for business_id, value in zip(self.business_ids, latest.tolist())
+                if value != np.iinfo(np.int64).min}
+    
+    def split(self) -> Dict[str, 'TransactionColumns']:
+        """One container per business, keeping invoice order; customer and status tables are shared"""
+        columns = self.arrays()
+        order = np.argsort(columns['business_codes'], kind='stable')
+        bounds = np.searchsorted(columns['business_codes'][order], np.arange(len(self.business_ids) + 1))
+        sorted_columns = {name: values[order] for name, values in columns.items() if name != 'business_codes'}
+        parts = {}
+        for code, business_id in enumerate(self.business_ids):
+            start, end = bounds[code], bounds[code + 1]
+            part = TransactionColumns()
+            part.business_ids, part._business_index = [business_id], {business_id: 0}
+            part.customers, part._customer_index = self.customers, self._customer_index
+            part.statuses, part._status_index = self.statuses, self._status_index
+            part.business_codes.frombytes(bytes(4 * (end - start)))
+            for name, values in sorted_columns.items():
+                getattr(part, name).frombytes(values[start:end].tobytes())
+            parts[business_id] = part
+        return parts
+    
+    def to_frame(self) -> pd.DataFrame:
+        """The transactions frame of `transactions_to_frame` (dates naive, in UTC if they were aware)"""
+        columns = self.arrays()
+        return pd.DataFrame({
+            'business_id': np.array(self.business_ids, dtype=object)[columns['business_codes']],
+            'invoice_date': columns['invoice_us'].astype('datetime64[us]'),
+            'invoice_amount': columns['amounts'].copy(),
+            'customer_email': np.array(self.customers, dtype=object)[columns['customer_codes']],
+            'payment_status': np.array(self.statuses, dtype=object)[columns['status_codes']],
+            'due_date': columns['due_us'].astype('datetime64[us]'),
+        })
+    
+    def nbytes(self) -> int:
+        """Bytes held by the column arrays (not counting the interned strings)"""
+        return sum(column.itemsize * len(column) for column in (getattr(self, name) for name in self.COLUMNS))
+
+class QuantileSketch:
+    """Mergeable quantile sketch of a numeric column, exact up to `capacity` values
+    
+    Values are kept as they are until there are more than `capacity`; then the
+    sketch compacts like KLL: the lowest level is sorted and every other value is
+    promoted to the next level with twice the weight. With the default capacity,
+    rank error stays around 0.01% even at tens of millions of values. NaNs are
+    skipped, as in pandas.
+    """
+    
+    def __init__(self, capacity: int = 100000):
+        self.capacity = capacity
+        self.count = 0
+        self.levels: List[np.ndarray] = [np.empty(0)]
+        self._offset = 0
+    
+    @property
+    def exact(self) -> bool:
+        return len(self.levels) == 1
+    
+    def add(self, values: Any):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        self.count += len(values)
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+    
+    def merge(self, other: 'QuantileSketch') -> 'QuantileSketch':
+        self.count += other.count
+        for level, values in enumerate(other.levels):
+            if level == len(self.levels):
+                self.levels.append(np.empty(0))
+            self.levels[level] = np.concatenate([self.levels[level], values])
+        self._compress()
+        return self
+    
+    def _compress(self):
+        while sum(len(values) for values in self.levels) > self.capacity:
+            level = next(level for level, values in enumerate(self.levels) if len(values) >= 2)
+            values = np.sort(self.levels[level])
+            odd = values[-1:] if len(values) % 2 else values[:0]
+            pairs = values[:len(values) - len(odd)]
+            # Alternate which element of each pair survives so the errors cancel
+            self._offset ^= 1
+            if level + 1 == len(self.levels):
+                self.levels.append(np.empty(0))
+            self.levels[level] = odd
+            self.levels[level + 1] = np.concatenate([self.levels[level + 1], pairs[self._offset::2]])
+    
+    def _weighted(self) -> Tuple[np.ndarray, np.ndarray]:
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(values), 2.0 ** level) for level, values in enumerate(self.levels)])
+        order = np.argsort(values, kind='stable')
+        return values[order], weights[order]
+    
+    def quantile(self, q: float) -> float:
+        """The `q` quantile; matches `Series.quantile` (linear interpolation) while exact"""
+        if self.count == 0:
+            return float('nan')
+        if self.exact:
+            return float(np.quantile(self.levels[0], q))
+        values, weights = self._weighted()
+        cumulative = np.cumsum(weights)
+        return float(values[min(np.searchsorted(cumulative, q * cumulative[-1]), len(values) - 1)])
+    
+    def count_above(self, threshold: float) -> int:
+        """Number of values greater than `threshold` (estimated once compacted)"""
+        if self.exact:
+            return int((self.levels[0] > threshold).sum())
+        values, weights = self._weighted()
+        return int(round(weights[values > threshold].sum()))
+    
+    def to_dict(self) -> Dict:
+        return {'capacity': self.capacity, 'count': self.count, 'offset': self._offset,
+                'levels': [values.tolist() for values in self.levels]}
+    
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'QuantileSketch':
+        sketch = cls(data['capacity'])
+        sketch.count = data['count']
+        sketch._offset = data['offset']
+        sketch.levels = [np.array(values, dtype=np.float64) for values in data['levels']]
+        return sketch
+
+class ReportAccumulator:
+    """Everything `generate_report` prints, accumulated chunk by chunk and mergeable
+    
+    `update` folds in one predictions frame; `merge` combines accumulators of other
+    chunks or shards (`to_dict`/`from_dict` carry them through JSON). Counts, sums
+    and min/max are exact; medians come from `QuantileSketch`es and are exact up
+    to `sketch_capacity` businesses, so on data that fits in memory `render`
+    reproduces the whole-frame report. Counts are listed like `value_counts`:
+    most frequent first, ties in order of first appearance.
+    """
+    
+    def __init__(self, sketch_capacity: int = 100000):
+        self.rows = 0
+        self.filter_counts: Dict[str, int] = {}
+        self.category_counts: Optional[Dict[str, int]] = None
+        self.score_count = 0
+        self.score_sum = 0.0
+        self.score_min = float('nan')
+        self.score_max = float('nan')
+        self.scores: Optional[QuantileSketch] = None
+        self.amounts = QuantileSketch(sketch_capacity)
+        self.recently_active = 0
+        self.diverse_customers = 0
+        # industry -> {'rows', 'passed', 'score_sum'}
+        self.industries: Dict[str, Dict[str, float]] = {}
+        self.sketch_capacity = sketch_capacity
+    
+    @staticmethod
+    def _add_counts(counts: Dict[str, int], new_counts: Dict[str, int]):
+        for key, count in new_counts.items():
+            counts[key] = counts.get(key, 0) + int(count)
+    
+    def update(self, df: pd.DataFrame) -> 'ReportAccumulator':
+        """Fold one frame of `predict_credit_scores` output into the totals"""
+        if df.empty:
+            return self
+        self.rows += len(df)
+        self._add_counts(self.filter_counts, df['filter_result'].value_counts(sort=False))
+        if 'predicted_category' in df.columns:
+            self.category_counts = self.category_counts if self.category_counts is not None else {}
+            self._add_counts(self.category_counts, df['predicted_category'].value_counts(sort=False))
+        if 'predicted_credit_score' in df.columns:
+            scores = df['predicted_credit_score'].to_numpy(dtype=np.float64)
+            scores = scores[~np.isnan(scores)]
+            self.scores = self.scores or QuantileSketch(self.sketch_capacity)
+            self.scores.add(scores)
+            if len(scores):
+                self.score_count += len(scores)
+                self.score_sum += float(scores.sum())
+                self.score_min = float(np.fmin(self.score_min, scores.min()))
+                self.score_max = float(np.fmax(self.score_max, scores.max()))
+        self.amounts.add(df['amount'].to_numpy(dtype=np.float64))
+        self.recently_active += int((df['days_since_last_transaction'] <= 30).sum())
+        self.diverse_customers += int((df['customer_number'] >= 5).sum())
+        
+        if 'industry' in df.columns:
+            industries = df['industry'].astype(object).fillna('').astype(str).replace('', 'Unknown')
+            passed = df['filter_result'] == 'pass'
+            scores = (df['predicted_credit_score'] if 'predicted_credit_score' in df.columns
+                      else pd.Series(0.0, index=df.index))
+            grouped = pd.DataFrame({'rows': 1, 'passed': passed, 'score_sum': scores}).groupby(
+                industries.to_numpy(), sort=False).sum()
+            for industry, row in zip(grouped.index, grouped.itertuples(index=False)):
+                totals = self.industries.setdefault(industry, {'rows': 0, 'passed': 0, 'score_sum': 0.0})
+                totals['rows'] += int(row.rows)
+                totals['passed'] += int(row.passed)
+                totals['score_sum'] += float(row.score_sum)
+        return self
+    
+    def merge(self, other: 'ReportAccumulator') -> 'ReportAccumulator':
+        """Add another chunk's or shard's totals to this one"""
+        self.rows += other.rows
+        self._add_counts(self.filter_counts, other.filter_counts)
+        if other.category_counts is not None:
+            self.category_counts = self.category_counts if self.category_counts is not None else {}
+            self._add_counts(self.category_counts, other.category_counts)
+        if other.scores is not None:
+            self.scores = self.scores.merge(other.scores) if self.scores else other.scores
+        self.score_count += other.score_count
+        self.score_sum += other.score_sum
+        self.score_min = float(np.fmin(self.score_min, other.score_min))
+        self.score_max = float(np.fmax(self.score_max, other.score_max))
+        self.amounts.merge(other.amounts)
+        self.recently_active += other.recently_active
+        self.diverse_customers += other.diverse_customers
+        for industry, other_totals in other.industries.items():
+            totals = self.industries.setdefault(industry, {'rows': 0, 'passed': 0, 'score_sum': 0.0})
+            for key, value in other_totals.items():
+                totals[key] += value
+        return self
+    
+    def to_dict(self) -> Dict:
+        data = {key: value for key, value in vars(self).items() if key not in ('scores', 'amounts')}
+        data['scores'] = self.scores.to_dict() if self.scores else None
+        data['amounts'] = self.amounts.to_dict()
+        return data
+    
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'ReportAccumulator':
+        accumulator = cls(data['sketch_capacity'])
+        for key, value in data.items():
+            setattr(accumulator, key, value)
+        accumulator.scores = QuantileSketch.from_dict(data['scores']) if data['scores'] else None
+        accumulator.amounts = QuantileSketch.from_dict(data['amounts'])
+        return accumulator
+    
+    @staticmethod
+    def _ranked(counts: Dict[str, int]) -> List[Tuple[str, int]]:
+        # sorted() is stable, so ties keep their first-appearance order
+        return sorted(counts.items(), key=lambda item: -item[1])
+    
+    def render(self) -> str:
+        """The text report"""
+        report = []
+        report.append("🎯 PEPE AI CREDIT SCORING REPORT")
+        report.append("=" * 50)
+        report.append(f"Analysis Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        report.append(f"Total Businesses Analyzed: {self.rows}")
+        report.append("")
+        
+        # Hard filter results
+        report.append("📊 HARD FILTER RESULTS:")
+        for filter_type, count in self._ranked(self.filter_counts):
+            percentage = (count / self.rows) * 100
+            report.append(f"  {filter_type}: {count} ({percentage:.1f}%)")
+        report.append("")
+        
+        # Credit score distribution
+        if self.category_counts is not None:
+            report.append("💳 CREDIT CATEGORY DISTRIBUTION:")
+            for category, count in self._ranked(self.category_counts):
+                percentage = (count / self.rows) * 100
+                report.append(f"  {category}: {count} ({percentage:.1f}%)")
+            report.append("")
+        
+        # Score statistics
+        if self.scores is not None:
+            mean = self.score_sum / self.score_count if self.score_count else float('nan')
+            report.append("📈 CREDIT SCORE STATISTICS:")
+            report.append(f"  Average Score: {mean:.1f}")
+            report.append(f"  Median Score: {self.scores.quantile(0.5):.1f}")
+            report.append(f"  Min Score: {self.score_min:.1f}")
+            report.append(f"  Max Score: {self.score_max:.1f}")
+            report.append("")
+        
+        # Feature importance insights
+        if self.rows > 0:
+            report.append("🔍 BUSINESS INSIGHTS:")
+            high_amount = self.amounts.count_above(self.amounts.quantile(0.5))
+            report.append(f"  High-revenue businesses: {high_amount} ({high_amount/self.rows*100:.1f}%)")
+            report.append(f"  Recently active: {self.recently_active} ({self.recently_active/self.rows*100:.1f}%)")
+            report.append(f"  Diverse customer base (5+): {self.diverse_customers} "
+                          f"({self.diverse_customers/self.rows*100:.1f}%)")
+        
+        # Per-industry breakdown
+        if self.industries:
+            report.append("")
+            report.append("🏭 INDUSTRY BREAKDOWN:")
+            for industry, totals in sorted(self.industries.items(), key=lambda item: -item[1]['rows']):
+                rows = totals['rows']
+                report.append(f"  {industry}: {rows} businesses, {totals['passed']} passed "
+                              f"({totals['passed'] / rows * 100:.1f}%), avg score {totals['score_sum'] / rows:.1f}")
+        
+        return "\n".join(report)
+
+class ColumnarCache:
+    """On-disk cache of DataFrames with TTL expiry and size-bounded LRU eviction
+    
+    Entries are keyed by `(kind, source, key)`, e.g. `('transactions', 'firestore',
+    business_id)`, and stored as Parquet when pyarrow is available (pickle
+    otherwise, and for frames under `parquet_min_rows`, where Parquet's per-file
+    overhead dominates). An `index.json` in `cache_dir` tracks creation time, last access
+    and size of each entry. It is rewritten every `flush_every` changes and by
+    `flush`, which callers run once a batch of puts is done. Entries put after
+    the last save are lost in a crash; their files are overwritten when the same
+    keys are put again.
+    """
+    
+    def __init__(self, cache_dir: str, ttl_seconds: float = 24 * 3600, max_bytes: int = 1024 ** 3,
+                 flush_every: int = 256, parquet_min_rows: int = 1000):
+        self.cache_dir = cache_dir
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.flush_every = flush_every
+        self.parquet_min_rows = parquet_min_rows
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self.index_path = os.path.join(cache_dir, 'index.json')
+        # Least recently used first
+        self.index: Dict[str, Dict] = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r') as f:
+                index = json.load(f)
+            self.index = dict(sorted(index.items(), key=lambda item: item[1]['last_access']))
+        self.total_bytes = sum(entry['bytes'] for entry in self.index.values())
+        self._unsaved = 0
+    
+    def _entry_key(self, kind: str, source: str, key: str) -> str:
+        return f"{kind}/{source}/{key}"
+    
+    def _save_index(self):
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.index, f)
+        os.replace(tmp_path, self.index_path)
+        self._unsaved = 0
+    
+    def _changed(self):
+        """Count an index change, saving the index every `flush_every` changes"""
+        self._unsaved += 1
+        if self._unsaved >= self.flush_every:
+            self._save_index()
+    
+    def flush(self):
+        """Save the index if it has unsaved changes"""
+        with self.lock:
+            if self._unsaved:
+                self._save_index()
+    
+    def _remove(self, entry_key: str):
+        entry = self.index.pop(entry_key)
+        self.total_bytes -= entry['bytes']
+        try:
+            os.remove(os.path.join(self.cache_dir, entry['file']))
+        except FileNotFoundError:
+            pass
+    
+    def get(self, kind: str, source: str, key: str) -> Optional[pd.DataFrame]:
+        """Return the cached frame, or None if missing or expired"""
+        entry_key = self._entry_key(kind, source, key)
+        with self.lock:
+            entry = self.index.get(entry_key)
+            if entry and time.time() - entry['created_at'] > self.ttl_seconds:
+                self._remove(entry_key)
+                self._changed()
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            path = os.path.join(self.cache_dir, entry['file'])
+            try:
+                df = pd.read_parquet(path) if entry['format'] == 'parquet' else pd.read_pickle(path)
+            except (OSError, ValueError):
+                self._remove(entry_key)
+                self._changed()
+                self.misses += 1
+                return None
+            entry['last_access'] = time.time()
+            # Move to the most recently used end
+            self.index[entry_key] = self.index.pop(entry_key)
+            self._changed()
+            self.hits += 1
+            return df
+    
+    def put(self, kind: str, source: str, key: str, df: pd.DataFrame):
+        """Store a frame, evicting least recently used entries beyond `max_bytes`"""
+        entry_key = self._entry_key(kind, source, key)
+        digest = hashlib.sha1(entry_key.encode('utf-8')).hexdigest()
+        with self.lock:
+            if entry_key in self.index:
+                self._remove(entry_key)
+            file_format = 'pickle'
+            if PARQUET_AVAILABLE and len(df) >= self.parquet_min_rows:
+                import pyarrow
+                try:
+                    df.to_parquet(os.path.join(self.cache_dir, f"{digest}.parquet"), index=False)
+                    file_format = 'parquet'
+                except (ValueError, TypeError, pyarrow.ArrowException):
+                    pass  # e.g. nested or mixed-type object columns
+            file_name = f"{digest}.parquet" if file_format == 'parquet' else f"{digest}.pkl"
+            if file_format == 'pickle':
+                df.to_pickle(os.path.join(self.cache_dir, file_name))
+            
+            now = time.time()
+            entry = self.index[entry_key] = {
+                'file': file_name,
+                'format': file_format,
+                'created_at': now,
+                'last_access': now,
+                'bytes': os.path.getsize(os.path.join(self.cache_dir, file_name)),
+            }
+            self.total_bytes += entry['bytes']
+            
+            while self.total_bytes > self.max_bytes:
+                old_key = next(iter(self.index))
+                if old_key == entry_key:
+                    break
+                self._remove(old_key)
+                self.evictions += 1
+            self._changed()
+    
+    def invalidate(self, kind: Optional[str] = None, source: Optional[str] = None,
+                   key: Optional[str] = None) -> int:
+        """Drop every entry matching the given parts of the key; returns how many"""
+        with self.lock:
+            removed = 0
+            for entry_key in list(self.index):
+                entry_kind, entry_source, entry_id = entry_key.split('/', 2)
+                if ((kind is None or kind == entry_kind) and (source is None or source == entry_source)
+                        and (key is None or key == entry_id)):
+                    self._remove(entry_key)
+                    removed += 1
+            self._save_index()
+            return removed
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(self.index),
+            'bytes': self.total_bytes,
+        }
+
+def _hash_hex(feature_hash: Any) -> Optional[str]:
+    """A uint64 `feature_hash` as the 16-digit hex string stored on Firestore profiles"""
+    return None if pd.isna(feature_hash) else f'{int(feature_hash):016x}'
+
+def _arrow_schema(schema: Any) -> Any:
+    """Chunk-independent version of an inferred predictions schema
+    
+    Known columns get their `PREDICTION_COLUMN_TYPES`; other strings (including
+    all-null and dictionary columns) become `string` and integers `int64`.
+    """
+    import pyarrow
+    import pyarrow.types as types
+    fields = []
+    for field in schema:
+        if field.name in PREDICTION_COLUMN_TYPES:
+            arrow_type = pyarrow.type_for_alias(PREDICTION_COLUMN_TYPES[field.name])
+        elif (types.is_null(field.type) or types.is_string(field.type) or types.is_large_string(field.type)
+              or types.is_dictionary(field.type)):
+            arrow_type = pyarrow.string()
+        elif types.is_integer(field.type):
+            arrow_type = pyarrow.int64()
+        else:
+            arrow_type = field.type
+        fields.append(pyarrow.field(field.name, arrow_type))
+    return pyarrow.schema(fields)
+
+def _arrow_table(df: pd.DataFrame) -> Any:
+    """Predictions frame as an Arrow table with a chunk-independent schema (see `_arrow_schema`)"""
+    import pyarrow
+    table = pyarrow.Table.from_pandas(df.astype({c: object for c in df.select_dtypes('category').columns}),
+                                      preserve_index=False)
+    return table.cast(_arrow_schema(table.schema))
+
+class PredictionWriter:
+    """Writes prediction frames chunk by chunk to one CSV, Parquet or Arrow IPC file
+    
+    Parquet and Arrow files are zstd-compressed. Every chunk is normalized by
+    `_arrow_schema`, so a chunk whose optional columns happen to be all null
+    (e.g. no `top_reasons` because all its businesses were rejected) has the same
+    schema as the rest. Use as a context manager, or call `close`.
+    """
+    
+    def __init__(self, path: str, output_format: str = 'csv', compression: str = 'zstd'):
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format: {output_format}")
+        if output_format != 'csv' and not PARQUET_AVAILABLE:
+            raise ValueError(f"{output_format} output requires pyarrow. Install with: pip install pyarrow")
+        self.path = path
+        self.output_format = output_format
+        self.compression = compression
+        self.rows = 0
+        self._writer = None
+        self._schema = None
+    
+    def write(self, df: pd.DataFrame):
+        if self.output_format == 'csv':
+            df.to_csv(self.path, mode='w' if self.rows == 0 else 'a', header=self.rows == 0, index=False)
+            self.rows += len(df)
+            return
+        self.write_table(_arrow_table(df))
+    
+    def write_table(self, table: Any):
+        """Append an Arrow table (Parquet and Arrow formats only)"""
+        import pyarrow
+        import pyarrow.parquet as pq
+        table = table.cast(_arrow_schema(table.schema))
+        if self._writer is None:
+            self._schema = table.schema
+            if self.output_format == 'parquet':
+                self._writer = pq.ParquetWriter(self.path, self._schema, compression=self.compression)
+            else:
+                options = pyarrow.ipc.IpcWriteOptions(compression=self.compression)
+                self._writer = pyarrow.ipc.new_file(self.path, self._schema, options=options)
+        self._writer.write_table(table.select(self._schema.names).cast(self._schema))
+        self.rows += table.num_rows
+    
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+    
+    def __enter__(self) -> 'PredictionWriter':
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+
+def read_predictions(path: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """Read a predictions file written by `PredictionWriter`, picking the format by extension"""
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path, columns=columns)
+    if path.endswith('.arrow'):
+        return pd.read_feather(path, columns=columns)
+    return pd.read_csv(path, usecols=columns, dtype={'feature_hash': 'UInt64'})
+
+class ScoreHistory:
+    """Append-only dataset of every run's predictions, partitioned Hive-style
+    
+    A run's rows go to `run_date=YYYY-MM-DD/[industry=<name>/]part-<run_id>.<ext>`
+    under `root`, one file per partition, written chunk by chunk; reruns on the
+    same day add files rather than replace them. Partition values are stored in
+    the directory names only, so `read` skips whole partitions when filtering on
+    them and loads just the requested columns.
+    """
+    
+    def __init__(self, root: str, output_format: str = 'parquet', partition_by_industry: bool = False,
+                 run_id: Optional[str] = None, run_date: Optional[str] = None, shard: Optional[Tuple[int, int]] = None):
+        if output_format == 'csv':
+            raise ValueError("The score history is stored as parquet or arrow")
+        self.root = root
+        self.output_format = output_format
+        self.partition_by_industry = partition_by_industry
+        now = datetime.now()
+        self.run_id = run_id or now.strftime('%Y%m%dT%H%M%S')
+        self.run_date = run_date or now.strftime('%Y-%m-%d')
+        self.shard = shard
+        self._writers: Dict[str, PredictionWriter] = {}
+    
+    def _partitioning(self) -> Any:
+        import pyarrow
+        import pyarrow.dataset as ds
+        fields = [('run_date', pyarrow.string())]
+        if self.partition_by_industry:
+            fields.append(('industry', pyarrow.string()))
+        return ds.partitioning(pyarrow.schema(fields), flavor='hive')
+    
+    def write(self, predictions: pd.DataFrame):
+        """Append a chunk of this run's predictions"""
+        from urllib.parse import quote
+        predictions = predictions.assign(run_id=self.run_id)
+        if self.partition_by_industry:
+            industries = (predictions['industry'].astype(object).fillna('').astype(str).replace('', 'Unknown')
+                          if 'industry' in predictions.columns else pd.Series('Unknown', index=predictions.index))
+            parts = predictions.drop(columns=['industry'], errors='ignore').groupby(industries.to_numpy(), sort=False)
+            parts = [(os.path.join(f"run_date={self.run_date}", f"industry={quote(industry, safe='')}"), part)
+                     for industry, part in parts]
+        else:
+            parts = [(f"run_date={self.run_date}", predictions)]
+        for directory, part in parts:
+            writer = self._writers.get(directory)
+            if writer is None:
+                os.makedirs(os.path.join(self.root, directory), exist_ok=True)
+                file_name = shard_path(f"part-{self.run_id}.{self.output_format}", self.shard)
+                writer = self._writers[directory] = PredictionWriter(
+                    os.path.join(self.root, directory, file_name), self.output_format
+                )
+            writer.write(part)
+    
+    def close(self):
+        for writer in self._writers.values():
+            writer.close()
+        self._writers = {}
+    
+    def __enter__(self) -> 'ScoreHistory':
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    def read(self, columns: Optional[List[str]] = None, since: Optional[str] = None, until: Optional[str] = None,
+             industries: Optional[List[str]] = None) -> pd.DataFrame:
+        """Load history rows of runs dated `since`..`until` (inclusive, YYYY-MM-DD)"""
+        import pyarrow.dataset as ds
+        if not os.path.isdir(self.root):
+            return pd.DataFrame(columns=columns)
+        dataset = ds.dataset(self.root, format='ipc' if self.output_format == 'arrow' else 'parquet',
+                             partitioning=self._partitioning())
+        conditions = []
+        if since:
+            conditions.append(ds.field('run_date') >= since)
+        if until:
+            conditions.append(ds.field('run_date') <= until)
+        if industries:
+            conditions.append(ds.field('industry').isin(industries))
+        condition = functools.reduce(lambda a, b: a & b, conditions) if conditions else None
+        return dataset.to_table(columns=columns, filter=condition).to_pandas()
+
+class RunMetrics:
+    """Per-stage timings, memory, row counts and counters for one pipeline run
+    
+    Stages are aggregated by name over all calls: wall and process CPU seconds,
+    rows in/out and call count. A stage nested in another keeps its own entry
+    (its time is also part of the parent's); re-entering a stage that is already
+    running in the same thread is not counted twice. Peak RSS is taken when an
+    outermost stage ends, from the kernel high-water mark. The mark is reset once
+    when the run starts, where Linux allows it (`/proc/self/clear_refs`), so it is
+    the run's peak so far rather than the process's, and a stage's entry is the
+    largest of those at the end of its calls. Overhead is ~5µs per nested call and
+    ~10µs per outermost one, so it stays on in production.
+    
+    `profile_stage` runs the outermost calls of that stage under cProfile (in the
+    calling thread) and dumps the stats to `profile_path`.
+    """
+    
+    def __init__(self, profile_stage: Optional[str] = None, profile_path: str = 'pepe_profile.prof'):
+        self.started_at = datetime.now()
+        self.start = time.perf_counter()
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        self.counters: Dict[str, int] = {}
+        self.filter_counts: Dict[str, int] = {}
+        self.profile_stage = profile_stage
+        self.profile_path = profile_path
+        self.profiler: Optional[cProfile.Profile] = None
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.memory_scope = 'run' if self._reset_peak_rss() else 'process'
+    
+    def _reset_peak_rss(self) -> bool:
+        try:
+            with open('/proc/self/clear_refs', 'w') as f:
+                f.write('5')
+            return True
+        except OSError:
+            return False
+    
+    def _peak_rss_mb(self) -> Optional[float]:
+        # getrusage is ~1µs; on Linux it follows the clear_refs reset like VmHWM does
+        try:
+            import resource
+        except ImportError:
+            return None
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(maxrss / (1024 ** 2 if sys.platform == 'darwin' else 1024), 1)
+    
+    @contextmanager
+    def stage(self, name: str, rows_in: Optional[int] = None):
+        """Time a block as stage `name`; set `rows_out` on the yielded dict"""
+        active = getattr(self.local, 'active', None)
+        if active is None:
+            active = self.local.active = []
+        record: Dict[str, Any] = {'rows_out': None}
+        if name in active:
+            yield record
+            return
+        
+        outermost = not active
+        profiling = outermost and name == self.profile_stage
+        if profiling:
+            self.profiler = self.profiler or cProfile.Profile()
+            self.profiler.enable()
+        active.append(name)
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            yield record
+        finally:
+            wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+            active.pop()
+            if profiling:
+                self.profiler.disable()
+                self.profiler.dump_stats(self.profile_path)
+            peak_rss_mb = self._peak_rss_mb() if outermost else None
+            with self.lock:
+                entry = self.stages.setdefault(name, {
+                    'calls': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0,
+                    'rows_in': None, 'rows_out': None, 'peak_rss_mb': None,
+                })
+                entry['calls'] += 1
+                entry['wall_seconds'] += wall
+                entry['cpu_seconds'] += cpu
+                for field, value in (('rows_in', rows_in), ('rows_out', record['rows_out'])):
+                    if value is not None:
+                        entry[field] = (entry[field] or 0) + value
+                if peak_rss_mb is not None:
+                    entry['peak_rss_mb'] = max(entry['peak_rss_mb'] or 0.0, peak_rss_mb)
+    
+    def count(self, name: str, amount: int = 1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + int(amount)
+    
+    def count_filter_results(self, filter_results: Any):
+        """Add hard-filter outcomes (an array of `apply_hard_filters` results: 'pass', 'low_trust',
+        'circular_fake', 'non_compliant' or 'slow_settlement')"""
+        counts = pd.Series(filter_results).value_counts()
+        with self.lock:
+            for result, count in counts.items():
+                self.filter_counts[result] = self.filter_counts.get(result, 0) + int(count)
+    
+    def summary(self) -> Dict[str, Any]:
+        """JSON-serializable run summary"""
+        with self.lock:
+            stages = {
+                name: {**entry, 'wall_seconds': round(entry['wall_seconds'], 4),
+                       'cpu_seconds': round(entry['cpu_seconds'], 4)}
+                for name, entry in self.stages.items()
+            }
+            return {
+                'started_at': self.started_at.isoformat(),
+                'elapsed_seconds': round(time.perf_counter() - self.start, 3),
+                'memory_scope': self.memory_scope,
+                'stages': stages,
+                'counters': dict(self.counters),
+                'filter_counts': dict(self.filter_counts),
+            }
+    
+    def write_json(self, path: str):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.summary(), f, indent=2)
+        os.replace(tmp_path, path)
+    
+    def write_prometheus(self, path: str, prefix: str = 'pepe', summary: Optional[Dict[str, Any]] = None):
+        """Write the summary (or a given one, e.g. merged shards) in Prometheus text format
+        
+        The format is the one read by node_exporter's textfile collector.
+        """
+        summary = summary or self.summary()
+        lines = []
+        
+        def metric(name: str, help_text: str, samples: List[Tuple[str, Any]]):
+            samples = [(labels, value) for labels, value in samples if value is not None]
+            if not samples:
+                return
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} gauge")
+            for labels, value in samples:
+                lines.append(f"{prefix}_{name}{labels} {value}")
+        
+        stages = summary['stages'].items()
+        metric('stage_wall_seconds', 'Wall time spent in a pipeline stage in the last run',
+               [(f'{{stage="{name}"}}', entry['wall_seconds']) for name, entry in stages])
+        metric('stage_cpu_seconds', 'Process CPU time spent in a pipeline stage in the last run',
+               [(f'{{stage="{name}"}}', entry['cpu_seconds']) for name, entry in stages])
+        metric('stage_calls', 'Calls of a pipeline stage in the last run',
+               [(f'{{stage="{name}"}}', entry['calls']) for name, entry in stages])
+        metric('stage_rows_in', 'Rows into a pipeline stage in the last run',
+               [(f'{{stage="{name}"}}', entry['rows_in']) for name, entry in stages])
+        metric('stage_rows_out', 'Rows out of a pipeline stage in the last run',
+               [(f'{{stage="{name}"}}', entry['rows_out']) for name, entry in stages])
+        metric('stage_peak_rss_bytes', 'Peak resident memory during a pipeline stage in the last run',
+               [(f'{{stage="{name}"}}', int(entry['peak_rss_mb'] * 1024 ** 2))
+                for name, entry in stages if entry['peak_rss_mb'] is not None])
+        metric('operations', 'Firestore operations and other counted events in the last run',
+               [(f'{{name="{name}"}}', value) for name, value in summary['counters'].items()])
+        metric('filter_results', 'Hard filter outcomes of scored businesses in the last run',
+               [(f'{{result="{result}"}}', count) for result, count in summary['filter_counts'].items()])
+        metric('run_elapsed_seconds', 'Wall time of the last run', [('', summary['elapsed_seconds'])])
+        metric('run_timestamp_seconds', 'Start time of the last run',
+               [('', round(datetime.fromisoformat(summary['started_at']).timestamp(), 3))])
+        
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, path)
+
+def _row_count(value: Any) -> Optional[int]:
+    """Rows in a stage input/output: len() of frames, arrays, lists and transactions, 1 for a dict"""
+    if isinstance(value, dict):
+        return 1
+    if isinstance(value, (pd.DataFrame, pd.Series, np.ndarray, list, TransactionColumns)):
+        return len(value)
+    return None
+
+def instrumented(stage: str, rows_out=_row_count):
+    """Record calls of a `FirebaseAIIntegration` method as a `RunMetrics` stage
+    
+    Rows in are counted from the first positional argument, rows out from the
+    return value via `rows_out`.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.metrics.stage(stage, rows_in=_row_count(args[0]) if args else None) as record:
+                result = method(self, *args, **kwargs)
+                record['rows_out'] = rows_out(result)
+                return result
+        return wrapper
+    return decorator
+
+def _pin_worker_threads(nthread: int):
+    """Limit a worker process's OpenMP and BLAS pools to `nthread` threads
+    
+    Must run before xgboost/numpy start those pools in the process.
+    """
+    for name in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS'):
+        os.environ[name] = str(nthread)
+
+# Per-process state of cross-validation workers, set once by `_init_cv_worker`
+_CV_DATA: Dict[str, Any] = {}
+
+def _init_cv_worker(X: np.ndarray, y: np.ndarray, folds: List[Tuple[np.ndarray, np.ndarray]], nthread: int,
+                    pin_threads: bool = True):
+    """Keep the search data in a CV worker and pin its thread pools to its core budget"""
+    if pin_threads:
+        _pin_worker_threads(nthread)
+    _CV_DATA.update(X=X, y=y, folds=folds, nthread=nthread)
+
+def _run_cv_trial(params: Dict[str, Any], num_boost_round: int, early_stopping_rounds: int) -> Dict[str, Any]:
+    """Cross-validate one parameter set on the worker's data with hist/QuantileDMatrix"""
+    import xgboost as xgb
+    X, y, nthread = _CV_DATA['X'], _CV_DATA['y'], _CV_DATA['nthread']
+    start = time.perf_counter()
+    losses, iterations, fold_seconds = [], [], []
+    for train_index, valid_index in _CV_DATA['folds']:
+        fold_start = time.perf_counter()
+        dtrain = xgb.QuantileDMatrix(X[train_index], label=y[train_index], nthread=nthread)
+        dvalid = xgb.QuantileDMatrix(X[valid_index], label=y[valid_index], ref=dtrain, nthread=nthread)
+        booster = xgb.train(
+            {**XGB_BASE_PARAMS, **params, 'tree_method': 'hist', 'nthread': nthread},
+            dtrain,
+            num_boost_round=num_boost_round,
+            evals=[(dvalid, 'valid')],
+            early_stopping_rounds=early_stopping_rounds,
+            verbose_eval=False
+        )
+        losses.append(booster.best_score)
+        iterations.append(booster.best_iteration)
+        fold_seconds.append(round(time.perf_counter() - fold_start, 3))
+    return {
+        'params': params,
+        'mlogloss': float(np.mean(losses)),
+        'mlogloss_std': float(np.std(losses)),
+        'best_iteration': int(round(np.mean(iterations))),
+        'seconds': round(time.perf_counter() - start, 3),
+        'fold_seconds': fold_seconds,
+        'nthread': nthread,
+    }
+
+def shard_of(business_id: Any, shards: int) -> int:
+    """Partition of a business ID among `shards` workers
+    
+    CRC32 of the ID rather than `hash()`, so every process and machine agrees.
+    """
+    return zlib.crc32(str(business_id).encode('utf-8')) % shards
+
+def shard_path(path: str, shard: Optional[Tuple[int, int]]) -> str:
+    """`path` with a `.shard-{index}-of-{count}` suffix before its extension (unchanged if unsharded)"""
+    if shard is None:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.shard-{shard[0]}-of-{shard[1]}{ext}"
+
+def _aggregation_reads(count: int) -> int:
+    """Reads billed for an aggregation query matching `count` index entries"""
+    return max(1, -(-count // 1000))
 
 class FirebaseAIIntegration:
     """Integration class for Firebase and PepeAI model"""
     
-    def __init__(self, firebase_config_path: Optional[str] = None):
+    def __init__(self, firebase_config_path: Optional[str] = None, cache_dir: Optional[str] = None,
+                 cache_ttl_seconds: float = 24 * 3600, cache_max_bytes: int = 1024 ** 3,
+                 metrics: Optional[RunMetrics] = None, shard: Optional[Tuple[int, int]] = None,
+                 profile_page_size: int = PROFILE_PAGE_SIZE):
         self.db = None
         self.model = None
+        self.model_manifest: Optional[Dict[str, Any]] = None
+        self.fetch_stats: Dict[str, Any] = {}
+        # business_id -> invoice count seen by fetches, the `known_counts` of a later per-business fetch
+        self.invoice_counts: Dict[str, int] = {}
+        # business_id -> `invoice_us` of the newest invoice seen by fetches
+        self.latest_invoice_us: Dict[str, int] = {}
+        self.profile_page_size = profile_page_size
+        self.profile_scan_stats: Dict[str, int] = {}
+        self.metrics = metrics or RunMetrics()
+        # (index, count): only businesses with shard_of(id, count) == index are processed
+        self.shard = shard if shard and shard[1] > 1 else None
+        self.cache = ColumnarCache(cache_dir, cache_ttl_seconds, cache_max_bytes) if cache_dir else None
         
         if FIREBASE_AVAILABLE and firebase_config_path:
             self.initialize_firebase(firebase_config_path)
@@ -54,6 +1291,8 @@ class FirebaseAIIntegration:
     def initialize_firebase(self, config_path: str):
         """Initialize Firebase connection"""
         try:
+            import firebase_admin
+            from firebase_admin import credentials, firestore
             if not firebase_admin._apps:
                 cred = credentials.Certificate(config_path)
                 firebase_admin.initialize_app(cred)
@@ -62,99 +1301,825 @@ class FirebaseAIIntegration:
         except Exception as e:
             print(f"❌ Firebase initialization failed: {e}")
     
+    def in_shard(self, business_id: Any) -> bool:
+        """Whether this worker's shard owns `business_id`"""
+        return self.shard is None or shard_of(business_id, self.shard[1]) == self.shard[0]
+    
+    def shard_frame(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Rows of `df` whose `business_id` belongs to this worker's shard"""
+        if self.shard is None or df.empty:
+            return df
+        owned = np.fromiter((self.in_shard(business_id) for business_id in df['business_id']),
+                            dtype=bool, count=len(df))
+        return df.loc[owned].reset_index(drop=True)
+    
+    @instrumented('load')
     def load_sample_data_from_json(self, file_path: str) -> pd.DataFrame:
         """Load sample data from exported JSON file"""
         try:
+            if self.cache:
+                # Key on path, size and mtime so an edited export is reparsed
+                file_stat = os.stat(file_path)
+                cache_key = f"{os.path.abspath(file_path)}:{file_stat.st_size}:{file_stat.st_mtime_ns}"
+                cached = self.cache.get('json', 'file', cache_key)
+                if cached is not None:
+                    print(f"✅ Loaded {len(cached)} businesses from cache for {file_path}")
+                    return cached
+            
             with open(file_path, 'r') as f:
                 data = json.load(f)
             
             # Convert to DataFrame
             df = pd.DataFrame(data)
             print(f"✅ Loaded {len(df)} businesses from {file_path}")
+            if self.cache:
+                self.cache.put('json', 'file', cache_key, df)
+                self.cache.flush()
             return df
             
         except Exception as e:
             print(f"❌ Error loading JSON data: {e}")
             return pd.DataFrame()
     
-    def fetch_businesses_from_firebase(self) -> pd.DataFrame:
-        """Fetch business data from Firebase"""
+    def iter_json_records(self, file_path: str, read_size: int = 1 << 20) -> Iterator[Dict]:
+        """Yield records from a JSON array or NDJSON export without loading the whole file"""
+        decoder = json.JSONDecoder()
+        with open(file_path, 'r') as f:
+            buffer = f.read(read_size)
+            start = len(buffer) - len(buffer.lstrip())
+            if buffer[start:start + 1] != '[':
+                # NDJSON: one record per line
+                f.seek(0)
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+                return
+            
+            position = start + 1
+            while True:
+                # Skip separators between array elements
+                while True:
+                    while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                        position += 1
+                    if position < len(buffer):
+                        break
+                    chunk = f.read(read_size)
+                    if not chunk:
+                        raise ValueError(f"Unterminated JSON array in {file_path}")
+                    buffer, position = chunk, 0
+                if buffer[position] == ']':
+                    return
+                try:
+                    record, end = decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError:
+                    # Record spans the buffer boundary; read more and retry
+                    chunk = f.read(read_size)
+                    if not chunk:
+                        raise
+                    buffer, position = buffer[position:] + chunk, 0
+                    continue
+                yield record
+                position = end
+    
+    def iter_json_chunks(self, file_path: str, chunk_size: int = 50000,
+                         downcast_floats: bool = False) -> Iterator[pd.DataFrame]:
+        """Yield fixed-size DataFrame chunks of a large JSON/NDJSON export
+        
+        Integer columns are downcast to the smallest type that fits and repetitive
+        string columns become categoricals. Floats stay float64 unless `downcast_floats`,
+        since float32 features shift the formula scores slightly.
+        """
+        records = []
+        for record in self.iter_json_records(file_path):
+            records.append(record)
+            if len(records) >= chunk_size:
+                yield self._compact_frame(pd.DataFrame(records), downcast_floats)
+                records = []
+        if records:
+            yield self._compact_frame(pd.DataFrame(records), downcast_floats)
+    
+    def _compact_frame(self, df: pd.DataFrame, downcast_floats: bool = False) -> pd.DataFrame:
+        """Downcast numeric columns and convert string columns to categoricals"""
+        for column in df.columns:
+            values = df[column]
+            if pd.api.types.is_integer_dtype(values):
+                df[column] = pd.to_numeric(values, downcast='integer')
+            elif pd.api.types.is_float_dtype(values):
+                if downcast_floats:
+                    df[column] = pd.to_numeric(values, downcast='float')
+            elif isinstance(values.dtype, pd.CategoricalDtype):
+                continue
+            elif (pd.api.types.is_string_dtype(values) and values.nunique() <= len(values) // 2
+                  and values.dropna().map(type).eq(str).all()):
+                df[column] = values.astype('category')
+        return df
+    
+    @instrumented('score_stream', rows_out=lambda summary: summary['rows'])
+    def score_json_stream(self, file_path: str, output_path: str, chunk_size: int = 50000,
+                          output_format: str = 'csv', history: Optional[ScoreHistory] = None,
+                          top_reasons: int = 0, exact_reasons: bool = False,
+                          bookkeeping_columns: bool = False) -> Dict[str, Any]:
+        """Filter and score a JSON/NDJSON export chunk by chunk, appending to `output_path`
+        
+        Memory stays bounded by `chunk_size`, so exports larger than RAM can be
+        scored end to end. `output_format` is one of `OUTPUT_FORMATS`; each chunk
+        is also appended to `history` if given. Only with `bookkeeping_columns`
+        are the `BOOKKEEPING_COLUMNS` written, and each chunk explained by
+        `explain_predictions` for its `top_reasons`.
+        """
+        rows, chunks = 0, 0
+        report = ReportAccumulator()
+        with PredictionWriter(output_path, output_format) as writer:
+            for chunk in self.iter_json_chunks(file_path, chunk_size):
+                chunk = self.shard_frame(chunk)
+                if chunk.empty:
+                    continue
+                predictions = self.predict_credit_scores(chunk, with_hashes=bookkeeping_columns)
+                if not bookkeeping_columns:
+                    predictions = predictions.drop(columns='model_version')
+                elif top_reasons:
+                    predictions = self.explain_predictions(predictions, top_reasons, exact_reasons)
+                report.update(predictions)
+                writer.write(predictions)
+                if history is not None:
+                    history.write(predictions)
+                rows += len(predictions)
+                chunks += 1
+        
+        print(f"✅ Scored {rows} businesses from {file_path} in {chunks} chunks -> {output_path}")
+        return {'rows': rows, 'chunks': chunks, 'filter_counts': dict(report.filter_counts), 'report': report}
+    
+    @instrumented('fetch')
+    def fetch_businesses_from_firebase(self, bulk: bool = False, max_workers: Optional[int] = None,
+                                       checkpoint_path: Optional[str] = None,
+                                       known_counts: Optional[Dict[str, int]] = None) -> pd.DataFrame:
+        """Fetch business data from Firebase
+        
+        Per-business fetches with a `checkpoint_path` resume an interrupted run
+        after the last completed page of profiles. With `known_counts` (the
+        `invoice_counts` of a previous fetch), businesses that were below the
+        invoice minimum are counted before their invoices are downloaded (see
+        `_query_business_indexed`); the result is the same either way.
+        
+        Cached results are kept per fetch mode, with each business's newest
+        invoice time so `days_since_last_transaction` is recomputed when read.
+        """
+        mode = 'bulk' if bulk else 'indexed' if known_counts is not None else 'per_business'
+        cache_key = shard_path(f'all-{mode}', self.shard)
+        if self.cache:
+            cached = self.cache.get('features', self._cache_source(), cache_key)
+            if cached is not None and 'latest_invoice_us' in cached.columns:
+                print(f"✅ Loaded {len(cached)} businesses from cache")
+                latest_invoice_us = cached.pop('latest_invoice_us').to_numpy(dtype=np.int64)
+                cached['days_since_last_transaction'] = (
+                    (_epoch_microseconds(datetime.now()) - latest_invoice_us) // _MICROSECONDS_PER_DAY
+                )
+                return cached
+        
+        if bulk:
+            df = self.fetch_businesses_bulk()
+        elif max_workers:
+            df = self.fetch_businesses_concurrent(max_workers=max_workers, checkpoint_path=checkpoint_path,
+                                                  known_counts=known_counts)
+        else:
+            df = self._fetch_businesses_sequential(checkpoint_path=checkpoint_path, known_counts=known_counts)
+        
+        if self.cache:
+            if not df.empty:
+                latest_invoice_us = df['business_id'].map(self.latest_invoice_us).astype(np.int64)
+                self.cache.put('features', self._cache_source(), cache_key,
+                               df.assign(latest_invoice_us=latest_invoice_us))
+            self.cache.flush()
+        return df
+    
+    def _record_fetch_stats(self, stats: Dict[str, Any]):
+        """Keep the last fetch's Firestore costs and add them to the run counters"""
+        self.fetch_stats = stats
+        self.metrics.count('firestore_queries', stats['queries'])
+        self.metrics.count('firestore_reads', stats['reads'])
+    
+    def iter_business_profiles(self, db: Any, fields: Optional[List[str]] = None,
+                               start_after: Optional[str] = None, max_retries: int = 3) -> Iterator[List[Any]]:
+        """Yield the `businesses` collection in pages of `profile_page_size`, ordered by document ID
+        
+        Each page is one query projected to `fields` (default `PROFILE_FIELDS`) that
+        starts after the last ID of the previous page, or after `start_after`, so a
+        failed page is retried on its own. Pages, documents, billed reads and
+        estimated bytes go to `profile_scan_stats` and the run counters.
+        """
+        fields = PROFILE_FIELDS if fields is None else fields
+        query = db.collection('businesses').select(fields).order_by('__name__').limit(self.profile_page_size)
+        stats = self.profile_scan_stats = {'pages': 0, 'docs': 0, 'reads': 0, 'bytes': 0}
+        last_id = start_after
+        while True:
+            page_query = query.start_after({'__name__': last_id}) if last_id is not None else query
+            page = call_with_retries(page_query.get, max_retries=max_retries)
+            page_bytes = sum(firestore_document_size(['businesses', profile_doc.id], profile_doc.to_dict())
+                             for profile_doc in page)
+            stats['pages'] += 1
+            stats['docs'] += len(page)
+            stats['reads'] += max(len(page), 1)
+            stats['bytes'] += page_bytes
+            self.metrics.count('firestore_profile_docs', len(page))
+            self.metrics.count('firestore_profile_bytes', page_bytes)
+            if page:
+                yield page
+            if len(page) < self.profile_page_size:
+                return
+            last_id = page[-1].id
+    
+    def fetch_business_profiles(self, db: Any, fields: Optional[List[str]] = None) -> List[Any]:
+        """All business profiles, read page by page with `iter_business_profiles`"""
+        return [profile_doc for page in self.iter_business_profiles(db, fields) for profile_doc in page]
+    
+    def load_scan_checkpoint(self, checkpoint_path: str) -> Tuple[Optional[str], List[Dict], int, List[str]]:
+        """Resume point of an interrupted profile scan: `(last_id, rows, profiles_done, failed)`
+        
+        `failed` are IDs of businesses in checkpointed pages whose invoice queries
+        failed; they are fetched again on resume. Rows of a page that was being
+        appended when the run stopped are cut off. Without a checkpoint the scan
+        starts over and stale rows are discarded.
+        """
+        rows_path = f"{checkpoint_path}.rows"
+        if not os.path.exists(checkpoint_path):
+            if os.path.exists(rows_path):
+                os.remove(rows_path)
+            return None, [], 0, []
+        with open(checkpoint_path, 'r') as f:
+            checkpoint = json.load(f)
+        os.truncate(rows_path, checkpoint['rows_bytes'])
+        with open(rows_path, 'r') as f:
+            rows = [json.loads(line) for line in f]
+        return checkpoint['last_id'], rows, checkpoint['profiles'], checkpoint.get('failed', [])
+    
+    def save_scan_checkpoint(self, checkpoint_path: str, last_id: str, rows: List[Dict], profiles_done: int,
+                             failed: Optional[List[str]] = None):
+        """Append a finished page's rows, then atomically move the resume point past it
+        
+        `failed` lists every business up to `last_id` still missing because its
+        invoice query failed, so a resumed run retries them.
+        """
+        with open(f"{checkpoint_path}.rows", 'a') as f:
+            for row in rows:
+                f.write(json.dumps(row) + '\n')
+            rows_bytes = f.tell()
+        tmp_path = f"{checkpoint_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'last_id': last_id, 'profiles': profiles_done, 'rows_bytes': rows_bytes,
+                       'failed': failed or []}, f)
+        os.replace(tmp_path, checkpoint_path)
+    
+    def clear_scan_checkpoint(self, checkpoint_path: str):
+        """Remove a finished scan's checkpoint so the next run starts over"""
+        for path in (checkpoint_path, f"{checkpoint_path}.rows"):
+            if os.path.exists(path):
+                os.remove(path)
+    
+    def load_invoice_counts(self, counts_path: str) -> Optional[Dict[str, int]]:
+        """Invoice counts saved by `save_invoice_counts`, the `known_counts` of a fetch, or None without a file"""
+        if not os.path.exists(counts_path):
+            return None
+        with open(counts_path, 'r') as f:
+            return {business_id: int(count) for business_id, count in json.load(f).items()}
+    
+    def save_invoice_counts(self, counts_path: str, known_counts: Optional[Dict[str, int]] = None):
+        """Save `invoice_counts` for the next run's fetch to load with `load_invoice_counts`
+        
+        Counts in `known_counts` of businesses this run did not see (e.g. their
+        invoice queries failed) are kept.
+        """
+        counts = dict(known_counts or {})
+        counts.update(self.invoice_counts)
+        tmp_path = f"{counts_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(counts, f)
+        os.replace(tmp_path, counts_path)
+    
+    def _retry_failed_businesses(self, failed: List[str], fetch: Any,
+                                 stage_stats: Dict[str, Any]) -> Tuple[List[Dict], List[str], int, int]:
+        """Fetch the businesses a checkpointed run left out because their invoice queries failed
+        
+        `fetch(business_id)` returns `(stage, transactions, costs)` like
+        `fetch_business_indexed`. Each profile is read again by ID. Returns
+        `(rows, still_failed, queries, reads)`.
+        """
+        print(f"🔁 Retrying {len(failed)} businesses whose invoice queries failed")
+        rows, still_failed, queries, reads = [], [], 0, 0
+        for business_id in failed:
+            profile_doc = call_with_retries(self.db.collection('businesses').document(business_id).get)
+            reads += 1
+            stage, transactions, costs = fetch(business_id)
+            self._add_stage(stage_stats, business_id, stage, costs, transactions)
+            queries += costs['queries']
+            reads += costs['reads']
+            if stage == 'failed':
+                still_failed.append(business_id)
+            elif len(transactions) >= 5:  # Minimum transaction requirement
+                rows.append(self._build_business_row(business_id, profile_doc.to_dict() or {}, transactions))
+        return rows, still_failed, queries, reads
+    
+    def _finish_scan_checkpoint(self, checkpoint_path: Optional[str], failed: List[str]):
+        """Report businesses left out by failed queries; the checkpoint is kept until none are"""
+        if failed:
+            print(f"⚠️  {len(failed)} businesses left out after failed invoice queries"
+                  + (f"; rerun to retry them from {checkpoint_path}" if checkpoint_path else ""))
+        elif checkpoint_path:
+            self.clear_scan_checkpoint(checkpoint_path)
+    
+    def _profile_scan_summary(self, resumed_profiles: int = 0) -> Dict[str, int]:
+        """Fetch stats entries describing the last profile scan"""
+        stats = self.profile_scan_stats
+        summary = {'profile_pages': stats['pages'], 'profile_docs': stats['docs'], 'profile_bytes': stats['bytes']}
+        if resumed_profiles:
+            summary['resumed_profiles'] = resumed_profiles
+        return summary
+    
+    def _cache_source(self) -> str:
+        """Cache namespace for the connected database"""
+        return str(getattr(self.db, 'project', None) or 'firestore')
+    
+    @instrumented('fetch')
+    def _fetch_businesses_sequential(self, checkpoint_path: Optional[str] = None,
+                                     known_counts: Optional[Dict[str, int]] = None) -> pd.DataFrame:
+        """Fetch business data one business at a time"""
         if not self.db:
             print("❌ Firebase not initialized")
             return pd.DataFrame()
         
         try:
-            businesses = []
-            business_profiles = self.db.collection('businesses').get()
+            checkpoint_path = shard_path(checkpoint_path, self.shard) if checkpoint_path else None
+            last_id, businesses, resumed, failed = (self.load_scan_checkpoint(checkpoint_path) if checkpoint_path
+                                                    else (None, [], 0, []))
+            if resumed:
+                print(f"⏩ Resuming after {resumed} profiles (last {last_id})")
+            profiles_done, queries, reads = resumed, 0, 0
+            stage_stats = self._new_stage_stats()
             
-            for profile_doc in business_profiles:
-                business_id = profile_doc.id
-                profile_data = profile_doc.to_dict()
-                
-                # Fetch transactions for this business
-                transactions = self.fetch_business_transactions(business_id)
-                
-                if len(transactions) >= 5:  # Minimum transaction requirement
-                    # Calculate AI features
-                    ai_features = self.calculate_ai_features_from_firebase(transactions)
+            def fetch(business_id: str) -> Tuple[str, TransactionColumns, Dict[str, int]]:
+                return self.fetch_business_indexed(business_id, (known_counts or {}).get(business_id))
+            
+            if failed:
+                retried, failed, queries, reads = self._retry_failed_businesses(failed, fetch, stage_stats)
+                businesses.extend(retried)
+                self.save_scan_checkpoint(checkpoint_path, last_id, retried, resumed, failed)
+            
+            for page in self.iter_business_profiles(self.db, start_after=last_id):
+                page_rows = []
+                for profile_doc in page:
+                    if not self.in_shard(profile_doc.id):
+                        continue
+                    # Fetch transactions for this business
+                    stage, transactions, costs = fetch(profile_doc.id)
+                    self._add_stage(stage_stats, profile_doc.id, stage, costs, transactions)
+                    queries += costs['queries']
+                    reads += costs['reads']
                     
-                    business_data = {
-                        'business_id': business_id,
-                        'business_name': profile_data.get('businessName', ''),
-                        'industry': profile_data.get('industry', ''),
-                        'current_credit_score': profile_data.get('creditScore', 0),
-                        **ai_features
-                    }
-                    businesses.append(business_data)
+                    if stage == 'failed':
+                        failed.append(profile_doc.id)
+                    elif len(transactions) >= 5:  # Minimum transaction requirement
+                        page_rows.append(self._build_business_row(profile_doc.id, profile_doc.to_dict(), transactions))
+                businesses.extend(page_rows)
+                profiles_done += len(page)
+                if checkpoint_path:
+                    self.save_scan_checkpoint(checkpoint_path, page[-1].id, page_rows, profiles_done, failed)
             
+            scan = self.profile_scan_stats
+            self._record_fetch_stats({
+                'mode': 'per_business',
+                'queries': scan['pages'] + queries,
+                'reads': scan['reads'] + reads,
+                'failed_businesses': failed,
+                **self._profile_scan_summary(resumed),
+                **(self._indexed_summary(stage_stats, scan['reads'] + reads) if known_counts is not None else {}),
+            })
+            self._finish_scan_checkpoint(checkpoint_path, failed)
             df = pd.DataFrame(businesses)
-            print(f"✅ Fetched {len(df)} businesses from Firebase")
+            print(f"✅ Fetched {len(df)} businesses from Firebase "
+                  f"({scan['docs']} profiles / {scan['bytes']} bytes read)")
             return df
             
         except Exception as e:
             print(f"❌ Error fetching Firebase data: {e}")
             return pd.DataFrame()
     
-    def fetch_business_transactions(self, business_id: str) -> List[Dict]:
-        """Fetch transactions for a specific business"""
+    @instrumented('fetch')
+    def fetch_businesses_bulk(self, source: Optional[Any] = None,
+                              time_slices: Optional[List[Tuple[datetime, datetime]]] = None,
+                              vectorized: bool = True) -> pd.DataFrame:
+        """Fetch business data with one grouped scan of the invoices collection
+        
+        Instead of one `invoices.where('businessId', '==', ...)` query per business,
+        the invoices collection is streamed once (or once per `(start, end)` slice of
+        `createdAt`) into one `TransactionColumns` on the client. `source` may be any
+        Firestore-compatible client (e.g. `fake_firestore.FakeFirestore`); it defaults
+        to the initialized Firebase connection. With `vectorized`, features for all
+        businesses are computed in one pass by `calculate_ai_features_columns`.
+        """
+        db = source if source is not None else self.db
+        if not db:
+            print("❌ Firebase not initialized")
+            return pd.DataFrame()
+        
         try:
-            transactions = []
+            business_profiles, transactions, queries, reads = self.scan_invoices(db, time_slices)
+            counts = transactions.business_counts()
+            self.invoice_counts.update((profile_doc.id, counts.get(profile_doc.id, 0))
+                                       for profile_doc in business_profiles)
+            self.latest_invoice_us.update(transactions.business_latest())
             
-            # Get all invoices for this business
-            invoices = self.db.collection('invoices').where('businessId', '==', business_id).get()
+            # Minimum transaction requirement
+            eligible = [profile_doc for profile_doc in business_profiles if counts.get(profile_doc.id, 0) >= 5]
+            if vectorized:
+                profiles_df = pd.DataFrame(
+                    [self._business_profile_fields(profile_doc.id, profile_doc.to_dict()) for profile_doc in eligible],
+                    columns=['business_id', 'business_name', 'industry', 'current_credit_score']
+                )
+                features_df = self.calculate_ai_features_columns(transactions)
+                df = profiles_df.merge(features_df, left_on='business_id', right_index=True, how='left')
+            else:
+                by_business = transactions.split()
+                df = pd.DataFrame([
+                    self._build_business_row(profile_doc.id, profile_doc.to_dict(), by_business[profile_doc.id])
+                    for profile_doc in eligible
+                ])
             
-            for invoice_doc in invoices:
+            # What the per-business path would have cost: one query per business,
+            # each billed at least one read even when it matches nothing
+            scan = self.profile_scan_stats
+            per_business_queries = scan['pages'] + len(business_profiles)
+            per_business_reads = scan['reads'] + sum(
+                max(counts.get(profile_doc.id, 0), 1) for profile_doc in business_profiles
+            )
+            self._record_fetch_stats({
+                'mode': 'bulk',
+                'queries': queries,
+                'reads': reads,
+                'per_business_queries': per_business_queries,
+                'per_business_reads': per_business_reads,
+                **self._profile_scan_summary(),
+            })
+            
+            print(f"✅ Fetched {len(df)} businesses from Firebase "
+                  f"({queries} queries / {reads} reads vs "
+                  f"{per_business_queries} queries / {per_business_reads} reads per-business; "
+                  f"{scan['docs']} profiles / {scan['bytes']} bytes)")
+            return df
+            
+        except Exception as e:
+            print(f"❌ Error fetching Firebase data: {e}")
+            return pd.DataFrame()
+    
+    def scan_invoices(self, db: Any, time_slices: Optional[List[Tuple[datetime, datetime]]] = None
+                      ) -> Tuple[List[Any], TransactionColumns, int, int]:
+        """Read all business profiles and collect every invoice with a `businessId`
+        
+        Returns `(profile_docs, transactions, queries, reads)`. A sharded worker
+        still scans (and pays for) every invoice but keeps only its own.
+        """
+        business_profiles = self.fetch_business_profiles(db)
+        queries, reads = self.profile_scan_stats['pages'], self.profile_scan_stats['reads']
+        business_profiles = [profile_doc for profile_doc in business_profiles if self.in_shard(profile_doc.id)]
+        owned = {profile_doc.id for profile_doc in business_profiles} if self.shard else None
+        
+        transactions = TransactionColumns()
+        for query in self._invoice_scan_queries(db, time_slices):
+            queries += 1
+            scanned = 0
+            for invoice_doc in query.stream():
+                scanned += 1
                 invoice_data = invoice_doc.to_dict()
+                business_id = invoice_data.get('businessId')
+                if business_id is None or (owned is not None and business_id not in owned):
+                    continue
+                transactions.add(business_id, *self._invoice_fields(invoice_data))
+            reads += max(scanned, 1)
+        return business_profiles, transactions, queries, reads
+    
+    def _invoice_scan_queries(self, db: Any, time_slices: Optional[List[Tuple[datetime, datetime]]] = None):
+        """Yield the queries covering the invoices collection for a bulk scan"""
+        invoices = db.collection('invoices')
+        if not time_slices:
+            yield invoices
+            return
+        for start, end in time_slices:
+            yield invoices.where('createdAt', '>=', start).where('createdAt', '<', end)
+    
+    def _business_profile_fields(self, business_id: str, profile_data: Dict) -> Dict:
+        """Select the profile fields carried into the AI dataset"""
+        return {
+            'business_id': business_id,
+            'business_name': profile_data.get('businessName', ''),
+            'industry': profile_data.get('industry', ''),
+            'current_credit_score': profile_data.get('creditScore', 0),
+        }
+    
+    def _build_business_row(self, business_id: str, profile_data: Dict,
+                            transactions: Union[List[Dict], TransactionColumns]) -> Dict:
+        """Combine a business profile with the AI features of its transactions"""
+        ai_features = self.calculate_ai_features_from_firebase(transactions)
+        return {
+            **self._business_profile_fields(business_id, profile_data),
+            **ai_features
+        }
+    
+    @instrumented('fetch')
+    def fetch_businesses_concurrent(self, max_workers: int = 8, max_in_flight: Optional[int] = None,
+                                    rate_limit: Optional[float] = None, max_retries: int = 3,
+                                    checkpoint_path: Optional[str] = None,
+                                    known_counts: Optional[Dict[str, int]] = None) -> pd.DataFrame:
+        """Fetch business data with overlapping per-business invoice queries
+        
+        Invoice queries run on a thread pool of `max_workers`, throttled by an
+        optional token bucket of `rate_limit` queries/second and retried with
+        backoff on transient errors. At most `max_in_flight` fetched-but-unprocessed
+        businesses exist at once: new queries are only submitted as features are
+        computed for completed ones. The result matches the sequential
+        `fetch_businesses_from_firebase` output, including row order. Profile pages
+        are read as the queue drains, and with a `checkpoint_path` each page is
+        checkpointed once all of its businesses are done, along with the IDs of
+        those whose queries failed for a resumed run to retry. `known_counts` works as
+        in `fetch_businesses_from_firebase`; a business's count and invoice
+        queries are rate-limited and retried as a whole.
+        """
+        if not self.db:
+            print("❌ Firebase not initialized")
+            return pd.DataFrame()
+        
+        max_in_flight = max_in_flight or max_workers * 2
+        bucket = TokenBucket(rate_limit) if rate_limit else None
+        
+        def fetch(business_id: str) -> Tuple[str, TransactionColumns, Dict[str, int]]:
+            def query():
+                if bucket:
+                    bucket.acquire()
+                return self._query_business_indexed(business_id, (known_counts or {}).get(business_id))
+            try:
+                return call_with_retries(query, max_retries=max_retries)
+            except Exception as e:
+                print(f"❌ Error fetching transactions for {business_id}: {e}")
+                return 'failed', TransactionColumns(), self._stage_costs()
+        
+        try:
+            checkpoint_path = shard_path(checkpoint_path, self.shard) if checkpoint_path else None
+            last_id, resumed_rows, resumed, failed = (self.load_scan_checkpoint(checkpoint_path) if checkpoint_path
+                                                      else (None, [], 0, []))
+            if resumed:
+                print(f"⏩ Resuming after {resumed} profiles (last {last_id})")
+            stage_stats = self._new_stage_stats()
+            queries, reads = 0, 0
+            if failed:
+                retried, failed, queries, reads = self._retry_failed_businesses(failed, fetch, stage_stats)
+                resumed_rows.extend(retried)
+                self.save_scan_checkpoint(checkpoint_path, last_id, retried, resumed, failed)
+            # index -> row, or None for businesses below the transaction minimum or whose query failed
+            rows: Dict[int, Optional[Dict]] = {}
+            # index -> business ID of failed queries
+            failed_ids: Dict[int, str] = {}
+            # (end index, last profile ID, profiles done) of pages not yet checkpointed
+            page_ends: List[Tuple[int, str, int]] = []
+            finished, saved = 0, 0
+            
+            def profile_stream() -> Iterator[Tuple[int, Any]]:
+                index, profiles_done = 0, resumed
+                for page in self.iter_business_profiles(self.db, start_after=last_id, max_retries=max_retries):
+                    for profile_doc in page:
+                        if self.in_shard(profile_doc.id):
+                            yield index, profile_doc
+                            index += 1
+                    profiles_done += len(page)
+                    page_ends.append((index, page[-1].id, profiles_done))
+            
+            def save_finished_pages():
+                nonlocal finished, saved
+                while finished in rows:
+                    finished += 1
+                while page_ends and page_ends[0][0] <= finished:
+                    end, page_last_id, profiles_done = page_ends.pop(0)
+                    failed.extend(failed_ids[index] for index in range(saved, end) if index in failed_ids)
+                    if checkpoint_path:
+                        page_rows = [rows[index] for index in range(saved, end) if rows[index] is not None]
+                        self.save_scan_checkpoint(checkpoint_path, page_last_id, page_rows, profiles_done, failed)
+                    saved = end
+            
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                pending = {}
+                profiles = profile_stream()
                 
-                # Convert Firestore timestamp to datetime
-                invoice_date = invoice_data.get('createdAt')
-                if hasattr(invoice_date, 'to_datetime'):
-                    invoice_date = invoice_date.to_datetime()
-                else:
-                    invoice_date = datetime.now()
+                def submit_next() -> bool:
+                    try:
+                        index, profile_doc = next(profiles)
+                    except StopIteration:
+                        return False
+                    pending[executor.submit(fetch, profile_doc.id)] = (index, profile_doc)
+                    return True
                 
-                transaction = {
-                    'business_id': business_id,
-                    'invoice_date': invoice_date,
-                    'invoice_amount': invoice_data.get('total', 0),
-                    'customer_email': invoice_data.get('customerEmail', 'unknown@email.com'),
-                    'payment_status': invoice_data.get('status', 'pending'),
-                    'due_date': invoice_data.get('dueDate', invoice_date + timedelta(days=30))
-                }
-                transactions.append(transaction)
+                while len(pending) < max_in_flight and submit_next():
+                    pass
+                
+                while pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        index, profile_doc = pending.pop(future)
+                        stage, transactions, costs = future.result()
+                        self._add_stage(stage_stats, profile_doc.id, stage, costs, transactions)
+                        queries += costs['queries']
+                        reads += costs['reads']
+                        rows[index] = None
+                        if stage == 'failed':
+                            failed_ids[index] = profile_doc.id
+                        elif len(transactions) >= 5:  # Minimum transaction requirement
+                            rows[index] = self._build_business_row(
+                                profile_doc.id, profile_doc.to_dict(), transactions
+                            )
+                        submit_next()
+                    save_finished_pages()
+            save_finished_pages()
             
-            return transactions
+            scan = self.profile_scan_stats
+            self._record_fetch_stats({
+                'mode': 'concurrent',
+                'queries': scan['pages'] + queries,
+                'reads': scan['reads'] + reads,
+                'failed_businesses': failed,
+                **self._profile_scan_summary(resumed),
+                **(self._indexed_summary(stage_stats, scan['reads'] + reads) if known_counts is not None else {}),
+            })
+            self._finish_scan_checkpoint(checkpoint_path, failed)
+            businesses = resumed_rows + [rows[index] for index in sorted(rows) if rows[index] is not None]
+            df = pd.DataFrame(businesses)
+            print(f"✅ Fetched {len(df)} businesses from Firebase "
+                  f"({scan['docs']} profiles / {scan['bytes']} bytes read)")
+            return df
             
+        except Exception as e:
+            print(f"❌ Error fetching Firebase data: {e}")
+            return pd.DataFrame()
+    
+    def fetch_business_transactions(self, business_id: str) -> TransactionColumns:
+        """Fetch transactions for a specific business"""
+        try:
+            return self._query_business_transactions(business_id)
         except Exception as e:
             print(f"❌ Error fetching transactions for {business_id}: {e}")
-            return []
+            return TransactionColumns()
+    
+    def _query_business_transactions(self, business_id: str) -> TransactionColumns:
+        """Query the invoices of one business, letting errors propagate"""
+        if self.cache:
+            cached = self.cache.get('transactions', self._cache_source(), business_id)
+            if cached is not None:
+                return TransactionColumns.from_frame(cached)
+        
+        # Get all invoices for this business
+        invoices = self.db.collection('invoices').where('businessId', '==', business_id).get()
+        
+        transactions = TransactionColumns()
+        for invoice_doc in invoices:
+            transactions.add(business_id, *self._invoice_fields(invoice_doc.to_dict()))
+        if self.cache:
+            self.cache.put('transactions', self._cache_source(), business_id, transactions.to_frame())
+        return transactions
+    
+    def fetch_business_indexed(self, business_id: str,
+                               known_count: Optional[int] = None) -> Tuple[str, TransactionColumns, Dict[str, int]]:
+        """`_query_business_indexed`, reporting errors as a 'failed' stage with no transactions"""
+        try:
+            return self._query_business_indexed(business_id, known_count)
+        except Exception as e:
+            print(f"❌ Error fetching transactions for {business_id}: {e}")
+            return 'failed', TransactionColumns(), self._stage_costs()
+    
+    def _query_business_indexed(self, business_id: str,
+                                known_count: Optional[int] = None) -> Tuple[str, TransactionColumns, Dict[str, int]]:
+        """Query the invoices of one business: `(stage, transactions, costs)`
+        
+        `known_count` is the business's invoice count from a previous fetch (see
+        `invoice_counts`), or None if it was not seen. Only a business known to
+        have been below the minimum is counted first: its `count()` aggregation
+        takes the same one round trip as the invoice query and is billed one read,
+        which the invoice query of a business with at most one invoice costs too.
+        
+        - 'fetched': all its transactions, from the plain invoice query.
+        - 'counted': it is still below the minimum; no invoices were downloaded
+          and the result is empty.
+        - 'grown': it reached the minimum since; its transactions are queried
+          after the count, costing one more read and round trip than 'fetched'.
+        - 'cached': transactions came from the local cache; no queries were run.
+        
+        `costs` counts the invoices the business has, the queries run and the
+        reads billed (aggregations at one read per 1000 matched invoices).
+        """
+        if self.cache:
+            cached = self.cache.get('transactions', self._cache_source(), business_id)
+            if cached is not None:
+                transactions = TransactionColumns.from_frame(cached)
+                return 'cached', transactions, self._stage_costs(invoices=len(transactions))
+        
+        stage, costs = 'fetched', self._stage_costs()
+        if known_count is not None and known_count < 5:  # Minimum transaction requirement
+            invoices = self.db.collection('invoices').where('businessId', '==', business_id)
+            invoice_count = invoices.count().get()[0][0].value
+            costs = self._stage_costs(invoices=invoice_count, queries=1, reads=_aggregation_reads(invoice_count))
+            if invoice_count < 5:
+                return 'counted', TransactionColumns(), costs
+            stage = 'grown'
+        transactions = self._query_business_transactions(business_id)
+        costs['invoices'] = len(transactions)
+        costs['queries'] += 1
+        costs['reads'] += max(len(transactions), 1)
+        return stage, transactions, costs
+    
+    def _stage_costs(self, invoices: int = 0, queries: int = 0, reads: int = 0) -> Dict[str, int]:
+        """Costs of one business's `_query_business_indexed` outcome"""
+        return {'invoices': invoices, 'queries': queries, 'reads': reads}
+    
+    def _new_stage_stats(self) -> Dict[str, Any]:
+        """Empty per-fetch tally for `_add_stage`"""
+        return {'businesses': {stage: 0 for stage in ('fetched', 'counted', 'grown', 'cached', 'failed')},
+                'invoices_avoided': 0, 'unindexed_reads': 0}
     
-    def calculate_ai_features_from_firebase(self, transactions: List[Dict]) -> Dict:
+    def _add_stage(self, stage_stats: Dict[str, Any], business_id: str, stage: str, costs: Dict[str, int],
+                   transactions: TransactionColumns):
+        """Tally one business's `fetch_business_indexed` outcome and remember its invoice count and newest invoice"""
+        stage_stats['businesses'][stage] += 1
+        if stage == 'counted':
+            stage_stats['invoices_avoided'] += costs['invoices']
+        if costs['queries']:
+            # The plain invoice query, billed at least one read
+            stage_stats['unindexed_reads'] += max(costs['invoices'], 1)
+        if stage != 'failed':
+            self.invoice_counts[business_id] = costs['invoices']
+            self.latest_invoice_us.update(transactions.business_latest())
+    
+    def _indexed_summary(self, stage_stats: Dict[str, Any], reads: int) -> Dict[str, Any]:
+        """Fetch stats entries of a fetch with `known_counts`, also added to the run counters
+        
+        `invoices_avoided` are invoices of businesses still below the minimum that
+        were counted instead of downloaded, and `unindexed_reads` is what the same
+        businesses would have cost without the index.
+        """
+        businesses = stage_stats['businesses']
+        invoices_avoided = stage_stats['invoices_avoided']
+        unindexed_reads = self.profile_scan_stats['reads'] + stage_stats['unindexed_reads']
+        self.metrics.count('firestore_invoices_avoided', invoices_avoided)
+        print(f"⏭️  Indexed fetch: {businesses['counted']} still below the invoice minimum, "
+              f"{businesses['grown']} grew past it; {invoices_avoided} invoices not downloaded, "
+              f"{reads} reads vs {unindexed_reads} without the index")
+        return {
+            'stages': dict(businesses),
+            'invoices_avoided': invoices_avoided,
+            'unindexed_reads': unindexed_reads,
+        }
+    
+    def _invoice_created_at(self, invoice_data: Dict) -> Optional[datetime]:
+        """Return an invoice's `createdAt` as a datetime, if it has one"""
+        created_at = invoice_data.get('createdAt')
+        if hasattr(created_at, 'to_datetime'):
+            return created_at.to_datetime()
+        if isinstance(created_at, datetime):
+            return created_at
+        return None
+    
+    def _invoice_fields(self, invoice_data: Dict) -> Tuple[datetime, float, str, str, Any]:
+        """`(invoice_date, amount, customer_email, status, due_date)` of an invoice document"""
+        # Convert Firestore timestamp to datetime
+        invoice_date = invoice_data.get('createdAt')
+        if hasattr(invoice_date, 'to_datetime'):
+            invoice_date = invoice_date.to_datetime()
+        else:
+            invoice_date = datetime.now()
+        
+        return (
+            invoice_date,
+            invoice_data.get('total', 0),
+            invoice_data.get('customerEmail', 'unknown@email.com'),
+            invoice_data.get('status', 'pending'),
+            invoice_data.get('dueDate', invoice_date + timedelta(days=30)),
+        )
+    
+    def _invoice_to_transaction(self, business_id: str, invoice_data: Dict) -> Dict:
+        """Convert an invoice document into a transaction record"""
+        invoice_date, amount, customer_email, status, due_date = self._invoice_fields(invoice_data)
+        return {
+            'business_id': business_id,
+            'invoice_date': invoice_date,
+            'invoice_amount': amount,
+            'customer_email': customer_email,
+            'payment_status': status,
+            'due_date': due_date
+        }
+    
+    @instrumented('features')
+    def calculate_ai_features_from_firebase(self, transactions: Union[List[Dict], TransactionColumns],
+                                            current_date: Optional[datetime] = None) -> Dict:
         """Calculate AI features from Firebase transaction data"""
-        if not transactions:
+        if not len(transactions):
             return self.get_default_features()
         
-        current_date = datetime.now()
+        if isinstance(transactions, TransactionColumns):
+            return self._transaction_columns_features(transactions, current_date)
+        
+        current_date = current_date or datetime.now()
         
         # Feature 1: Customer Number - total number of unique customers
         unique_customers = set(t['customer_email'] for t in transactions)
@@ -202,6 +2167,347 @@ class FirebaseAIIntegration:
             'clearance_days': clearance_days
         }
     
+    @instrumented('features')
+    def calculate_ai_features_columns(self, transactions: TransactionColumns,
+                                      current_date: Optional[datetime] = None) -> pd.DataFrame:
+        """Calculate AI features for every business in a `TransactionColumns`
+        
+        Same values as `calculate_ai_features_frame` on `transactions.to_frame()`,
+        computed on the integer-coded arrays. Returns one row per business ID, in
+        order of first appearance.
+        """
+        features = self._column_features(transactions, current_date)
+        return pd.DataFrame(features, columns=SCORING_FEATURES,
+                            index=pd.Index(transactions.business_ids, name='business_id'))
+    
+    def _transaction_columns_features(self, transactions: TransactionColumns,
+                                      current_date: Optional[datetime] = None) -> Dict:
+        """`calculate_ai_features_from_firebase` over all invoices of a (non-empty) `TransactionColumns`
+        
+        A plain loop over the arrays: for one business's few dozen invoices it is
+        faster than numpy's per-call overhead.
+        """
+        current_us = _epoch_microseconds(current_date or datetime.now())
+        total_transactions = len(transactions)
+        customer_number = len(set(transactions.customer_codes))
+        paid_codes = {code for status, code in transactions._status_index.items() if status in ['paid', 'Paid']}
+        paid_count, delay_sum, delay_count = 0, 0, 0
+        for status_code, invoice_us, due_us in zip(transactions.status_codes, transactions.invoice_us,
+                                                   transactions.due_us):
+            if status_code in paid_codes:
+                paid_count += 1
+                if due_us != _NO_DATE:
+                    delay_sum += max(0, (due_us - invoice_us) // _MICROSECONDS_PER_DAY)
+                    delay_count += 1
+        return {
+            'customer_number': customer_number,
+            'customer_order': total_transactions / customer_number,
+            'amount': sum(transactions.amounts),
+            'days_since_last_transaction': (current_us - max(transactions.invoice_us)) // _MICROSECONDS_PER_DAY,
+            'customer_stickiness': 1 - (customer_number / total_transactions),
+            'transaction_count': total_transactions,
+            'completion_rate': paid_count / total_transactions,
+            'clearance_days': delay_sum / delay_count if delay_count else 15
+        }
+    
+    def _column_features(self, transactions: TransactionColumns,
+                         current_date: Optional[datetime] = None) -> Dict[str, np.ndarray]:
+        """Feature arrays indexed by business code"""
+        columns = transactions.arrays()
+        codes, n = columns['business_codes'], len(transactions.business_ids)
+        current_us = _epoch_microseconds(current_date or datetime.now())
+        
+        transaction_count = np.bincount(codes, minlength=n)
+        n_customers = max(len(transactions.customers), 1)
+        customer_pairs = np.unique(codes.astype(np.int64) * n_customers + columns['customer_codes'])
+        customer_number = np.bincount(customer_pairs // n_customers, minlength=n)
+        amount = np.bincount(codes, weights=columns['amounts'], minlength=n)
+        latest_us = np.full(n, _NO_DATE, dtype=np.int64)
+        np.maximum.at(latest_us, codes, columns['invoice_us'])
+        
+        paid_codes = [code for status, code in transactions._status_index.items() if status in ['paid', 'Paid']]
+        paid = np.isin(columns['status_codes'], paid_codes)
+        paid_count = np.bincount(codes[paid], minlength=n)
+        
+        # Clearance days: mean non-negative due/invoice delay over paid invoices with a due date
+        has_delay = paid & (columns['due_us'] != _NO_DATE)
+        delay_us = columns['due_us'][has_delay] - columns['invoice_us'][has_delay]
+        delays = np.maximum(delay_us // _MICROSECONDS_PER_DAY, 0)
+        delay_count = np.bincount(codes[has_delay], minlength=n)
+        delay_sum = np.bincount(codes[has_delay], weights=delays, minlength=n)
+        clearance_days = np.full(n, 15.0)
+        np.divide(delay_sum, delay_count, out=clearance_days, where=delay_count > 0)
+        
+        return {
+            'customer_number': customer_number,
+            'customer_order': transaction_count / customer_number,
+            'amount': amount,
+            'days_since_last_transaction': (current_us - latest_us) // _MICROSECONDS_PER_DAY,
+            'customer_stickiness': 1 - customer_number / transaction_count,
+            'transaction_count': transaction_count,
+            'completion_rate': paid_count / transaction_count,
+            'clearance_days': clearance_days,
+        }
+    
+    def transactions_to_frame(self, transactions: List[Dict]) -> pd.DataFrame:
+        """Convert transaction dicts into the columnar frame used by `calculate_ai_features_frame`"""
+        due_dates = [t['due_date'] if isinstance(t['due_date'], datetime) else None for t in transactions]
+        return pd.DataFrame({
+            'business_id': [t['business_id'] for t in transactions],
+            'invoice_date': pd.to_datetime([t['invoice_date'] for t in transactions]),
+            'invoice_amount': [t['invoice_amount'] for t in transactions],
+            'customer_email': [t['customer_email'] for t in transactions],
+            'payment_status': [t['payment_status'] for t in transactions],
+            'due_date': pd.to_datetime(due_dates),
+        })
+    
+    def frame_to_transactions(self, transactions: pd.DataFrame) -> List[Dict]:
+        """Inverse of `transactions_to_frame`; a missing due date comes back as None"""
+        records = transactions.to_dict('records')
+        for record in records:
+            record['invoice_date'] = record['invoice_date'].to_pydatetime()
+            due_date = record['due_date']
+            record['due_date'] = None if pd.isna(due_date) else due_date.to_pydatetime()
+        return records
+    
+    @instrumented('features')
+    def calculate_ai_features_frame(self, transactions: pd.DataFrame,
+                                    current_date: Optional[datetime] = None) -> pd.DataFrame:
+        """Calculate AI features for every business in one transactions frame
+        
+        Columnar equivalent of `calculate_ai_features_from_firebase`: the frame holds
+        one row per invoice (see `transactions_to_frame`), with `due_date` as NaT
+        where it is not a datetime. Returns one row per `business_id`, in order of
+        first appearance, with the same feature values as the per-business function.
+        """
+        columns = ['customer_number', 'customer_order', 'amount', 'days_since_last_transaction',
+                   'customer_stickiness', 'transaction_count', 'completion_rate', 'clearance_days']
+        if transactions.empty:
+            return pd.DataFrame(columns=columns, index=pd.Index([], name='business_id'))
+        
+        current_date = pd.Timestamp(current_date or datetime.now())
+        business_ids = transactions['business_id']
+        grouped = transactions.groupby(business_ids, sort=False)
+        
+        transaction_count = grouped.size()
+        customer_number = (
+            transactions[['business_id', 'customer_email']].drop_duplicates()
+            .groupby('business_id', sort=False).size()
+            .reindex(transaction_count.index)
+        )
+        amount = grouped['invoice_amount'].sum()
+        latest_date = grouped['invoice_date'].max()
+        
+        paid = transactions['payment_status'].isin(['paid', 'Paid'])
+        paid_count = paid.groupby(business_ids, sort=False).sum()
+        
+        # Clearance days: mean non-negative due/invoice delay over paid invoices with a due date
+        has_delay = paid & transactions['due_date'].notna()
+        delays = (transactions.loc[has_delay, 'due_date'] - transactions.loc[has_delay, 'invoice_date']).dt.days
+        clearance_days = (
+            delays.clip(lower=0).groupby(business_ids[has_delay], sort=False).mean()
+            .reindex(transaction_count.index).fillna(15)
+        )
+        
+        features = pd.DataFrame({
+            'customer_number': customer_number,
+            'customer_order': transaction_count / customer_number,
+            'amount': amount,
+            'days_since_last_transaction': (current_date - latest_date).dt.days,
+            'customer_stickiness': 1 - customer_number / transaction_count,
+            'transaction_count': transaction_count,
+            'completion_rate': paid_count / transaction_count,
+            'clearance_days': clearance_days,
+        }, columns=columns)
+        features.index.name = 'business_id'
+        return features
+    
+    def load_feature_state(self, state_path: str) -> Tuple[Dict[str, BusinessFeatureState], Dict[str, Any]]:
+        """Load persisted feature state: `(states, mark)`, empty if there is none
+        
+        `states` maps business IDs to their `BusinessFeatureState`. `mark` says
+        which invoices are already folded in: every invoice created before
+        `watermark` (the newest `createdAt` seen), those at exactly `watermark`
+        listed in `watermark_ids`, and the invoices without `createdAt` listed
+        in `undated_ids`. State files from before the run-level mark kept a
+        watermark per business; the newest of those is used.
+        """
+        mark = self._empty_feature_mark()
+        if not os.path.exists(state_path):
+            return {}, mark
+        with open(state_path, 'r') as f:
+            data = json.load(f)
+        if 'businesses' not in data:
+            data = {'businesses': data, **self._legacy_feature_mark(data)}
+        if data['watermark']:
+            mark['watermark'] = datetime.fromisoformat(data['watermark'])
+        mark['watermark_ids'] = set(data['watermark_ids'])
+        mark['undated_ids'] = set(data.get('undated_ids', []))
+        states = {business_id: BusinessFeatureState.from_dict(state)
+                  for business_id, state in data['businesses'].items()}
+        return states, mark
+    
+    def _empty_feature_mark(self) -> Dict[str, Any]:
+        """Mark of a feature state that has counted no invoices"""
+        return {'watermark': None, 'watermark_ids': set(), 'undated_ids': set()}
+    
+    def _legacy_feature_mark(self, businesses: Dict[str, Dict]) -> Dict[str, Any]:
+        """Run-level mark of a state file that kept a watermark per business"""
+        watermark = max((state['watermark'] for state in businesses.values() if state.get('watermark')),
+                        key=datetime.fromisoformat, default=None)
+        return {
+            'watermark': watermark,
+            'watermark_ids': [invoice_id for state in businesses.values() if state.get('watermark') == watermark
+                              for invoice_id in state.get('watermark_ids', [])] if watermark else [],
+        }
+    
+    def save_feature_state(self, states: Dict[str, BusinessFeatureState], mark: Dict[str, Any], state_path: str):
+        """Persist per-business feature state and the run-level mark atomically"""
+        tmp_path = f"{state_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                'watermark': mark['watermark'].isoformat() if mark['watermark'] else None,
+                'watermark_ids': sorted(mark['watermark_ids']),
+                'undated_ids': sorted(mark['undated_ids']),
+                'businesses': {business_id: state.to_dict() for business_id, state in states.items()},
+            }, f)
+        os.replace(tmp_path, state_path)
+    
+    @instrumented('fetch')
+    def update_features_incrementally(self, state_path: str = 'ai_feature_state.json',
+                                      full_rebuild: bool = False,
+                                      current_date: Optional[datetime] = None) -> pd.DataFrame:
+        """Fetch only invoices newer than the stored watermark and fold them into feature state
+        
+        Businesses with saved state are brought up to date with a single
+        `createdAt >= watermark` scan of the invoices collection, where the
+        watermark is the newest `createdAt` any previous run has seen; businesses
+        without state get their full history. `full_rebuild` discards the saved
+        state and rescans everything. Returns the same rows as
+        `fetch_businesses_from_firebase`.
+        
+        Folding is append-only: status changes on invoices already counted (e.g.
+        `sent` -> `paid`), invoices created behind the watermark and new invoices
+        without `createdAt` are only picked up by a full rebuild.
+        """
+        if not self.db:
+            print("❌ Firebase not initialized")
+            return pd.DataFrame()
+        
+        try:
+            # Each shard keeps its own state file
+            state_path = shard_path(state_path, self.shard)
+            states, mark = ({}, self._empty_feature_mark()) if full_rebuild else self.load_feature_state(state_path)
+            business_profiles = self.fetch_business_profiles(self.db)
+            invoices = self.db.collection('invoices')
+            scan = self.profile_scan_stats
+            folded, reads = 0, scan['reads']
+            business_profiles = [profile_doc for profile_doc in business_profiles if self.in_shard(profile_doc.id)]
+            
+            # The mark as persisted by the previous run; anything behind it is already counted
+            watermark, watermark_ids, undated_ids = mark['watermark'], set(mark['watermark_ids']), mark['undated_ids']
+            
+            def fold(invoice_doc, skip: set, since_watermark: bool) -> bool:
+                invoice_data = invoice_doc.to_dict()
+                business_id = invoice_data.get('businessId')
+                if business_id is None or business_id in skip or not self.in_shard(business_id):
+                    return False
+                created_at = self._invoice_created_at(invoice_data)
+                if created_at is None:
+                    if invoice_doc.id in undated_ids:
+                        return False
+                    undated_ids.add(invoice_doc.id)
+                elif since_watermark and watermark is not None and (
+                        created_at < watermark or (created_at == watermark and invoice_doc.id in watermark_ids)):
+                    return False
+                else:
+                    if mark['watermark'] is None or created_at > mark['watermark']:
+                        mark['watermark'], mark['watermark_ids'] = created_at, set()
+                    if created_at == mark['watermark']:
+                        mark['watermark_ids'].add(invoice_doc.id)
+                state = states.setdefault(business_id, BusinessFeatureState())
+                state.add(self._invoice_to_transaction(business_id, invoice_data))
+                return True
+            
+            known = [profile_doc.id for profile_doc in business_profiles if profile_doc.id in states]
+            new = {profile_doc.id for profile_doc in business_profiles if profile_doc.id not in states}
+            
+            # (query, businesses to ignore in its results, whether invoices behind the mark are skipped)
+            if not states:
+                queries = [(invoices, set(), True)]
+            else:
+                # New businesses get their full history; the watermark scan must not count it twice
+                queries = [(invoices.where('businessId', '==', business_id), set(), False) for business_id in new]
+                if watermark is not None:
+                    queries.append((invoices.where('createdAt', '>=', watermark), new, True))
+                elif known:
+                    queries.append((invoices, new, True))
+            
+            for query, skip, since_watermark in queries:
+                scanned = 0
+                for invoice_doc in query.stream():
+                    scanned += 1
+                    folded += fold(invoice_doc, skip, since_watermark)
+                reads += max(scanned, 1)
+            
+            businesses = []
+            for profile_doc in business_profiles:
+                # Keep empty state too, so invoice-less businesses are not re-queried next run
+                state = states.setdefault(profile_doc.id, BusinessFeatureState())
+                if state.transaction_count >= 5:  # Minimum transaction requirement
+                    businesses.append({
+                        **self._business_profile_fields(profile_doc.id, profile_doc.to_dict()),
+                        **state.to_features(current_date)
+                    })
+            
+            self.save_feature_state(states, mark, state_path)
+            self._record_fetch_stats({
+                'mode': 'full_rebuild' if full_rebuild else 'incremental',
+                'queries': scan['pages'] + len(queries),
+                'reads': reads,
+                'invoices_folded': folded,
+                **self._profile_scan_summary(),
+            })
+            df = pd.DataFrame(businesses)
+            print(f"✅ Updated features for {len(df)} businesses ({folded} new invoices, {reads} reads)")
+            return df
+            
+        except Exception as e:
+            print(f"❌ Error updating incremental features: {e}")
+            return pd.DataFrame()
+    
+    def check_incremental_consistency(self, state_path: str = 'ai_feature_state.json',
+                                      business_ids: Optional[List[str]] = None,
+                                      current_date: Optional[datetime] = None) -> List[Dict]:
+        """Compare stored feature state against a from-scratch computation
+        
+        Returns one entry per mismatching feature; an empty list means the
+        incremental state agrees with `calculate_ai_features_from_firebase`.
+        """
+        current_date = current_date or datetime.now()
+        states, _ = self.load_feature_state(shard_path(state_path, self.shard))
+        mismatches = []
+        for business_id in business_ids or list(states):
+            expected = self.calculate_ai_features_from_firebase(
+                self.fetch_business_transactions(business_id), current_date=current_date
+            )
+            state = states.get(business_id)
+            actual = (state.to_features(current_date) if state else None) or self.get_default_features()
+            for feature, value in expected.items():
+                if not np.isclose(actual[feature], value):
+                    mismatches.append({
+                        'business_id': business_id,
+                        'feature': feature,
+                        'incremental': actual[feature],
+                        'expected': value,
+                    })
+        
+        if mismatches:
+            print(f"❌ {len(mismatches)} incremental feature mismatches")
+        else:
+            print(f"✅ Incremental features consistent for {len(business_ids or states)} businesses")
+        return mismatches
+    
     def get_default_features(self) -> Dict:
         """Return default features for businesses with insufficient data"""
         return {
@@ -265,6 +2571,47 @@ class FirebaseAIIntegration:
         else:
             return 'poor'
     
+    def credit_score_terms_batch(self, df: pd.DataFrame) -> Dict[str, np.ndarray]:
+        """Per-term score contributions of `calculate_credit_score_from_features` as arrays"""
+        customer_number = df['customer_number'].to_numpy(dtype=float)
+        customer_order = df['customer_order'].to_numpy(dtype=float)
+        amount = df['amount'].to_numpy(dtype=float)
+        days_since = df['days_since_last_transaction'].to_numpy(dtype=float)
+        customer_stickiness = df['customer_stickiness'].to_numpy(dtype=float)
+        
+        recency_score = np.select(
+            [days_since <= 30, days_since <= 90],
+            [100.0, 100 - (days_since - 30) * 1.5],
+            default=np.maximum(0, 100 - (days_since - 30) * 2)
+        )
+        return {
+            'customer': np.minimum(np.sqrt(customer_number) * 20, 150),
+            'order': np.minimum(customer_order * 10, 100),
+            'amount': np.minimum(np.log(np.maximum(amount, 1)) * 15, 200),
+            'recency': recency_score,
+            'stickiness': customer_stickiness * 100,
+        }
+    
+    def calculate_credit_scores_batch(self, df: pd.DataFrame) -> np.ndarray:
+        """Vectorized `calculate_credit_score_from_features` for every row of `df`
+        
+        Noise is drawn from `np.random` in row order, so with the same seed the
+        scores equal calling the scalar function row by row.
+        """
+        terms = self.credit_score_terms_batch(df)
+        final_score = 300 + terms['customer'] + terms['order'] + terms['amount'] + terms['recency'] + terms['stickiness']
+        score = final_score + np.random.normal(0, 20, size=len(df))
+        return np.clip(score, 300, 900)
+    
+    def categorize_credit_scores_batch(self, scores: np.ndarray) -> np.ndarray:
+        """Vectorized `categorize_credit_score`"""
+        scores = np.asarray(scores)
+        return np.select(
+            [scores >= 720, scores >= 660, scores >= 580],
+            ['excellent', 'good', 'at_risk'],
+            default='poor'
+        ).astype(object)
+    
     def apply_hard_filters(self, features: Dict) -> str:
         """Apply hard filtering rules from PepeAI model"""
         if features['transaction_count'] < 5:
@@ -277,6 +2624,73 @@ class FirebaseAIIntegration:
             return 'slow_settlement'
         return 'pass'
     
+    @instrumented('filters')
+    def apply_hard_filters_batch(self, df: pd.DataFrame) -> np.ndarray:
+        """Vectorized `apply_hard_filters` returning one filter result per row"""
+        return self.hard_filter_results(df)
+    
+    def hard_filter_results(self, df: pd.DataFrame) -> np.ndarray:
+        """`apply_hard_filters_batch` without run metrics"""
+        return np.select(
+            [
+                df['transaction_count'].to_numpy() < 5,
+                df['customer_stickiness'].to_numpy() > 0.8,
+                df['completion_rate'].to_numpy() < 0.2,
+                df['clearance_days'].to_numpy() > 25,
+            ],
+            ['low_trust', 'circular_fake', 'non_compliant', 'slow_settlement'],
+            default='pass'
+        ).astype(object)
+    
+    def explain_batch(self, df: pd.DataFrame, exact: bool = False) -> Tuple[List[str], np.ndarray]:
+        """Per-feature impacts behind the predictions of `df`, as `(names, impacts[rows, names])`
+        
+        With a model, impacts are the booster's feature contributions (margin units,
+        from one `pred_contribs` call) to each row's `predicted_category`. They are
+        the approximate per-path attributions unless `exact`; exact TreeSHAP costs
+        about 45x more on the default booster. With the formula, impacts are the
+        points each score term falls short of its maximum.
+        """
+        if self.model and ML_AVAILABLE:
+            import xgboost as xgb
+            contributions = self.model.predict(xgb.DMatrix(df[MODEL_FEATURES]), pred_contribs=True,
+                                               approx_contribs=not exact)
+            if contributions.ndim == 3:
+                classes = {category: index for index, category in enumerate(CREDIT_CATEGORIES)}
+                class_index = np.array([classes[category] for category in df['predicted_category']], dtype=np.intp)
+                contributions = contributions[np.arange(len(df)), class_index]
+            # The last column is the bias term
+            return list(MODEL_FEATURES), contributions[:, :-1]
+        terms = self.credit_score_terms_batch(df)
+        return list(SCORE_TERM_MAX), np.column_stack([terms[name] - SCORE_TERM_MAX[name] for name in SCORE_TERM_MAX])
+    
+    @instrumented('explain')
+    def explain_predictions(self, predictions: pd.DataFrame, top_k: int = 3, exact: bool = False) -> pd.DataFrame:
+        """Add the `top_reasons` behind every passing business's prediction in one batch (see `add_top_reasons`)"""
+        return self.add_top_reasons(predictions, top_k, exact)
+    
+    def add_top_reasons(self, predictions: pd.DataFrame, top_k: int = 3, exact: bool = False) -> pd.DataFrame:
+        """`explain_predictions` without run metrics
+        
+        Reasons are the `top_k` largest impacts from `explain_batch`, stored
+        compactly as `name:+impact` pairs joined by ';', e.g.
+        `amount:-62.4;recency:-35.0;order:-12.0`. Businesses rejected by the hard
+        filters get None; their reason is `filter_result`.
+        """
+        passed_mask = (predictions['filter_result'] == 'pass').to_numpy()
+        reasons = np.full(len(predictions), None, dtype=object)
+        if passed_mask.any():
+            names, impacts = self.explain_batch(predictions.loc[passed_mask], exact)
+            top = np.argsort(-np.abs(impacts), axis=1, kind='stable')[:, :top_k]
+            # (name, impact) pairs side by side so one %-format builds each row's string
+            pairs = np.empty((len(top), 2 * top.shape[1]), dtype=object)
+            pairs[:, 0::2] = np.array(names, dtype=object)[top]
+            pairs[:, 1::2] = np.take_along_axis(impacts, top, axis=1)
+            template = ';'.join(['%s:%+.2f'] * top.shape[1])
+            reasons[passed_mask] = [template % tuple(row) for row in pairs.tolist()]
+        return predictions.assign(top_reasons=reasons)
+    
+    @instrumented('train', rows_out=lambda model: None)
     def train_xgboost_model(self, df: pd.DataFrame) -> Optional[object]:
         """Train XGBoost model using the same approach as PepeAI"""
         if not ML_AVAILABLE:
@@ -284,42 +2698,23 @@ class FirebaseAIIntegration:
             return None
         
         try:
+            import xgboost as xgb
+            from sklearn.model_selection import train_test_split
+            from sklearn.metrics import classification_report
+            
             # Filter data that passes hard filters
-            df['filter_result'] = df.apply(lambda row: self.apply_hard_filters(row.to_dict()), axis=1)
-            passed_data = df[df['filter_result'] == 'pass'].copy()
+            df['filter_result'] = self.apply_hard_filters_batch(df)
+            X, y = self.training_set(df[df['filter_result'] == 'pass'])
             
-            if len(passed_data) < 10:
+            if len(X) < 10:
                 print("❌ Insufficient data for training (need at least 10 passing businesses)")
                 return None
             
-            # Calculate credit scores and categories
-            passed_data['predicted_credit_score'] = passed_data.apply(
-                lambda row: self.calculate_credit_score_from_features(row.to_dict()), axis=1
-            )
-            passed_data['credit_category'] = passed_data['predicted_credit_score'].apply(self.categorize_credit_score)
-            passed_data['target_numeric'] = passed_data['credit_category'].map({
-                'excellent': 3, 'good': 2, 'at_risk': 1, 'poor': 0
-            })
-            
-            # Features for XGBoost
-            features = ['customer_number', 'customer_order', 'amount', 'days_since_last_transaction', 'customer_stickiness']
-            X = passed_data[features]
-            y = passed_data['target_numeric']
-            
             # Train-test split
             X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
             
             # XGBoost parameters
-            params = {
-                'max_depth': 5,
-                'learning_rate': 0.1,
-                'objective': 'multi:softprob',
-                'eval_metric': 'mlogloss',
-                'num_class': 4,
-                'subsample': 0.8,
-                'colsample_bytree': 0.8,
-                'random_state': 42
-            }
+            params = dict(XGB_BASE_PARAMS)
             
             # Train model
             dtrain = xgb.DMatrix(X_train, label=y_train)
@@ -343,49 +2738,378 @@ class FirebaseAIIntegration:
             print(classification_report(y_test, y_pred, target_names=['poor', 'at_risk', 'good', 'excellent']))
             
             self.model = model
+            self.model_manifest = {
+                'features': list(MODEL_FEATURES),
+                'classes': list(CREDIT_CATEGORIES),
+                'data_hash': self.training_data_hash(X, y),
+                'training_rows': len(X),
+                'best_iteration': model.best_iteration,
+                'xgboost_version': xgb.__version__,
+                'trained_at': datetime.now().isoformat(),
+            }
             return model
             
         except Exception as e:
             print(f"❌ Error training model: {e}")
             return None
     
-    def predict_credit_scores(self, df: pd.DataFrame) -> pd.DataFrame:
-        """Predict credit scores for all businesses"""
+    @instrumented('train', rows_out=lambda result: None)
+    def train_xgboost_search(self, df: Optional[pd.DataFrame] = None, chunks=None,
+                             param_grid: Optional[Dict[str, List[Any]]] = None, n_folds: int = 5,
+                             n_workers: Optional[int] = None, search_rows: int = 200000,
+                             external_memory: bool = False, cache_dir: str = 'pepe_xgb_cache',
+                             num_boost_round: int = 200, early_stopping_rounds: int = 20,
+                             seed: int = 42) -> Optional[Dict[str, Any]]:
+        """Choose XGBoost parameters by k-fold CV in a process pool, then fit the best on all data
+        
+        Every fit uses the `hist` tree method on a `QuantileDMatrix`. Data comes from
+        `df`, or from `chunks`, a callable returning a fresh iterator of feature
+        DataFrames (e.g. `lambda: integration.iter_json_chunks(path)`). With chunks,
+        the search runs on the first `search_rows` passing rows and the final model
+        streams all chunks through an `xgb.DataIter`: into a `QuantileDMatrix`
+        (only the quantized matrix is held) or, with `external_memory`, into an
+        `ExtMemQuantileDMatrix` paged under `cache_dir`. Formula label noise is
+        seeded per chunk so every pass sees the same labels.
+        
+        `param_grid` maps parameter names to candidates (default
+        `DEFAULT_PARAM_GRID`); each combination is one trial on top of
+        `XGB_BASE_PARAMS`. Trials run in `n_workers` spawned processes (default one
+        per core, at most one per trial) and the cores are split evenly between
+        them as `nthread`, so workers don't oversubscribe the machine. Returns the
+        model, best parameters and per-trial timings, and sets `self.model` and
+        `self.model_manifest` like `train_xgboost_model`.
+        """
+        if not ML_AVAILABLE:
+            print("❌ ML libraries not available")
+            return None
+        
+        import itertools
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        import xgboost as xgb
+        from sklearn.model_selection import KFold, StratifiedKFold
+        
+        def labelled_chunks() -> Iterator[Tuple[pd.DataFrame, pd.Series]]:
+            for index, chunk in enumerate(chunks()):
+                passed = chunk[self.apply_hard_filters_batch(chunk) == 'pass']
+                if len(passed):
+                    np.random.seed(seed + index)
+                    yield self.training_set(passed)
+        
+        # Search data: everything passing the filters, or a prefix of the chunks
+        if chunks is None:
+            X_df, y_series = self.training_set(df[self.apply_hard_filters_batch(df) == 'pass'])
+        else:
+            parts, rows = [], 0
+            for X_chunk, y_chunk in labelled_chunks():
+                parts.append((X_chunk, y_chunk))
+                rows += len(X_chunk)
+                if rows >= search_rows:
+                    break
+            X_df = pd.concat([X_chunk for X_chunk, _ in parts]) if parts else pd.DataFrame(columns=MODEL_FEATURES)
+            y_series = pd.concat([y_chunk for _, y_chunk in parts]) if parts else pd.Series(dtype=int)
+        
+        if len(X_df) < max(10, n_folds * 2):
+            print("❌ Insufficient data for training (need at least 10 passing businesses)")
+            return None
+        
+        X = X_df.to_numpy(dtype=np.float64)
+        y = y_series.to_numpy(dtype=np.int64)
+        class_counts = np.bincount(y, minlength=4)
+        splitter = (StratifiedKFold(n_splits=n_folds, shuffle=True, random_state=seed)
+                    if class_counts[class_counts > 0].min() >= n_folds
+                    else KFold(n_splits=n_folds, shuffle=True, random_state=seed))
+        folds = list(splitter.split(X, y))
+        
+        grid = param_grid or DEFAULT_PARAM_GRID
+        trials = [dict(zip(grid, values)) for values in itertools.product(*grid.values())]
+        cores = os.cpu_count() or 1
+        n_workers = max(1, min(n_workers or cores, len(trials)))
+        nthread = max(1, cores // n_workers)
+        
+        print(f"🔎 Searching {len(trials)} parameter sets with {n_folds}-fold CV on {len(X)} rows "
+              f"({n_workers} workers x {nthread} threads)")
+        with self.metrics.stage('search', rows_in=len(X)):
+            search_start = time.perf_counter()
+            if n_workers == 1:
+                _init_cv_worker(X, y, folds, nthread, pin_threads=False)
+                results = [_run_cv_trial(params, num_boost_round, early_stopping_rounds) for params in trials]
+            else:
+                with ProcessPoolExecutor(
+                    max_workers=n_workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_cv_worker,
+                    initargs=(X, y, folds, nthread)
+                ) as executor:
+                    results = list(executor.map(
+                        _run_cv_trial, trials,
+                        itertools.repeat(num_boost_round), itertools.repeat(early_stopping_rounds)
+                    ))
+            search_seconds = time.perf_counter() - search_start
+        
+        for trial in results:
+            print(f"  {trial['params']}: mlogloss {trial['mlogloss']:.4f} ± {trial['mlogloss_std']:.4f}, "
+                  f"{trial['best_iteration'] + 1} rounds, {trial['seconds']}s")
+        best = min(results, key=lambda trial: trial['mlogloss'])
+        
+        # Refit the best parameters on all data with every core
+        with self.metrics.stage('fit'):
+            fit_start = time.perf_counter()
+            digest = hashlib.sha256()
+            if chunks is None:
+                dtrain = xgb.QuantileDMatrix(X_df, label=y_series, nthread=cores)
+                data_hash, training_rows = self.training_data_hash(X_df, y_series), len(X_df)
+            else:
+                class ChunkIter(xgb.DataIter):
+                    """Feeds labelled chunks to xgboost; hashes them on the first pass"""
+                    
+                    def __init__(self, cache_prefix: Optional[str]):
+                        self.iterator = None
+                        self.hashed = False
+                        self.rows = 0
+                        super().__init__(cache_prefix=cache_prefix)
+                    
+                    def next(self, input_data) -> bool:
+                        if self.iterator is None:
+                            self.iterator = labelled_chunks()
+                        try:
+                            X_chunk, y_chunk = next(self.iterator)
+                        except StopIteration:
+                            self.hashed = True
+                            return False
+                        if not self.hashed:
+                            digest.update(pd.util.hash_pandas_object(X_chunk, index=False).to_numpy().tobytes())
+                            digest.update(pd.util.hash_pandas_object(y_chunk, index=False).to_numpy().tobytes())
+                            self.rows += len(X_chunk)
+                        input_data(data=X_chunk, label=y_chunk)
+                        return True
+                    
+                    def reset(self):
+                        self.iterator = None
+                
+                if external_memory:
+                    os.makedirs(cache_dir, exist_ok=True)
+                    data_iter = ChunkIter(os.path.join(cache_dir, 'train'))
+                    # ExtMemQuantileDMatrix needs xgboost 3; older versions page a plain DMatrix
+                    ext_mem = getattr(xgb, 'ExtMemQuantileDMatrix', None)
+                    dtrain = ext_mem(data_iter, nthread=cores) if ext_mem else xgb.DMatrix(data_iter, nthread=cores)
+                else:
+                    data_iter = ChunkIter(None)
+                    dtrain = xgb.QuantileDMatrix(data_iter, nthread=cores)
+                data_hash, training_rows = digest.hexdigest(), data_iter.rows
+            
+            params = {**XGB_BASE_PARAMS, **best['params'], 'tree_method': 'hist', 'nthread': cores}
+            model = xgb.train(params, dtrain, num_boost_round=best['best_iteration'] + 1, verbose_eval=False)
+            fit_seconds = time.perf_counter() - fit_start
+        
+        print(f"✅ Best parameters {best['params']} (CV mlogloss {best['mlogloss']:.4f}); "
+              f"search {search_seconds:.1f}s, final fit on {training_rows} rows {fit_seconds:.1f}s")
+        
+        self.model = model
+        self.model_manifest = {
+            'features': list(MODEL_FEATURES),
+            'classes': list(CREDIT_CATEGORIES),
+            'data_hash': data_hash,
+            'training_rows': training_rows,
+            'best_iteration': best['best_iteration'],
+            'xgboost_version': xgb.__version__,
+            'trained_at': datetime.now().isoformat(),
+            'params': {name: value for name, value in params.items() if name != 'nthread'},
+            'cv_folds': n_folds,
+            'cv_mlogloss': best['mlogloss'],
+        }
+        return {
+            'model': model,
+            'best_params': best['params'],
+            'best_iteration': best['best_iteration'],
+            'trials': results,
+            'search_seconds': round(search_seconds, 3),
+            'fit_seconds': round(fit_seconds, 3),
+            'workers': n_workers,
+            'nthread_per_worker': nthread,
+        }
+    
+    def training_set(self, passed_df: pd.DataFrame) -> Tuple[pd.DataFrame, pd.Series]:
+        """Model features and formula-derived class labels for rows that passed the hard filters"""
+        scores = self.calculate_credit_scores_batch(passed_df)
+        categories = pd.Series(self.categorize_credit_scores_batch(scores), index=passed_df.index)
+        y = categories.map({'excellent': 3, 'good': 2, 'at_risk': 1, 'poor': 0}).rename('target_numeric')
+        return passed_df[MODEL_FEATURES], y
+    
+    def training_data_hash(self, X: pd.DataFrame, y: Optional[pd.Series] = None) -> str:
+        """SHA-256 over the training features (in model order) and labels"""
+        digest = hashlib.sha256()
+        digest.update(pd.util.hash_pandas_object(X[MODEL_FEATURES], index=False).to_numpy().tobytes())
+        if y is not None:
+            digest.update(pd.util.hash_pandas_object(y, index=False).to_numpy().tobytes())
+        return digest.hexdigest()
+    
+    def save_model(self, model_dir: str = 'pepe_model') -> bool:
+        """Save the trained booster in XGBoost's binary (UBJSON) format with a manifest"""
+        if self.model is None:
+            print("❌ No trained model to save")
+            return False
+        
+        os.makedirs(model_dir, exist_ok=True)
+        self.model.save_model(os.path.join(model_dir, MODEL_FILE))
+        manifest = {**(self.model_manifest or {}), 'model_file': MODEL_FILE,
+                    'features': list(MODEL_FEATURES), 'classes': list(CREDIT_CATEGORIES)}
+        with open(os.path.join(model_dir, MANIFEST_FILE), 'w') as f:
+            json.dump(manifest, f, indent=2)
+        self.model_manifest = manifest
+        print(f"✅ Model saved to {model_dir}")
+        return True
+    
+    def load_model(self, model_dir: str = 'pepe_model') -> bool:
+        """Load a saved booster, refusing it if its feature list or order differs"""
+        manifest_path = os.path.join(model_dir, MANIFEST_FILE)
+        if not os.path.exists(manifest_path):
+            print(f"❌ No saved model found in {model_dir}")
+            return False
+        
+        try:
+            with open(manifest_path, 'r') as f:
+                manifest = json.load(f)
+            if manifest.get('features') != MODEL_FEATURES:
+                print(f"❌ Saved model features {manifest.get('features')} do not match {MODEL_FEATURES}")
+                return False
+            
+            import xgboost as xgb
+            booster = xgb.Booster()
+            booster.load_model(os.path.join(model_dir, manifest.get('model_file', MODEL_FILE)))
+            self.model = booster
+            self.model_manifest = manifest
+            print(f"✅ Loaded model from {model_dir} (data hash {manifest.get('data_hash', 'unknown')[:12]})")
+            return True
+            
+        except Exception as e:
+            print(f"❌ Error loading model: {e}")
+            return False
+    
+    def feature_hashes(self, df: pd.DataFrame) -> np.ndarray:
+        """uint64 content hash of each row's `SCORING_FEATURES`
+        
+        Features are hashed as float64, so a row hashes the same whether its
+        columns came in as ints or floats (e.g. once NaN rows are mixed in).
+        """
+        return pd.util.hash_pandas_object(df[SCORING_FEATURES].astype('float64'), index=False).to_numpy()
+    
+    def model_version(self) -> str:
+        """Short hash of the loaded booster, or 'formula' when scoring without a model"""
+        if self.model is None:
+            return 'formula'
+        cached = getattr(self, '_model_version', None)
+        if cached and cached[0] is self.model:
+            return cached[1]
+        version = hashlib.sha256(bytes(self.model.save_raw(raw_format='ubj'))).hexdigest()[:16]
+        self._model_version = (self.model, version)
+        return version
+    
+    @instrumented('predict')
+    def predict_credit_scores(self, df: pd.DataFrame, previous: Optional[pd.DataFrame] = None,
+                              force_refresh: bool = False, with_hashes: bool = False) -> pd.DataFrame:
+        """Predict credit scores for all businesses
+        
+        Each result row carries the `model_version` that scored it and, given
+        `previous` or `with_hashes` (for predictions that are written back), the
+        uint64 `feature_hash` of its inputs. Given `previous` predictions (e.g.
+        from `fetch_stored_predictions`), rows whose business has the same feature
+        hash and model version reuse the previous result instead of being
+        rescored; `force_refresh` rescores everything.
+        """
+        hashes = self.feature_hashes(df) if previous is not None or with_hashes else None
+        version = self.model_version()
+        unchanged = np.zeros(len(df), dtype=bool)
+        if previous is not None and not force_refresh and len(previous):
+            stored = previous.drop_duplicates('business_id', keep='last').set_index('business_id')
+            stored = stored.reindex(df['business_id'].to_numpy())
+            stored_hashes = stored['feature_hash'].astype('UInt64')
+            unchanged = (stored_hashes.notna().to_numpy()
+                         & (stored_hashes.to_numpy(dtype=np.uint64, na_value=0) == hashes)
+                         & (stored['model_version'].to_numpy(dtype=object) == version))
+        
+        if not unchanged.any():
+            results = self.score_rows(df, self.apply_hard_filters_batch(df))
+        else:
+            rescored = df.loc[~unchanged]
+            scored = self.score_rows(rescored, self.apply_hard_filters_batch(rescored))
+            results = df.copy()
+            for column in [c for c in scored.columns if c not in df.columns or c in PREDICTION_FIELDS]:
+                values = stored[column].to_numpy(dtype=float if column == 'predicted_credit_score' else object,
+                                                 copy=True)
+                values[~unchanged] = scored[column].to_numpy()
+                results[column] = values
+        if hashes is not None:
+            results['feature_hash'] = hashes
+        results['model_version'] = version
+        
+        self.metrics.count_filter_results(results['filter_result'].to_numpy())
+        self.metrics.count('rescored', int((~unchanged).sum()))
+        self.metrics.count('rescore_skipped', int(unchanged.sum()))
+        if previous is not None and len(df):
+            print(f"♻️  Reused {unchanged.sum()} unchanged predictions, rescored {(~unchanged).sum()} "
+                  f"(skip ratio {unchanged.mean():.1%})")
+        return results
+    
+    def score_rows(self, df: pd.DataFrame, filter_result: Optional[np.ndarray] = None) -> pd.DataFrame:
+        """Filter and score every row of `df`
+        
+        The scoring step of `predict_credit_scores` without its run metrics,
+        feature hashes or model version, for callers such as the scoring server
+        that score many small batches outside of a pipeline run. `filter_result`
+        are the rows' hard filter results if they were already computed.
+        """
         results = df.copy()
         
         # Apply hard filters
-        results['filter_result'] = results.apply(lambda row: self.apply_hard_filters(row.to_dict()), axis=1)
+        if filter_result is None:
+            filter_result = self.hard_filter_results(results)
+        results['filter_result'] = filter_result
         
         # Calculate credit scores for businesses that pass hard filters
-        passed_mask = results['filter_result'] == 'pass'
+        passed_mask = filter_result == 'pass'
+        passed = results.loc[passed_mask]
         
-        if self.model and ML_AVAILABLE:
-            # Use trained XGBoost model
-            features = ['customer_number', 'customer_order', 'amount', 'days_since_last_transaction', 'customer_stickiness']
-            X = results.loc[passed_mask, features]
-            
-            if len(X) > 0:
-                dmatrix = xgb.DMatrix(X)
-                predictions = self.model.predict(dmatrix)
-                predicted_categories = np.argmax(predictions, axis=1)
-                category_map = {0: 'poor', 1: 'at_risk', 2: 'good', 3: 'excellent'}
-                results.loc[passed_mask, 'predicted_category'] = [category_map[p] for p in predicted_categories]
+        if 'predicted_category' in results.columns:
+            passed_categories = passed['predicted_category'].to_numpy(dtype=object)
+        else:
+            passed_categories = np.full(len(passed), None, dtype=object)
+        
+        if self.model and ML_AVAILABLE and len(passed) > 0:
+            # Use trained XGBoost model; inplace_predict skips building a DMatrix
+            predictions = self.model.inplace_predict(passed[MODEL_FEATURES])
+            passed_categories = CREDIT_CATEGORIES[np.argmax(predictions, axis=1)]
+            results['predicted_category'] = None
         
         # Calculate credit scores using formula
-        for idx, row in results.iterrows():
-            if row['filter_result'] == 'pass':
-                score = self.calculate_credit_score_from_features(row.to_dict())
-                results.at[idx, 'predicted_credit_score'] = score
-                if 'predicted_category' not in results.columns or pd.isna(results.at[idx, 'predicted_category']):
-                    results.at[idx, 'predicted_category'] = self.categorize_credit_score(score)
-            else:
-                results.at[idx, 'predicted_credit_score'] = 300  # Minimum score for rejected
-                results.at[idx, 'predicted_category'] = 'rejected'
+        passed_scores = self.calculate_credit_scores_batch(passed)
+        missing = pd.isna(passed_categories)
+        passed_categories[missing] = self.categorize_credit_scores_batch(passed_scores[missing])
         
+        scores = np.full(len(results), 300.0)  # Minimum score for rejected
+        scores[passed_mask] = passed_scores
+        categories = np.full(len(results), 'rejected', dtype=object)
+        categories[passed_mask] = passed_categories
+        
+        results['predicted_credit_score'] = scores
+        results['predicted_category'] = categories
         return results
     
-    def update_firebase_with_predictions(self, predictions_df: pd.DataFrame):
-        """Update Firebase business profiles with AI predictions"""
+    @instrumented('writes', rows_out=lambda summary: summary['written'] if summary else None)
+    def update_firebase_with_predictions(self, predictions_df: pd.DataFrame, bulk: bool = False,
+                                         previous: Optional[pd.DataFrame] = None, force_refresh: bool = False,
+                                         **bulk_options) -> Optional[Dict[str, Any]]:
+        """Update Firebase business profiles with AI predictions
+        
+        Given the `previous` stored predictions, only businesses whose score,
+        category or filter result differs are written (unless `force_refresh`).
+        """
+        if previous is not None and not force_refresh:
+            predictions_df = self.changed_predictions(predictions_df, previous)
+        
+        if bulk:
+            return self.update_firebase_bulk(predictions_df, **bulk_options)
+        
         if not self.db:
             print("❌ Firebase not initialized")
             return
@@ -399,10 +3123,16 @@ class FirebaseAIIntegration:
                     'creditScore': float(row['predicted_credit_score']),
                     'creditCategory': row['predicted_category'],
                     'filterResult': row['filter_result'],
-                    'aiUpdatedAt': firestore.SERVER_TIMESTAMP
+                    'aiUpdatedAt': self._server_timestamp()
                 }
+                for column in ('feature_hash', 'model_version', 'top_reasons'):
+                    if column in row:
+                        update_data[PREDICTION_FIELDS[column]] = (
+                            _hash_hex(row[column]) if column == 'feature_hash' else row[column]
+                        )
                 
                 self.db.collection('businesses').document(business_id).update(update_data)
+                self.metrics.count('firestore_writes')
                 updated_count += 1
             
             print(f"✅ Updated {updated_count} business profiles in Firebase")
@@ -410,71 +3140,567 @@ class FirebaseAIIntegration:
         except Exception as e:
             print(f"❌ Error updating Firebase: {e}")
     
-    def generate_report(self, df: pd.DataFrame) -> str:
-        """Generate a comprehensive report of the AI analysis"""
-        report = []
-        report.append("🎯 PEPE AI CREDIT SCORING REPORT")
-        report.append("=" * 50)
-        report.append(f"Analysis Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        report.append(f"Total Businesses Analyzed: {len(df)}")
-        report.append("")
+    @instrumented('writes', rows_out=lambda summary: summary['written'] if summary else None)
+    def update_firebase_bulk(self, predictions_df: pd.DataFrame, batch_size: int = 500,
+                             max_in_flight: int = 4, max_retries: int = 3) -> Optional[Dict[str, Any]]:
+        """Write predictions with batched commits, several in flight at once
         
-        # Hard filter results
-        filter_counts = df['filter_result'].value_counts()
-        report.append("📊 HARD FILTER RESULTS:")
-        for filter_type, count in filter_counts.items():
-            percentage = (count / len(df)) * 100
-            report.append(f"  {filter_type}: {count} ({percentage:.1f}%)")
-        report.append("")
+        Updates are grouped into batched writes of up to `batch_size` (Firestore's
+        limit is 500) and committed from `max_in_flight` threads. Transient commit
+        errors are retried with backoff. Because a batch is atomic, a batch that
+        still fails is bisected and recommitted so one bad document (e.g. a deleted
+        profile) only fails itself. Returns a summary with written and
+        failed counts, the per-document failures and throughput.
+        """
+        if not self.db:
+            print("❌ Firebase not initialized")
+            return None
         
-        # Credit score distribution
-        if 'predicted_category' in df.columns:
-            category_counts = df['predicted_category'].value_counts()
-            report.append("💳 CREDIT CATEGORY DISTRIBUTION:")
-            for category, count in category_counts.items():
-                percentage = (count / len(df)) * 100
-                report.append(f"  {category}: {count} ({percentage:.1f}%)")
-            report.append("")
+        batch_size = min(batch_size, 500)
+        timestamp = self._server_timestamp()
+        updates = [
+            (business_id, {
+                'creditScore': float(score),
+                'creditCategory': category,
+                'filterResult': filter_result,
+                'aiUpdatedAt': timestamp
+            })
+            for business_id, score, category, filter_result in zip(
+                predictions_df['business_id'],
+                predictions_df['predicted_credit_score'],
+                predictions_df['predicted_category'],
+                predictions_df['filter_result']
+            )
+        ]
+        for column in ('feature_hash', 'model_version', 'top_reasons'):
+            if column in predictions_df.columns:
+                for (_, update_data), value in zip(updates, predictions_df[column]):
+                    update_data[PREDICTION_FIELDS[column]] = _hash_hex(value) if column == 'feature_hash' else value
+        chunks = [updates[i:i + batch_size] for i in range(0, len(updates), batch_size)]
+        businesses = self.db.collection('businesses')
         
-        # Score statistics
-        if 'predicted_credit_score' in df.columns:
-            scores = df['predicted_credit_score']
-            report.append("📈 CREDIT SCORE STATISTICS:")
-            report.append(f"  Average Score: {scores.mean():.1f}")
-            report.append(f"  Median Score: {scores.median():.1f}")
-            report.append(f"  Min Score: {scores.min():.1f}")
-            report.append(f"  Max Score: {scores.max():.1f}")
-            report.append("")
+        def commit_chunk(chunk: List[Tuple[str, Dict]]) -> Tuple[int, List[Dict]]:
+            def commit():
+                batch = self.db.batch()
+                for business_id, update_data in chunk:
+                    batch.update(businesses.document(business_id), update_data)
+                batch.commit()
+            try:
+                call_with_retries(commit, max_retries=max_retries)
+                return len(chunk), []
+            except Exception as e:
+                if len(chunk) == 1:
+                    return 0, [{'business_id': chunk[0][0], 'error': str(e)}]
+                # Bisect the batch to isolate the failing documents
+                middle = len(chunk) // 2
+                left_written, left_failures = commit_chunk(chunk[:middle])
+                right_written, right_failures = commit_chunk(chunk[middle:])
+                return left_written + right_written, left_failures + right_failures
         
-        # Feature importance insights
-        if len(df) > 0:
-            report.append("🔍 BUSINESS INSIGHTS:")
-            high_amount = df[df['amount'] > df['amount'].median()]
-            report.append(f"  High-revenue businesses: {len(high_amount)} ({len(high_amount)/len(df)*100:.1f}%)")
-            
-            recent_activity = df[df['days_since_last_transaction'] <= 30]
-            report.append(f"  Recently active: {len(recent_activity)} ({len(recent_activity)/len(df)*100:.1f}%)")
-            
-            high_customers = df[df['customer_number'] >= 5]
-            report.append(f"  Diverse customer base (5+): {len(high_customers)} ({len(high_customers)/len(df)*100:.1f}%)")
+        start = time.perf_counter()
+        written, failures, commits = 0, [], 0
+        with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+            for chunk_written, chunk_failures in executor.map(commit_chunk, chunks):
+                written += chunk_written
+                failures.extend(chunk_failures)
+                commits += 1
+        elapsed = time.perf_counter() - start
         
-        return "\n".join(report)
+        summary = {
+            'written': written,
+            'failed': len(failures),
+            'failures': failures,
+            'commits': commits,
+            'seconds': round(elapsed, 3),
+            'docs_per_sec': round(written / elapsed, 1) if elapsed > 0 else None,
+        }
+        self.metrics.count('firestore_writes', written)
+        self.metrics.count('firestore_commits', commits)
+        self.metrics.count('firestore_write_failures', len(failures))
+        print(f"✅ Updated {written} business profiles in Firebase "
+              f"({summary['docs_per_sec']} docs/sec, {len(failures)} failed)")
+        for failure in failures[:10]:
+            print(f"  ❌ {failure['business_id']}: {failure['error']}")
+        return summary
+    
+    def changed_predictions(self, predictions_df: pd.DataFrame, previous: pd.DataFrame) -> pd.DataFrame:
+        """Rows of `predictions_df` whose score, category, filter result or reasons differ from `previous`
+        
+        A new hash or model version alone doesn't trigger a write; such rows are
+        just rescored again next run.
+        """
+        stored = previous.drop_duplicates('business_id', keep='last').set_index('business_id')
+        stored = stored.reindex(predictions_df['business_id'].to_numpy())
+        changed = stored['predicted_credit_score'].isna().to_numpy(copy=True)
+        changed |= (stored['predicted_credit_score'].to_numpy(dtype=float)
+                    != predictions_df['predicted_credit_score'].to_numpy(dtype=float))
+        for column in ('predicted_category', 'filter_result'):
+            changed |= stored[column].to_numpy(dtype=object) != predictions_df[column].to_numpy(dtype=object)
+        if 'top_reasons' in predictions_df.columns:
+            reasons = predictions_df['top_reasons'].to_numpy(dtype=object)
+            stored_reasons = stored['top_reasons'].to_numpy(dtype=object)
+            changed |= (stored_reasons != reasons) & ~(pd.isna(stored_reasons) & pd.isna(reasons))
+        
+        skipped = int((~changed).sum())
+        self.metrics.count('writes_skipped', skipped)
+        if len(predictions_df):
+            print(f"♻️  Skipping {skipped} unchanged profiles, writing {int(changed.sum())} "
+                  f"(skip ratio {skipped / len(predictions_df):.1%})")
+        return predictions_df.loc[changed]
+    
+    def fetch_stored_predictions(self) -> Optional[pd.DataFrame]:
+        """Read the predictions currently stored on the business profiles
+        
+        Returns one row per profile that has been scored before, with the
+        prediction columns of `predict_credit_scores`.
+        """
+        if not self.db:
+            return None
+        rows = []
+        for profile_doc in self.fetch_business_profiles(self.db, list(PREDICTION_FIELDS.values())):
+            if not self.in_shard(profile_doc.id):
+                continue
+            profile_data = profile_doc.to_dict()
+            if 'creditCategory' not in profile_data:
+                continue
+            row = {'business_id': profile_doc.id}
+            for column, field in PREDICTION_FIELDS.items():
+                row[column] = profile_data.get(field)
+            # Stored as hex: Firestore integers are signed 64-bit
+            feature_hash = row['feature_hash']
+            row['feature_hash'] = int(feature_hash, 16) if isinstance(feature_hash, str) else None
+            rows.append(row)
+        self.metrics.count('firestore_queries', self.profile_scan_stats['pages'])
+        self.metrics.count('firestore_reads', self.profile_scan_stats['reads'])
+        stored = pd.DataFrame(rows, columns=['business_id'] + list(PREDICTION_FIELDS))
+        return stored.astype({'feature_hash': 'UInt64'})
+    
+    def save_stored_predictions(self, predictions: pd.DataFrame, path: str, output_format: str = 'csv'):
+        """Write the score cache: each business's prediction columns, for `load_stored_predictions`"""
+        with PredictionWriter(path, output_format) as writer:
+            writer.write(predictions.reindex(columns=['business_id'] + list(PREDICTION_FIELDS)))
+    
+    def load_stored_predictions(self, path: str) -> Optional[pd.DataFrame]:
+        """Read a previous run's score cache or predictions file, if it exists and carries feature hashes"""
+        if not os.path.exists(path):
+            return None
+        try:
+            previous = read_predictions(path)
+        except ValueError:
+            # Hashes written as hex by older runs; everything is rescored once
+            return None
+        if 'feature_hash' not in previous.columns:
+            return None
+        # Files from runs without explanations have no top_reasons
+        return previous.reindex(columns=['business_id'] + list(PREDICTION_FIELDS))
+    
+    def _server_timestamp(self) -> Any:
+        """Firestore server timestamp sentinel, or local time for non-SDK clients"""
+        if FIREBASE_AVAILABLE:
+            from firebase_admin import firestore
+            return firestore.SERVER_TIMESTAMP
+        return datetime.now()
+    
+    @instrumented('output')
+    def write_predictions(self, predictions: pd.DataFrame, path: str, output_format: str = 'csv',
+                          chunk_size: int = 50000, history: Optional[ScoreHistory] = None) -> pd.DataFrame:
+        """Write predictions to `path` (and `history`) in chunks of `chunk_size` rows"""
+        with PredictionWriter(path, output_format) as writer:
+            for start in range(0, len(predictions), chunk_size):
+                chunk = predictions.iloc[start:start + chunk_size]
+                writer.write(chunk)
+                if history is not None:
+                    history.write(chunk)
+        return predictions
+    
+    @instrumented('report', rows_out=lambda report: None)
+    def generate_report(self, df: pd.DataFrame) -> str:
+        """Generate a comprehensive report of the AI analysis"""
+        return ReportAccumulator().update(df).render()
+
+def _sum_counts(counts: List[Dict[str, int]]) -> Dict[str, int]:
+    """Add up several name -> count dicts"""
+    total: Dict[str, int] = {}
+    for part in counts:
+        for name, value in part.items():
+            total[name] = total.get(name, 0) + value
+    return total
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parse command line options for `main`"""
+    parser = argparse.ArgumentParser(description="Firebase to PepeAI credit scoring integration")
+    parser.add_argument('--mode', choices=['train', 'score-only'], default='train',
+                        help="train and save a new model, or score with the saved model without training")
+    parser.add_argument('--model-dir', default='pepe_model', help="directory of the saved model and manifest")
+    parser.add_argument('--cache-dir', help="directory for the local columnar data cache (disabled if omitted)")
+    parser.add_argument('--cache-ttl-hours', type=float, default=24.0, help="cache entry lifetime")
+    parser.add_argument('--clear-cache', action='store_true', help="invalidate all cache entries before running")
+    parser.add_argument('--fetch', action='store_true',
+                        help="fetch businesses and invoices from Firestore instead of the JSON export")
+    parser.add_argument('--bulk-fetch', action='store_true',
+                        help="with --fetch, scan all invoices once instead of querying each business")
+    parser.add_argument('--fetch-workers', type=int,
+                        help="with --fetch, query this many businesses concurrently")
+    parser.add_argument('--scan-checkpoint',
+                        help="with --fetch, checkpoint the per-business fetch here and resume it if interrupted")
+    parser.add_argument('--invoice-counts',
+                        help="with --fetch, invoice counts of the previous fetch; businesses below the minimum "
+                             "are counted before their invoices are downloaded, and the file is rewritten")
+    parser.add_argument('--stream', action='store_true',
+                        help="score the JSON export in bounded-memory chunks instead of loading it whole")
+    parser.add_argument('--chunk-size', type=int, default=50000,
+                        help="rows per chunk in --stream mode and per predictions file write")
+    parser.add_argument('--output-format', choices=OUTPUT_FORMATS, default='csv',
+                        help="predictions file format (parquet and arrow are zstd-compressed, need pyarrow)")
+    parser.add_argument('--history-dir',
+                        help="also append the predictions to a score history dataset partitioned by run date")
+    parser.add_argument('--history-format', choices=['parquet', 'arrow'], default='parquet',
+                        help="file format of the --history-dir dataset")
+    parser.add_argument('--partition-by-industry', action='store_true',
+                        help="partition the --history-dir dataset by industry within each run date")
+    parser.add_argument('--run-id', help="identifies this run's files in --history-dir (default: start time)")
+    parser.add_argument('--search', action='store_true',
+                        help="train with a cross-validated parameter search (hist/QuantileDMatrix, process pool)")
+    parser.add_argument('--cv-folds', type=int, default=5, help="folds per --search trial")
+    parser.add_argument('--search-workers', type=int, help="--search worker processes (default: one per core)")
+    parser.add_argument('--external-memory', action='store_true',
+                        help="with --stream --search, page the training matrix to disk instead of memory")
+    parser.add_argument('--top-reasons', type=int, default=3, metavar='K',
+                        help="store the K strongest reasons behind each passing business's score (0 to skip)")
+    parser.add_argument('--bookkeeping-columns', action='store_true',
+                        help="also write feature_hash, model_version and top_reasons to the predictions file")
+    parser.add_argument('--exact-reasons', action='store_true',
+                        help="explain model predictions with exact TreeSHAP instead of the faster approximation")
+    parser.add_argument('--force-refresh', action='store_true',
+                        help="rescore and rewrite every business, ignoring stored feature hashes")
+    parser.add_argument('--metrics-json', nargs='?', const=RUN_METRICS_FILE, metavar='PATH',
+                        help=f"also write the per-stage run summary (timings, memory, rows, Firestore ops) "
+                             f"as JSON (default path: {RUN_METRICS_FILE})")
+    parser.add_argument('--prometheus-textfile', help="also write the run metrics in Prometheus text format")
+    parser.add_argument('--profile-stage', help="run this stage (e.g. fetch, features, train) under cProfile")
+    parser.add_argument('--profile-output', default='pepe_profile.prof', help="cProfile stats file")
+    parser.add_argument('--shards', type=int, default=1,
+                        help="split businesses into this many business-ID hash partitions")
+    parser.add_argument('--shard-index', type=int, help="partition processed by this worker (0-based, with --shards)")
+    parser.add_argument('--launch-shards', type=int, metavar='N',
+                        help="run N shard workers in a local process pool, then merge their outputs")
+    parser.add_argument('--shard-workers', type=int,
+                        help="concurrent --launch-shards processes (default: one per core)")
+    parser.add_argument('--merge-shards', type=int, metavar='N',
+                        help="only merge the outputs of N finished shards (e.g. run on other machines)")
+    args = parser.parse_args(argv)
+    if (args.output_format != 'csv' or args.history_dir) and not PARQUET_AVAILABLE:
+        parser.error("--output-format parquet/arrow and --history-dir need pyarrow (pip install pyarrow)")
+    if args.fetch and args.stream:
+        parser.error("--fetch and --stream are exclusive; --stream scores the JSON export")
+    if args.shards > 1 and (args.shard_index is None or not 0 <= args.shard_index < args.shards):
+        parser.error(f"--shards {args.shards} needs a --shard-index from 0 to {args.shards - 1}")
+    return args
+
+def print_run_metrics(summary: Dict[str, Any]):
+    """Print the per-stage table of a `RunMetrics` summary"""
+    print(f"\n⏱️  Run metrics ({summary['elapsed_seconds']}s total):")
+    for name, entry in summary['stages'].items():
+        rows = f"{entry['rows_in'] if entry['rows_in'] is not None else '-'} -> " \
+               f"{entry['rows_out'] if entry['rows_out'] is not None else '-'}"
+        peak = f", peak RSS {entry['peak_rss_mb']} MB" if entry['peak_rss_mb'] is not None else ''
+        print(f"  {name}: {entry['wall_seconds']:.3f}s wall, {entry['cpu_seconds']:.3f}s CPU, "
+              f"{entry['calls']} calls, rows {rows}{peak}")
+    for name, value in summary['counters'].items():
+        print(f"  {name}: {value}")
+    if summary['filter_counts']:
+        print(f"  filter results: {summary['filter_counts']}")
+
+def merge_run_metrics(summaries: List[Dict[str, Any]], elapsed_seconds: Optional[float] = None) -> Dict[str, Any]:
+    """Combine the `RunMetrics` summaries of several shards
+    
+    Stage times, calls, rows and counters add up over shards; peak RSS is the
+    largest single shard's. `elapsed_seconds` defaults to the slowest shard.
+    """
+    merged: Dict[str, Any] = {
+        'started_at': min(summary['started_at'] for summary in summaries),
+        'elapsed_seconds': round(elapsed_seconds if elapsed_seconds is not None
+                                 else max(summary['elapsed_seconds'] for summary in summaries), 3),
+        'memory_scope': summaries[0]['memory_scope'],
+        'shards': len(summaries),
+        'stages': {},
+        'counters': _sum_counts([summary['counters'] for summary in summaries]),
+        'filter_counts': _sum_counts([summary['filter_counts'] for summary in summaries]),
+    }
+    for summary in summaries:
+        for name, entry in summary['stages'].items():
+            target = merged['stages'].setdefault(name, {
+                'calls': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0,
+                'rows_in': None, 'rows_out': None, 'peak_rss_mb': None,
+            })
+            target['calls'] += entry['calls']
+            target['wall_seconds'] = round(target['wall_seconds'] + entry['wall_seconds'], 4)
+            target['cpu_seconds'] = round(target['cpu_seconds'] + entry['cpu_seconds'], 4)
+            for field in ('rows_in', 'rows_out'):
+                if entry[field] is not None:
+                    target[field] = (target[field] or 0) + entry[field]
+            if entry['peak_rss_mb'] is not None:
+                target['peak_rss_mb'] = max(target['peak_rss_mb'] or 0.0, entry['peak_rss_mb'])
+    return merged
+
+def _concat_prediction_files(paths: List[str], output_path: str, output_format: str):
+    """Append shard prediction files into one file without loading them whole"""
+    if output_format == 'csv':
+        with open(output_path, 'w') as output:
+            for n, path in enumerate(paths):
+                with open(path, 'r') as f:
+                    header = f.readline()
+                    if n == 0:
+                        output.write(header)
+                    shutil.copyfileobj(f, output)
+        return
+    import pyarrow
+    import pyarrow.parquet as pq
+    with PredictionWriter(output_path, output_format) as writer:
+        for path in paths:
+            if output_format == 'parquet':
+                parquet_file = pq.ParquetFile(path)
+                for row_group in range(parquet_file.num_row_groups):
+                    writer.write_table(parquet_file.read_row_group(row_group))
+            else:
+                with pyarrow.memory_map(path) as source:
+                    reader = pyarrow.ipc.open_file(source)
+                    for batch in range(reader.num_record_batches):
+                        writer.write_table(pyarrow.Table.from_batches([reader.get_batch(batch)]))
 
-def main():
+def merge_shard_outputs(shards: int, args: argparse.Namespace, elapsed_seconds: Optional[float] = None) -> bool:
+    """Combine the outputs of `shards` finished shard workers into the unsharded files
+    
+    Every shard writes its `ReportAccumulator` last, so a missing aggregates file
+    means that shard did not finish. Predictions files are concatenated, the
+    report is rendered from the merged accumulators without reading them back, and
+    the shard metrics are merged, then written to `--metrics-json` if given.
+    """
+    shard_ids = [(index, shards) for index in range(shards)]
+    predictions_file = f"ai_credit_predictions.{args.output_format}"
+    unfinished = [index for index, count in shard_ids
+                  if not os.path.exists(shard_path('ai_report_aggregates.json', (index, count)))]
+    if unfinished:
+        print(f"❌ Shards {unfinished} of {shards} have not finished; nothing merged")
+        return False
+    
+    print(f"\n🧩 Merging {shards} shards...")
+    accumulator = ReportAccumulator()
+    for shard in shard_ids:
+        with open(shard_path('ai_report_aggregates.json', shard), 'r') as f:
+            accumulator.merge(ReportAccumulator.from_dict(json.load(f)))
+    with open('ai_report_aggregates.json', 'w') as f:
+        json.dump(accumulator.to_dict(), f)
+    
+    # An empty shard writes no predictions file
+    paths = [path for path in (shard_path(predictions_file, shard) for shard in shard_ids) if os.path.exists(path)]
+    _concat_prediction_files(paths, predictions_file, args.output_format)
+    print(f"✅ Merged {accumulator.rows} predictions from {shards} shards -> {predictions_file}")
+    
+    if accumulator.rows:
+        report = accumulator.render()
+        print(report)
+        with open('ai_analysis_report.txt', 'w') as f:
+            f.write(report)
+        print("  - ai_analysis_report.txt")
+    
+    summaries = []
+    for shard in shard_ids:
+        metrics_path = shard_path(args.metrics_json or RUN_METRICS_FILE, shard)
+        if os.path.exists(metrics_path):
+            with open(metrics_path, 'r') as f:
+                summaries.append(json.load(f))
+    if summaries:
+        merged_metrics = merge_run_metrics(summaries, elapsed_seconds)
+        print_run_metrics(merged_metrics)
+        if args.metrics_json:
+            with open(args.metrics_json, 'w') as f:
+                json.dump(merged_metrics, f, indent=2)
+        if args.prometheus_textfile:
+            RunMetrics().write_prometheus(args.prometheus_textfile, summary=merged_metrics)
+    return True
+
+def _strip_options(argv: List[str], names: Tuple[str, ...]) -> List[str]:
+    """`argv` without the given valued options (`--name value` or `--name=value`)"""
+    kept, skip_value = [], False
+    for arg in argv:
+        if skip_value:
+            skip_value = False
+        elif arg in names:
+            skip_value = True
+        elif arg.split('=', 1)[0] not in names:
+            kept.append(arg)
+    return kept
+
+def _run_shard(argv: List[str], log_path: str, nthread: int) -> float:
+    """Run `main` for one shard in a launcher worker process, logging to `log_path`"""
+    _pin_worker_threads(nthread)
+    start = time.perf_counter()
+    with open(log_path, 'w') as log, redirect_stdout(log), redirect_stderr(log):
+        main(argv)
+    return time.perf_counter() - start
+
+def launch_shards(shards: int, argv: List[str], args: argparse.Namespace) -> bool:
+    """Run every shard of `argv` in a local spawn process pool, then merge their outputs
+    
+    Each worker process gets an equal share of the cores for its thread pools
+    and logs to `ai_shard.shard-{i}-of-{N}.log`.
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    
+    cores = os.cpu_count() or 1
+    workers = max(1, min(args.shard_workers or cores, shards))
+    nthread = max(1, cores // workers)
+    shard_argv = _strip_options(argv, ('--launch-shards', '--shard-workers', '--shards', '--shard-index'))
+    if args.history_dir and not args.run_id:
+        # One run ID for all shards, so their history files belong to the same run
+        shard_argv += ['--run-id', datetime.now().strftime('%Y%m%dT%H%M%S')]
+    print(f"🚀 Launching {shards} shards on {workers} processes ({nthread} threads each)")
+    
+    start = time.perf_counter()
+    failed = []
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+        futures = {}
+        for index in range(shards):
+            log_path = shard_path('ai_shard.log', (index, shards))
+            future = executor.submit(_run_shard, shard_argv + ['--shards', str(shards), '--shard-index', str(index)],
+                                     log_path, nthread)
+            futures[future] = (index, log_path)
+        for future in as_completed(futures):
+            index, log_path = futures[future]
+            try:
+                print(f"  ✅ Shard {index} finished in {future.result():.1f}s (log: {log_path})")
+            except Exception as e:
+                failed.append(index)
+                print(f"  ❌ Shard {index} failed: {e} (log: {log_path})")
+    
+    if failed:
+        print(f"❌ {len(failed)} shards failed; rerun them with --shards {shards} --shard-index i, "
+              f"then --merge-shards {shards}")
+        return False
+    return merge_shard_outputs(shards, args, elapsed_seconds=time.perf_counter() - start)
+
+def main(argv: Optional[List[str]] = None):
     """Main execution function"""
-    print("🚀 Starting Firebase-PepeAI Integration")
+    args = parse_args(argv)
+    if args.launch_shards:
+        launch_shards(args.launch_shards, sys.argv[1:] if argv is None else list(argv), args)
+        return
+    if args.merge_shards:
+        merge_shard_outputs(args.merge_shards, args)
+        return
+    
+    shard = (args.shard_index, args.shards) if args.shards > 1 else None
+    print("🚀 Starting Firebase-PepeAI Integration" + (f" (shard {shard[0]} of {shard[1]})" if shard else ""))
     print("=" * 50)
     
-    # Initialize integration
-    integration = FirebaseAIIntegration()
+    # Initialize integration; shards keep separate caches so their index files don't race
+    cache_dir = args.cache_dir
+    if cache_dir and shard:
+        cache_dir = os.path.join(cache_dir, f"shard-{shard[0]}-of-{shard[1]}")
+    profile_output = shard_path(args.profile_output, shard)
+    metrics = RunMetrics(profile_stage=args.profile_stage, profile_path=profile_output)
+    integration = FirebaseAIIntegration(cache_dir=cache_dir, cache_ttl_seconds=args.cache_ttl_hours * 3600,
+                                        metrics=metrics, shard=shard)
+    try:
+        run_pipeline(integration, args)
+    finally:
+        print_run_metrics(metrics.summary())
+        # Shard workers always write theirs for the merge step
+        if args.metrics_json or shard:
+            metrics.write_json(shard_path(args.metrics_json or RUN_METRICS_FILE, shard))
+        if args.prometheus_textfile:
+            metrics.write_prometheus(shard_path(args.prometheus_textfile, shard))
+        if args.profile_stage and metrics.profiler:
+            print(f"  cProfile stats for {args.profile_stage} saved to {profile_output}")
+
+@contextmanager
+def open_history(args: argparse.Namespace, shard: Optional[Tuple[int, int]] = None) -> Iterator[Optional[ScoreHistory]]:
+    """The `--history-dir` dataset this run appends to, or None without one"""
+    if not args.history_dir:
+        yield None
+        return
+    with ScoreHistory(args.history_dir, args.history_format, args.partition_by_industry,
+                      run_id=args.run_id, shard=shard) as history:
+        yield history
+
+def run_pipeline(integration: 'FirebaseAIIntegration', args: argparse.Namespace):
+    """Load, train, score, report and write back, as configured by `args`"""
+    if integration.cache and args.clear_cache:
+        removed = integration.cache.invalidate()
+        print(f"🗑️  Cleared {removed} cache entries")
+    
+    if args.mode == 'score-only' and not integration.load_model(args.model_dir):
+        print("❌ score-only mode needs a saved model; run with --mode train first")
+        return
+    
+    # All shards of a run must score with the same model, so they never train on
+    # their own partition: they use the saved model if there is one, else the formula
+    train = args.mode == 'train'
+    if train and integration.shard:
+        train = False
+        if not integration.load_model(args.model_dir):
+            print("⚠️  No saved model; this shard scores with the formula")
+    aggregates_file = shard_path('ai_report_aggregates.json', integration.shard)
+    if integration.shard and os.path.exists(aggregates_file):
+        os.remove(aggregates_file)
     
     # Option 1: Load from exported JSON file (if available)
     json_file = "business_ai_training_data.json"
-    if os.path.exists(json_file):
+    if args.stream:
+        if not os.path.exists(json_file):
+            print(f"❌ {json_file} not found, nothing to stream")
+            return
+        # Streaming only trains with --search (from the chunks); otherwise it uses the
+        # saved model in score-only mode and the formula in train mode
+        if train and args.search:
+            print("\n🤖 Training XGBoost Model from chunks...")
+            result = integration.train_xgboost_search(
+                chunks=lambda: integration.iter_json_chunks(json_file, args.chunk_size),
+                n_folds=args.cv_folds, n_workers=args.search_workers, external_memory=args.external_memory
+            )
+            if result is not None:
+                integration.save_model(args.model_dir)
+        output_file = shard_path(f"ai_credit_predictions.{args.output_format}", integration.shard)
+        print(f"📁 Streaming {json_file} in chunks of {args.chunk_size}")
+        with open_history(args, integration.shard) as history:
+            summary = integration.score_json_stream(json_file, output_file, args.chunk_size, args.output_format,
+                                                    history=history, top_reasons=args.top_reasons,
+                                                    exact_reasons=args.exact_reasons,
+                                                    bookkeeping_columns=args.bookkeeping_columns)
+        report = summary['report'].render()
+        print(report)
+        report_file = shard_path('ai_analysis_report.txt', integration.shard)
+        with open(report_file, 'w') as f:
+            f.write(report)
+        print(f"  - {report_file}")
+        if integration.shard:
+            with open(aggregates_file, 'w') as f:
+                json.dump(summary['report'].to_dict(), f)
+        print("\n🎉 Integration Complete!")
+        return
+    
+    if args.fetch:
+        # Option 2: Fetch from Firestore
+        if not integration.db:
+            print("❌ --fetch needs a Firebase connection")
+            return
+        counts_path = shard_path(args.invoice_counts, integration.shard) if args.invoice_counts else None
+        known_counts = integration.load_invoice_counts(counts_path) if counts_path else None
+        df = integration.fetch_businesses_from_firebase(bulk=args.bulk_fetch, max_workers=args.fetch_workers,
+                                                        checkpoint_path=args.scan_checkpoint,
+                                                        known_counts=known_counts)
+        if counts_path and integration.invoice_counts:
+            integration.save_invoice_counts(counts_path, known_counts)
+    elif os.path.exists(json_file):
         print(f"📁 Loading data from {json_file}")
         df = integration.load_sample_data_from_json(json_file)
     else:
         print("📁 JSON file not found, using sample data generation")
+        if integration.shard:
+            # Every shard must draw the same sample businesses to split them
+            np.random.seed(42)
         # Generate sample data for demonstration
         sample_data = []
         for i in range(20):
@@ -498,15 +3724,41 @@ def main():
         print("❌ No data available for processing")
         return
     
+    if integration.shard:
+        df = integration.shard_frame(df)
+        if df.empty:
+            print("✅ No businesses in this shard")
+            with open(aggregates_file, 'w') as f:
+                json.dump(ReportAccumulator().to_dict(), f)
+            return
+    
     print(f"✅ Loaded {len(df)} businesses for analysis")
     
     # Train XGBoost model
-    print("\n🤖 Training XGBoost Model...")
-    model = integration.train_xgboost_model(df)
+    if train:
+        print("\n🤖 Training XGBoost Model...")
+        if args.search:
+            result = integration.train_xgboost_search(df, n_folds=args.cv_folds, n_workers=args.search_workers)
+            model = result['model'] if result else None
+        else:
+            model = integration.train_xgboost_model(df)
+        if model is not None:
+            integration.save_model(args.model_dir)
     
-    # Generate predictions
+    # Generate predictions, reusing those whose inputs and model are unchanged
     print("\n🎯 Generating Credit Score Predictions...")
-    predictions = integration.predict_credit_scores(df)
+    predictions_file = shard_path(f"ai_credit_predictions.{args.output_format}", integration.shard)
+    report_file = shard_path('ai_analysis_report.txt', integration.shard)
+    # Without Firestore, the previous run's predictions come from the score cache
+    score_cache = shard_path(f"ai_score_cache.{args.output_format}", integration.shard)
+    previous = None
+    if not args.force_refresh:
+        previous = (integration.fetch_stored_predictions() if integration.db
+                    else integration.load_stored_predictions(score_cache))
+    predictions = integration.predict_credit_scores(df, previous=previous, force_refresh=args.force_refresh,
+                                                    with_hashes=True)
+    if args.top_reasons:
+        predictions = integration.explain_predictions(predictions, args.top_reasons, args.exact_reasons)
     
     # Generate report
     print("\n📊 Generating Analysis Report...")
@@ -515,19 +3767,38 @@ def main():
     
     # Save results
     print("\n💾 Saving Results...")
-    predictions.to_csv('ai_credit_predictions.csv', index=False)
+    output = predictions
+    if not args.bookkeeping_columns:
+        output = predictions.drop(columns=BOOKKEEPING_COLUMNS, errors='ignore')
+    with open_history(args, integration.shard) as history:
+        integration.write_predictions(output, predictions_file, args.output_format, args.chunk_size, history)
+    if not integration.db:
+        integration.save_stored_predictions(predictions, score_cache, args.output_format)
     
-    with open('ai_analysis_report.txt', 'w') as f:
+    with open(report_file, 'w') as f:
         f.write(report)
     
     print("✅ Results saved to:")
-    print("  - ai_credit_predictions.csv")
-    print("  - ai_analysis_report.txt")
+    print(f"  - {predictions_file}")
+    print(f"  - {report_file}")
+    if not integration.db:
+        print(f"  - {score_cache} (feature hashes for the next run)")
+    if args.history_dir:
+        print(f"  - {args.history_dir} (score history)")
     
     # Update Firebase if connected
     if integration.db:
         print("\n🔄 Updating Firebase with predictions...")
-        integration.update_firebase_with_predictions(predictions)
+        integration.update_firebase_with_predictions(predictions, previous=previous, force_refresh=args.force_refresh)
+    
+    if integration.cache:
+        integration.cache.flush()
+        print(f"\n🗄️  Cache: {integration.cache.stats()}")
+    
+    # Written last: the merge step takes it as the sign that this shard finished
+    if integration.shard:
+        with open(aggregates_file, 'w') as f:
+            json.dump(ReportAccumulator().update(predictions).to_dict(), f)
     
     print("\n🎉 Integration Complete!")
 
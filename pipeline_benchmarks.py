@@ -0,0 +1,835 @@
+"""
+PepeAI Pipeline Benchmarks
+==========================
+
+Benchmarks for the Firebase-PepeAI integration, run against the in-memory
+`fake_firestore.FakeFirestore` so no credentials or network are needed.
+
+Usage:
+    python pipeline_benchmarks.py fetch --businesses 200 --latency-ms 20 --workers 16
+    python pipeline_benchmarks.py indexed --businesses 2000 --invoices 10 --latency-ms 20
+    python pipeline_benchmarks.py writes --businesses 2000 --latency-ms 5
+    python pipeline_benchmarks.py features --businesses 10000 --invoices 1000000
+    python pipeline_benchmarks.py scoring --businesses 1000000
+    python pipeline_benchmarks.py loader --businesses 500000 --chunk-size 50000
+    python pipeline_benchmarks.py transactions --businesses 10000 --invoices 100
+    python pipeline_benchmarks.py output --businesses 500000 --chunk-size 50000
+    python pipeline_benchmarks.py explain --businesses 200000 --top-k 3
+    python pipeline_benchmarks.py e2e --profile small --check benchmark_thresholds.json
+    python pipeline_benchmarks.py e2e --profile large --output e2e_large.json
+"""
+
+import argparse
+import gc
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Callable, Dict, Any, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from fake_firestore import FakeFirestore, populate_synthetic, populate_tenant
+from firebase_ai_integration import (
+    FirebaseAIIntegration, PredictionWriter, ScoreHistory, firestore_document_size, read_predictions
+)
+
+
+def bench_fetch(n_businesses: int = 200, invoices_per_business: int = 20, latency_ms: float = 20.0,
+                workers: int = 16, rate_limit: float = 0.0, seed: int = 42) -> Dict[str, Any]:
+    """Compare sequential and concurrent per-business fetches under simulated latency
+    
+    Profiles carry stored predictions, as after a scoring run, so the profile
+    bytes show what the projected scan saves over reading whole documents.
+    """
+    db = FakeFirestore(latency=latency_ms / 1000.0)
+    populate_synthetic(db, n_businesses, invoices_per_business, seed=seed)
+    profiles = db._collections['businesses']
+    for data in profiles.values():
+        data.update({'creditCategory': 'good', 'filterResult': 'pass', 'aiFeatureHash': '0' * 16,
+                     'aiModelVersion': '0' * 12, 'lastAIUpdate': datetime.now()})
+    full_profile_bytes = sum(firestore_document_size(['businesses', business_id], data)
+                             for business_id, data in profiles.items())
+
+    integration = FirebaseAIIntegration()
+    integration.db = db
+
+    start = time.perf_counter()
+    sequential = integration.fetch_businesses_from_firebase()
+    sequential_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    concurrent = integration.fetch_businesses_concurrent(max_workers=workers, rate_limit=rate_limit or None)
+    concurrent_seconds = time.perf_counter() - start
+
+    pd.testing.assert_frame_equal(sequential, concurrent)
+
+    return {
+        'businesses': n_businesses,
+        'latency_ms': latency_ms,
+        'workers': workers,
+        'sequential_seconds': round(sequential_seconds, 3),
+        'concurrent_seconds': round(concurrent_seconds, 3),
+        'speedup': round(sequential_seconds / concurrent_seconds, 2) if concurrent_seconds else None,
+        'outputs_match': True,
+        'profile_pages': integration.fetch_stats['profile_pages'],
+        'profile_docs': integration.fetch_stats['profile_docs'],
+        'profile_bytes': integration.fetch_stats['profile_bytes'],
+        'unprojected_profile_bytes': full_profile_bytes,
+    }
+
+
+def bench_indexed(n_businesses: int = 2000, invoices_per_business: int = 10, latency_ms: float = 20.0,
+                  workers: int = 16, grow_rate: float = 0.05, seed: int = 42) -> Dict[str, Any]:
+    """Compare the concurrent per-business fetch with and without `known_counts`
+    
+    The unindexed run fetches a heavy-tailed tenant and leaves its
+    `invoice_counts`, which the indexed run takes as `known_counts`. Before the
+    grown run, a `grow_rate` fraction of the businesses below the invoice minimum
+    get enough new invoices to reach it, so their count queries are wasted. Every
+    run must return the same rows as an unindexed fetch of the same data.
+    """
+    db = FakeFirestore(latency=latency_ms / 1000.0)
+    n_invoices = populate_tenant(db, n_businesses, invoices_per_business, seed=seed)
+    
+    def fetch(known_counts: Optional[Dict[str, int]]) -> Tuple[FirebaseAIIntegration, pd.DataFrame, Dict]:
+        integration = FirebaseAIIntegration()
+        integration.db = db
+        db.reset_stats()
+        start = time.perf_counter()
+        df = integration.fetch_businesses_concurrent(max_workers=workers, known_counts=known_counts)
+        run = {'seconds': round(time.perf_counter() - start, 3), 'queries': db.stats['queries'],
+               'reads': db.stats['reads']}
+        return integration, df, run
+    
+    def compare(run: Dict, baseline: Dict, integration: FirebaseAIIntegration, df: pd.DataFrame,
+                plain: pd.DataFrame):
+        run['seconds_saved'] = round(baseline['seconds'] - run['seconds'], 3)
+        run['reads_saved'] = baseline['reads'] - run['reads']
+        for key in ('stages', 'invoices_avoided', 'unindexed_reads'):
+            run[key] = integration.fetch_stats[key]
+        run['rows_match'] = bool(list(plain['business_id']) == list(df['business_id']) and
+                                 plain['transaction_count'].equals(df['transaction_count']))
+    
+    result: Dict[str, Any] = {'businesses': n_businesses, 'invoices': n_invoices,
+                              'latency_ms': latency_ms, 'workers': workers}
+    integration, plain, result['unindexed'] = fetch(None)
+    index = dict(integration.invoice_counts)
+    integration, df, result['indexed'] = fetch(index)
+    compare(result['indexed'], result['unindexed'], integration, df, plain)
+    
+    rng = np.random.default_rng(seed)
+    small = sorted(business_id for business_id, count in index.items() if count < 5)
+    grown = rng.choice(small, size=int(len(small) * grow_rate), replace=False) if small else []
+    now = datetime.now()
+    for business_id in grown:
+        for k in range(index[business_id], 5):
+            db.add_document('invoices', f'{business_id}-NEW{k:05d}', {
+                'businessId': business_id, 'createdAt': now, 'total': 100.0, 'status': 'paid',
+                'customerEmail': f'new{k}@{business_id.lower()}.my', 'dueDate': now,
+            })
+    _, plain, result['grown_unindexed'] = fetch(None)
+    integration, df, result['grown'] = fetch(index)
+    compare(result['grown'], result['grown_unindexed'], integration, df, plain)
+    result['grown']['businesses_grown'] = len(grown)
+    return result
+
+
+def bench_writes(n_businesses: int = 2000, latency_ms: float = 5.0, batch_size: int = 500,
+                 max_in_flight: int = 4, seed: int = 42) -> Dict[str, Any]:
+    """Compare one update per document with batched bulk writes"""
+    db = FakeFirestore(latency=latency_ms / 1000.0)
+    populate_synthetic(db, n_businesses, invoices_per_business=0, seed=seed)
+    predictions = pd.DataFrame({
+        'business_id': [f'BIZ{b:05d}' for b in range(n_businesses)],
+        'predicted_credit_score': np.random.default_rng(seed).uniform(300, 900, n_businesses),
+        'predicted_category': 'good',
+        'filter_result': 'pass',
+    })
+
+    integration = FirebaseAIIntegration()
+    integration.db = db
+
+    start = time.perf_counter()
+    integration.update_firebase_with_predictions(predictions)
+    per_document_seconds = time.perf_counter() - start
+
+    summary = integration.update_firebase_with_predictions(
+        predictions, bulk=True, batch_size=batch_size, max_in_flight=max_in_flight
+    )
+
+    return {
+        'businesses': n_businesses,
+        'latency_ms': latency_ms,
+        'per_document_seconds': round(per_document_seconds, 3),
+        'per_document_docs_per_sec': round(n_businesses / per_document_seconds, 1),
+        'bulk_seconds': summary['seconds'],
+        'bulk_docs_per_sec': summary['docs_per_sec'],
+        'bulk_failed': summary['failed'],
+    }
+
+
+def synthetic_transactions_frame(n_businesses: int, n_invoices: int, seed: int = 42) -> pd.DataFrame:
+    """Build a transactions frame (as from `transactions_to_frame`) with numpy"""
+    rng = np.random.default_rng(seed)
+    business_index = np.sort(rng.integers(0, n_businesses, n_invoices))
+    invoice_date = (np.datetime64('2024-01-01')
+                    + rng.integers(0, 365 * 24 * 3600, n_invoices).astype('timedelta64[s]'))
+    due_date = invoice_date + rng.integers(0, 40 * 24 * 3600, n_invoices).astype('timedelta64[s]')
+    due_date[rng.random(n_invoices) < 0.05] = np.datetime64('NaT')
+    return pd.DataFrame({
+        'business_id': pd.Categorical(np.char.add('BIZ', business_index.astype(str))),
+        'invoice_date': invoice_date.astype('datetime64[ns]'),
+        'invoice_amount': rng.uniform(50, 5000, n_invoices).round(2),
+        'customer_email': pd.Categorical(np.char.add(
+            np.char.add('customer', rng.integers(0, 20, n_invoices).astype(str)),
+            np.char.add('@', business_index.astype(str))
+        )),
+        'payment_status': pd.Categorical(rng.choice(['paid', 'Paid', 'sent', 'overdue', 'draft'], n_invoices)),
+        'due_date': due_date.astype('datetime64[ns]'),
+    })
+
+
+def bench_features(n_businesses: int = 10000, n_invoices: int = 1000000, verify_sample: int = 500,
+                   seed: int = 42) -> Dict[str, Any]:
+    """Time the columnar feature engine against the per-business dict implementation"""
+    transactions = synthetic_transactions_frame(n_businesses, n_invoices, seed)
+    transactions['business_id'] = transactions['business_id'].astype(str)
+    integration = FirebaseAIIntegration()
+    current_date = datetime(2025, 1, 1)
+
+    start = time.perf_counter()
+    features = integration.calculate_ai_features_frame(transactions, current_date=current_date)
+    vectorized_seconds = time.perf_counter() - start
+
+    # Time the dict implementation on a sample of businesses and extrapolate
+    sample_ids = features.index[:verify_sample]
+    sample = transactions[transactions['business_id'].isin(sample_ids)]
+    records = sample.astype({'customer_email': str, 'payment_status': str}).to_dict('records')
+    for record in records:
+        record['invoice_date'] = record['invoice_date'].to_pydatetime()
+        record['due_date'] = None if pd.isna(record['due_date']) else record['due_date'].to_pydatetime()
+    by_business: Dict[str, list] = {}
+    for record in records:
+        by_business.setdefault(record['business_id'], []).append(record)
+
+    start = time.perf_counter()
+    expected = {
+        business_id: integration.calculate_ai_features_from_firebase(rows, current_date=current_date)
+        for business_id, rows in by_business.items()
+    }
+    dict_seconds = time.perf_counter() - start
+
+    expected_df = pd.DataFrame.from_dict(expected, orient='index')[features.columns]
+    pd.testing.assert_frame_equal(
+        features.loc[expected_df.index], expected_df, check_dtype=False, check_names=False
+    )
+
+    return {
+        'businesses': n_businesses,
+        'invoices': n_invoices,
+        'vectorized_seconds': round(vectorized_seconds, 3),
+        'dict_seconds_estimated': round(dict_seconds * n_invoices / max(len(records), 1), 3),
+        'verified_businesses': len(expected),
+        'outputs_match': True,
+    }
+
+
+def synthetic_features_frame(n_businesses: int, seed: int = 42) -> pd.DataFrame:
+    """Build a business features frame shaped like `fetch_businesses_from_firebase` output"""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'business_id': np.char.add('BIZ', np.arange(n_businesses).astype(str)),
+        'business_name': 'Sample Business',
+        'industry': pd.Categorical(rng.choice(['Technology', 'Retail', 'Food & Beverage', 'Services'], n_businesses)),
+        'customer_number': rng.integers(1, 20, n_businesses),
+        'customer_order': rng.uniform(1, 5, n_businesses),
+        'amount': rng.uniform(1000, 50000, n_businesses),
+        'days_since_last_transaction': rng.integers(1, 365, n_businesses),
+        'customer_stickiness': rng.uniform(0, 0.9, n_businesses),
+        'transaction_count': rng.integers(0, 50, n_businesses),
+        'completion_rate': rng.uniform(0.1, 0.95, n_businesses),
+        'clearance_days': rng.uniform(5, 30, n_businesses),
+    })
+
+
+def bench_scoring(n_businesses: int = 1000000, verify_sample: int = 2000, seed: int = 42) -> Dict[str, Any]:
+    """Time batch scoring and check it against the row-wise scalar functions"""
+    df = synthetic_features_frame(n_businesses, seed)
+    integration = FirebaseAIIntegration()
+
+    np.random.seed(seed)
+    start = time.perf_counter()
+    results = integration.predict_credit_scores(df)
+    batch_seconds = time.perf_counter() - start
+
+    # Replay the scalar path on a prefix with the same noise stream
+    sample = df.head(verify_sample)
+    np.random.seed(seed)
+    start = time.perf_counter()
+    expected_scores = []
+    for row in sample.to_dict('records'):
+        if integration.apply_hard_filters(row) == 'pass':
+            expected_scores.append(integration.calculate_credit_score_from_features(row))
+        else:
+            expected_scores.append(300)
+    scalar_seconds = time.perf_counter() - start
+    np.testing.assert_array_equal(results['predicted_credit_score'].to_numpy()[:verify_sample], expected_scores)
+
+    return {
+        'businesses': n_businesses,
+        'batch_seconds': round(batch_seconds, 3),
+        'scalar_seconds_estimated': round(scalar_seconds * n_businesses / verify_sample, 3),
+        'verified_businesses': verify_sample,
+        'outputs_match': True,
+    }
+
+
+def bench_output(n_businesses: int = 500000, chunk_size: int = 50000, seed: int = 42) -> Dict[str, Any]:
+    """Compare write time, file size and trend-query read time of the predictions formats
+    
+    `csv_to_csv` is the single `to_csv` call predictions used to be written with;
+    the others go through `PredictionWriter` in chunks. `history` appends the same
+    rows to an industry-partitioned Parquet score history, `history_flat` to one
+    partitioned by run date only. Rejected businesses come first, so the first
+    chunks carry no `top_reasons`; every Arrow-based output is read back whole
+    and compared with the predictions.
+    """
+    integration = FirebaseAIIntegration()
+    np.random.seed(seed)
+    predictions = integration.predict_credit_scores(synthetic_features_frame(n_businesses, seed), with_hashes=True)
+    predictions = integration.explain_predictions(predictions)
+    predictions = predictions.sort_values('filter_result', key=lambda result: result == 'pass', kind='stable')
+    predictions = predictions.reset_index(drop=True)
+    trend_columns = ['business_id', 'predicted_credit_score']
+    check_columns = ['business_id', 'industry', 'predicted_credit_score', 'predicted_category', 'filter_result',
+                     'feature_hash', 'top_reasons']
+
+    def check_round_trip(name: str, read_back: pd.DataFrame):
+        read_back = read_back.sort_values('business_id').reset_index(drop=True)
+        expected = predictions.sort_values('business_id').reset_index(drop=True)
+        pd.testing.assert_frame_equal(read_back[check_columns].astype(object),
+                                      expected[check_columns].astype(object), obj=name)
+
+    result: Dict[str, Any] = {'businesses': n_businesses, 'chunk_size': chunk_size, 'formats': {}}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        def record(name: str, write: Callable[[], None], path: str, read: Callable[[], pd.DataFrame]):
+            gc.collect()
+            start = time.perf_counter()
+            write()
+            write_seconds = time.perf_counter() - start
+            start = time.perf_counter()
+            rows = len(read())
+            read_seconds = time.perf_counter() - start
+            size = (sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+                    if os.path.isdir(path) else os.path.getsize(path))
+            assert rows == n_businesses
+            result['formats'][name] = {
+                'write_seconds': round(write_seconds, 3),
+                'file_mb': round(size / 1024 ** 2, 2),
+                'trend_read_seconds': round(read_seconds, 3),
+            }
+
+        path = os.path.join(tmp_dir, 'to_csv.csv')
+        record('csv_to_csv', lambda: predictions.to_csv(path, index=False), path,
+               lambda: read_predictions(path, trend_columns))
+        for output_format in ('csv', 'parquet', 'arrow'):
+            path = os.path.join(tmp_dir, f'predictions.{output_format}')
+
+            def write(path=path, output_format=output_format):
+                with PredictionWriter(path, output_format) as writer:
+                    for start in range(0, len(predictions), chunk_size):
+                        writer.write(predictions.iloc[start:start + chunk_size])
+            record(output_format, write, path, lambda path=path: read_predictions(path, trend_columns))
+            if output_format != 'csv':
+                check_round_trip(output_format, read_predictions(path))
+
+        for name, partition_by_industry in (('history', True), ('history_flat', False)):
+            history_dir = os.path.join(tmp_dir, name)
+            history = ScoreHistory(history_dir, partition_by_industry=partition_by_industry, run_id='bench')
+
+            def write_history(history=history):
+                with history:
+                    for start in range(0, len(predictions), chunk_size):
+                        history.write(predictions.iloc[start:start + chunk_size])
+            record(name, write_history, history_dir, lambda history=history: history.read(trend_columns))
+            check_round_trip(name, history.read())
+
+    csv_seconds = result['formats']['csv_to_csv']['write_seconds']
+    for name, entry in result['formats'].items():
+        entry['write_speedup'] = round(csv_seconds / entry['write_seconds'], 2) if entry['write_seconds'] else None
+    return result
+
+
+def bench_explain(n_businesses: int = 200000, top_k: int = 3, train_rows: int = 20000, exact_sample: int = 2000,
+                  seed: int = 42) -> Dict[str, Any]:
+    """Overhead of the batch explanation stage over plain scoring, formula and model paths
+    
+    Also checks that the explanations add up: formula impacts plus the term maxima
+    give the noise-free score, and model contributions plus bias give the margin
+    of the predicted class. Exact TreeSHAP is timed on `exact_sample` rows only.
+    """
+    import xgboost as xgb
+    from firebase_ai_integration import MODEL_FEATURES, SCORE_TERM_MAX, CREDIT_CATEGORIES
+
+    df = synthetic_features_frame(n_businesses, seed)
+    integration = FirebaseAIIntegration()
+    result: Dict[str, Any] = {'businesses': n_businesses, 'top_k': top_k}
+
+    def measure(name: str):
+        np.random.seed(seed)
+        start = time.perf_counter()
+        predictions = integration.predict_credit_scores(df)
+        score_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        explained = integration.explain_predictions(predictions, top_k)
+        explain_seconds = time.perf_counter() - start
+        passed = explained.loc[explained['filter_result'] == 'pass']
+        result[name] = {
+            'explained': len(passed),
+            'score_seconds': round(score_seconds, 3),
+            'explain_seconds': round(explain_seconds, 3),
+            'overhead': round(explain_seconds / score_seconds, 2) if score_seconds else None,
+            'example': passed['top_reasons'].iloc[0] if len(passed) else None,
+        }
+        return passed
+
+    passed = measure('formula')
+    names, impacts = integration.explain_batch(passed)
+    terms = integration.credit_score_terms_batch(passed)
+    expected = 300 + sum(terms.values())
+    result['formula']['adds_up'] = bool(np.allclose(300 + impacts.sum(axis=1) + sum(SCORE_TERM_MAX.values()), expected))
+
+    np.random.seed(seed)
+    integration.train_xgboost_model(df.head(train_rows))
+    passed = measure('model')
+    sample = passed.head(exact_sample)
+    matrix = xgb.DMatrix(sample[MODEL_FEATURES])
+    classes = {category: index for index, category in enumerate(CREDIT_CATEGORIES)}
+    class_index = np.array([classes[category] for category in sample['predicted_category']])
+    margin = integration.model.predict(matrix, output_margin=True)[np.arange(len(sample)), class_index]
+    for exact in (False, True):
+        start = time.perf_counter()
+        contributions = integration.model.predict(matrix, pred_contribs=True, approx_contribs=not exact)
+        seconds = time.perf_counter() - start
+        totals = contributions[np.arange(len(sample)), class_index].sum(axis=1)
+        key = 'exact' if exact else 'approx'
+        result['model'][f'{key}_us_per_row'] = round(seconds / len(sample) * 1e6, 1)
+        result['model'][f'{key}_adds_up'] = bool(np.allclose(totals, margin, atol=1e-4))
+    return result
+
+
+# Runs one loader in a fresh interpreter and prints its peak RSS in KiB. VmHWM is read from
+# /proc because ru_maxrss can carry over the parent's high-water mark across fork/exec.
+_LOADER_CHILD = """
+import resource, sys
+from firebase_ai_integration import FirebaseAIIntegration
+integration = FirebaseAIIntegration()
+mode, path, chunk_size = sys.argv[1], sys.argv[2], int(sys.argv[3])
+if mode == 'full':
+    df = integration.load_sample_data_from_json(path)
+    integration.predict_credit_scores(df).to_csv(path + '.full.csv', index=False)
+else:
+    integration.score_json_stream(path, path + '.stream.csv', chunk_size)
+try:
+    with open('/proc/self/status') as status:
+        print(next(line.split()[1] for line in status if line.startswith('VmHWM:')))
+except OSError:
+    print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+
+def bench_loader(n_businesses: int = 500000, chunk_size: int = 50000, seed: int = 42) -> Dict[str, Any]:
+    """Compare peak RSS of the whole-file JSON loader and the chunked streaming loader"""
+    df = synthetic_features_frame(n_businesses, seed)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'business_ai_training_data.json')
+        df.to_json(path, orient='records')
+        file_mb = os.path.getsize(path) / 1024 ** 2
+        del df
+
+        result: Dict[str, Any] = {'businesses': n_businesses, 'file_mb': round(file_mb, 1), 'chunk_size': chunk_size}
+        for mode in ('full', 'stream'):
+            start = time.perf_counter()
+            output = subprocess.run(
+                [sys.executable, '-c', _LOADER_CHILD, mode, path, str(chunk_size)],
+                capture_output=True, text=True, check=True,
+                cwd=os.path.dirname(os.path.abspath(__file__))
+            )
+            result[f'{mode}_seconds'] = round(time.perf_counter() - start, 2)
+            result[f'{mode}_peak_rss_mb'] = round(int(output.stdout.strip().splitlines()[-1]) / 1024, 1)
+    return result
+
+
+def bench_transactions(n_businesses: int = 10000, invoices_per_business: int = 100, seed: int = 42) -> Dict[str, Any]:
+    """Memory and feature time of `TransactionColumns` vs per-business lists of transaction dicts
+
+    Both are built from the same invoice documents of a synthetic tenant: the
+    columns by `scan_invoices`, the dicts the way it did before (grouped
+    `_invoice_to_transaction` records). Build and feature times are taken
+    untraced; held memory is what tracemalloc still counts after a second,
+    traced build.
+    """
+    db = FakeFirestore()
+    n_invoices = populate_tenant(db, n_businesses, invoices_per_business, seed=seed)
+    integration = FirebaseAIIntegration()
+    current_date = datetime.now()
+
+    def build_dicts() -> Dict[str, List[Dict]]:
+        grouped: Dict[str, List[Dict]] = {}
+        for invoice_doc in db.collection('invoices').stream():
+            invoice_data = invoice_doc.to_dict()
+            business_id = invoice_data['businessId']
+            grouped.setdefault(business_id, []).append(integration._invoice_to_transaction(business_id, invoice_data))
+        return grouped
+
+    def build_columns():
+        return integration.scan_invoices(db)[1]
+
+    result: Dict[str, Any] = {'businesses': n_businesses, 'invoices': n_invoices}
+    features = {}
+    for name, build in (('dict', build_dicts), ('columns', build_columns)):
+        start = time.perf_counter()
+        transactions = build()
+        result[f'{name}_build_seconds'] = round(time.perf_counter() - start, 3)
+
+        start = time.perf_counter()
+        if name == 'dict':
+            features[name] = pd.DataFrame.from_dict({
+                business_id: integration.calculate_ai_features_from_firebase(rows, current_date=current_date)
+                for business_id, rows in transactions.items()
+            }, orient='index')
+        else:
+            features[name] = integration.calculate_ai_features_columns(transactions, current_date=current_date)
+        result[f'{name}_features_seconds'] = round(time.perf_counter() - start, 3)
+        del transactions
+
+        tracemalloc.start()
+        try:
+            base = tracemalloc.get_traced_memory()[0]
+            transactions = build()
+            held = tracemalloc.get_traced_memory()[0] - base
+        finally:
+            tracemalloc.stop()
+        del transactions
+        result[f'{name}_mb'] = round(held / 1024 ** 2, 1)
+        result[f'{name}_bytes_per_invoice'] = round(held / n_invoices, 1)
+        result[f'{name}_mb_per_million_invoices'] = round(held / n_invoices * 1e6 / 1024 ** 2, 1)
+
+    pd.testing.assert_frame_equal(features['columns'], features['dict'][features['columns'].columns],
+                                  check_dtype=False, check_names=False, check_index_type=False)
+    result['memory_ratio'] = round(result['dict_mb'] / max(result['columns_mb'], 0.1), 1)
+    result['outputs_match'] = True
+    return result
+
+
+# Named sizes for the end-to-end benchmark: (businesses, mean invoices per business)
+E2E_PROFILES = {
+    'small': (2000, 50),
+    'medium': (20000, 100),
+    'large': (100000, 100),
+}
+
+
+def _proc_status_kb(field: str) -> int:
+    with open('/proc/self/status') as status:
+        return int(next(line.split()[1] for line in status if line.startswith(field)))
+
+
+def default_memory_mode() -> str:
+    """'rss' where the kernel lets us reset the peak-RSS mark (Linux), else 'tracemalloc'"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        _proc_status_kb('VmHWM:')
+        return 'rss'
+    except (OSError, StopIteration):
+        return 'tracemalloc'
+
+
+def measure_stage(stages: List[Dict], name: str, func: Callable, *args, rows_in: Optional[int] = None,
+                  memory: str = 'rss', **kwargs) -> Any:
+    """Run one pipeline stage, appending its wall time and peak memory growth to `stages`
+
+    With `memory='rss'` the peak is the rise of the process high-water mark over
+    the RSS at stage start (reset via /proc/self/clear_refs); memory the allocator
+    kept from earlier stages can hide part of it. `memory='tracemalloc'` counts
+    Python and numpy allocations exactly but slows Python-heavy stages several-fold.
+    A full garbage collection runs first, so a stage isn't charged for a
+    collection triggered by the garbage of earlier ones.
+    """
+    gc.collect()
+    if memory == 'rss':
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        base = _proc_status_kb('VmRSS:') * 1024
+    elif memory == 'tracemalloc':
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    value = func(*args, **kwargs)
+    seconds = time.perf_counter() - start
+    stage = {'stage': name, 'seconds': round(seconds, 3), 'peak_mb': None, 'rows_in': rows_in}
+    if memory == 'rss':
+        stage['peak_mb'] = round(max(_proc_status_kb('VmHWM:') * 1024 - base, 0) / 1024 ** 2, 1)
+    elif memory == 'tracemalloc':
+        stage['peak_mb'] = round((tracemalloc.get_traced_memory()[1] - base) / 1024 ** 2, 1)
+    stage['rows_out'] = len(value) if hasattr(value, '__len__') and not isinstance(value, str) else None
+    stages.append(stage)
+    print(f"⏱️  {name}: {stage['seconds']}s, peak {stage['peak_mb']} MB")
+    return value
+
+
+def bench_e2e(n_businesses: int = 2000, invoices_per_business: int = 50, latency_ms: float = 2.0,
+              repeat_customer_rate: float = 0.7, memory: Optional[str] = None, seed: int = 42) -> Dict[str, Any]:
+    """Time and memory-profile every pipeline stage on a synthetic tenant in the fake Firestore
+
+    Stages: generate, fetch (one grouped invoices scan), features (per-business
+    `calculate_ai_features_from_firebase`), features_frame (the pandas engine on
+    the same transactions), features_columns (`calculate_ai_features_columns`),
+    filters, train, predict, report and writes (batched).
+    `memory` is 'rss', 'tracemalloc' or 'none' (see `measure_stage`); thresholds
+    only compare runs made with the same mode.
+    """
+    memory = memory or default_memory_mode()
+    db = FakeFirestore(latency=latency_ms / 1000.0)
+    integration = FirebaseAIIntegration()
+    integration.db = db
+    stages: List[Dict] = []
+    if memory == 'tracemalloc':
+        tracemalloc.start()
+
+    try:
+        n_invoices = measure_stage(
+            stages, 'generate', populate_tenant, db, n_businesses, invoices_per_business, seed=seed,
+            repeat_customer_rate=repeat_customer_rate, memory=memory
+        )
+        stages[-1]['rows_out'] = n_invoices
+
+        profiles, transactions, queries, reads = measure_stage(
+            stages, 'fetch', integration.scan_invoices, db, rows_in=n_invoices, memory=memory
+        )
+        stages[-1]['rows_out'] = len(transactions)
+        counts = transactions.business_counts()
+        eligible = [profile_doc for profile_doc in profiles if counts.get(profile_doc.id, 0) >= 5]
+
+        by_business = transactions.split()
+        df = measure_stage(
+            stages, 'features', lambda: pd.DataFrame([
+                integration._build_business_row(profile_doc.id, profile_doc.to_dict(), by_business[profile_doc.id])
+                for profile_doc in eligible
+            ]), rows_in=n_invoices, memory=memory
+        )
+        del by_business
+        measure_stage(
+            stages, 'features_frame', lambda: integration.calculate_ai_features_frame(transactions.to_frame()),
+            rows_in=n_invoices, memory=memory
+        )
+        measure_stage(stages, 'features_columns', integration.calculate_ai_features_columns, transactions,
+                      rows_in=n_invoices, memory=memory)
+        del transactions, profiles
+
+        measure_stage(stages, 'filters', integration.apply_hard_filters_batch, df,
+                      rows_in=len(df), memory=memory)
+        np.random.seed(seed)
+        model = measure_stage(stages, 'train', integration.train_xgboost_model, df.copy(),
+                              rows_in=len(df), memory=memory)
+        stages[-1]['rows_out'] = integration.model_manifest.get('training_rows') if model is not None else 0
+        predictions = measure_stage(stages, 'predict', integration.predict_credit_scores, df, with_hashes=True,
+                                    rows_in=len(df), memory=memory)
+        measure_stage(stages, 'report', integration.generate_report, predictions,
+                      rows_in=len(predictions), memory=memory)
+        stages[-1]['rows_out'] = None
+        db.reset_stats()
+        summary = measure_stage(stages, 'writes', integration.update_firebase_bulk, predictions,
+                                rows_in=len(predictions), memory=memory)
+        stages[-1]['rows_out'] = summary['written']
+    finally:
+        if memory == 'tracemalloc':
+            tracemalloc.stop()
+
+    return {
+        'benchmark': 'e2e',
+        'businesses': n_businesses,
+        'invoices_per_business': invoices_per_business,
+        'invoices': n_invoices,
+        'latency_ms': latency_ms,
+        'memory': memory,
+        'fetch_queries': queries,
+        'fetch_reads': reads,
+        'total_seconds': round(sum(stage['seconds'] for stage in stages), 3),
+        'stages': stages,
+    }
+
+
+def check_thresholds(result: Dict[str, Any], thresholds: Dict[str, Any], profile: str) -> List[str]:
+    """Return the stages of `result` exceeding the `profile` limits in a thresholds file
+    
+    A stage the profile has no limits for is reported too, so a new stage
+    cannot go ungated.
+    """
+    baseline = thresholds.get(profile, {})
+    limits = baseline.get('stages', {})
+    check_memory = baseline.get('memory') == result['memory']
+    regressions = []
+    for stage in result['stages']:
+        limit = limits.get(stage['stage'])
+        if not limit:
+            regressions.append(f"{stage['stage']}: no thresholds for profile {profile}")
+            continue
+        if stage['seconds'] > limit.get('max_seconds', float('inf')):
+            regressions.append(f"{stage['stage']}: {stage['seconds']}s > {limit['max_seconds']}s")
+        if check_memory and stage['peak_mb'] is not None and stage['peak_mb'] > limit.get('max_peak_mb', float('inf')):
+            regressions.append(f"{stage['stage']}: {stage['peak_mb']} MB > {limit['max_peak_mb']} MB")
+    return regressions
+
+
+def thresholds_from_result(result: Dict[str, Any], time_margin: float = 2.0,
+                           memory_margin: float = 1.25) -> Dict[str, Any]:
+    """Derive per-stage limits from a baseline run, with headroom for machine noise"""
+    stages = {}
+    for stage in result['stages']:
+        limit = {'max_seconds': round(max(stage['seconds'] * time_margin, 0.05), 3)}
+        if stage['peak_mb'] is not None:
+            limit['max_peak_mb'] = round(max(stage['peak_mb'] * memory_margin, 1.0), 1)
+        stages[stage['stage']] = limit
+    return {
+        'businesses': result['businesses'],
+        'invoices_per_business': result['invoices_per_business'],
+        'latency_ms': result['latency_ms'],
+        'memory': result['memory'],
+        'stages': stages,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Firebase-PepeAI pipeline")
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    fetch_parser = subparsers.add_parser('fetch', help="sequential vs concurrent invoice fetch")
+    fetch_parser.add_argument('--businesses', type=int, default=200)
+    fetch_parser.add_argument('--invoices', type=int, default=20, help="mean invoices per business")
+    fetch_parser.add_argument('--latency-ms', type=float, default=20.0)
+    fetch_parser.add_argument('--workers', type=int, default=16)
+    fetch_parser.add_argument('--rate-limit', type=float, default=0.0, help="queries/second, 0 for unlimited")
+
+    indexed_parser = subparsers.add_parser('indexed', help="per-business fetch with vs without known invoice counts")
+    indexed_parser.add_argument('--businesses', type=int, default=2000)
+    indexed_parser.add_argument('--invoices', type=int, default=10, help="mean invoices per business")
+    indexed_parser.add_argument('--latency-ms', type=float, default=20.0)
+    indexed_parser.add_argument('--workers', type=int, default=16)
+    indexed_parser.add_argument('--grow-rate', type=float, default=0.05,
+                                help="fraction of small businesses that reach the minimum before the grown run")
+
+    writes_parser = subparsers.add_parser('writes', help="per-document vs batched prediction writes")
+    writes_parser.add_argument('--businesses', type=int, default=2000)
+    writes_parser.add_argument('--latency-ms', type=float, default=5.0)
+    writes_parser.add_argument('--batch-size', type=int, default=500)
+    writes_parser.add_argument('--max-in-flight', type=int, default=4)
+
+    features_parser = subparsers.add_parser('features', help="columnar vs per-business feature engine")
+    features_parser.add_argument('--businesses', type=int, default=10000)
+    features_parser.add_argument('--invoices', type=int, default=1000000)
+    features_parser.add_argument('--verify-sample', type=int, default=500)
+
+    scoring_parser = subparsers.add_parser('scoring', help="batch vs row-wise filtering and scoring")
+    scoring_parser.add_argument('--businesses', type=int, default=1000000)
+    scoring_parser.add_argument('--verify-sample', type=int, default=2000)
+
+    loader_parser = subparsers.add_parser('loader', help="peak RSS of whole-file vs streaming JSON loading")
+    loader_parser.add_argument('--businesses', type=int, default=500000)
+    loader_parser.add_argument('--chunk-size', type=int, default=50000)
+
+    transactions_parser = subparsers.add_parser('transactions',
+                                                help="memory of columnar transactions vs transaction dicts")
+    transactions_parser.add_argument('--businesses', type=int, default=10000)
+    transactions_parser.add_argument('--invoices', type=int, default=100, help="mean invoices per business")
+
+    output_parser = subparsers.add_parser('output', help="CSV vs Parquet/Arrow predictions output and history")
+    output_parser.add_argument('--businesses', type=int, default=500000)
+    output_parser.add_argument('--chunk-size', type=int, default=50000)
+
+    explain_parser = subparsers.add_parser('explain', help="batch explanation overhead over plain scoring")
+    explain_parser.add_argument('--businesses', type=int, default=200000)
+    explain_parser.add_argument('--top-k', type=int, default=3)
+
+    e2e_parser = subparsers.add_parser('e2e', help="per-stage time and memory of the whole pipeline")
+    e2e_parser.add_argument('--profile', choices=sorted(E2E_PROFILES), default='small',
+                            help="named size; large is ~10M invoices")
+    e2e_parser.add_argument('--businesses', type=int, help="override the profile's business count")
+    e2e_parser.add_argument('--invoices', type=int, help="override the profile's mean invoices per business")
+    e2e_parser.add_argument('--latency-ms', type=float, default=2.0)
+    e2e_parser.add_argument('--repeat-customer-rate', type=float, default=0.7)
+    e2e_parser.add_argument('--memory', choices=['rss', 'tracemalloc', 'none'],
+                            help="per-stage memory measurement (default: rss on Linux, else tracemalloc)")
+    e2e_parser.add_argument('--output', help="also write the JSON result to this file")
+    e2e_parser.add_argument('--check', metavar='THRESHOLDS', help="exit 1 if a stage exceeds these limits")
+    e2e_parser.add_argument('--update-thresholds', metavar='THRESHOLDS',
+                            help="record this run as the profile's baseline in the thresholds file")
+
+    args = parser.parse_args()
+
+    if args.benchmark == 'fetch':
+        result = bench_fetch(args.businesses, args.invoices, args.latency_ms, args.workers, args.rate_limit)
+    elif args.benchmark == 'indexed':
+        result = bench_indexed(args.businesses, args.invoices, args.latency_ms, args.workers, args.grow_rate)
+    elif args.benchmark == 'writes':
+        result = bench_writes(args.businesses, args.latency_ms, args.batch_size, args.max_in_flight)
+    elif args.benchmark == 'features':
+        result = bench_features(args.businesses, args.invoices, args.verify_sample)
+    elif args.benchmark == 'scoring':
+        result = bench_scoring(args.businesses, args.verify_sample)
+    elif args.benchmark == 'loader':
+        result = bench_loader(args.businesses, args.chunk_size)
+    elif args.benchmark == 'transactions':
+        result = bench_transactions(args.businesses, args.invoices)
+    elif args.benchmark == 'output':
+        result = bench_output(args.businesses, args.chunk_size)
+    elif args.benchmark == 'explain':
+        result = bench_explain(args.businesses, args.top_k)
+    elif args.benchmark == 'e2e':
+        n_businesses, invoices_per_business = E2E_PROFILES[args.profile]
+        custom = args.businesses is not None or args.invoices is not None
+        result = bench_e2e(args.businesses or n_businesses, args.invoices or invoices_per_business,
+                           args.latency_ms, args.repeat_customer_rate, args.memory)
+        result['profile'] = 'custom' if custom else args.profile
+
+    print(json.dumps(result, indent=2))
+    if args.benchmark != 'e2e':
+        return
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+    if args.update_thresholds:
+        thresholds = {}
+        if os.path.exists(args.update_thresholds):
+            with open(args.update_thresholds) as f:
+                thresholds = json.load(f)
+        thresholds[result['profile']] = thresholds_from_result(result)
+        with open(args.update_thresholds, 'w') as f:
+            json.dump(thresholds, f, indent=2)
+            f.write('\n')
+        print(f"📝 Updated {result['profile']} thresholds in {args.update_thresholds}")
+    if args.check:
+        with open(args.check) as f:
+            thresholds = json.load(f)
+        if result['profile'] not in thresholds:
+            print(f"⚠️  No thresholds for profile {result['profile']} in {args.check}")
+            return
+        regressions = check_thresholds(result, thresholds, result['profile'])
+        if regressions:
+            print("❌ Performance regressions:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print(f"✅ All stages within {args.check} limits")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,384 @@
+"""
+PepeAI Scoring Server
+=====================
+
+Long-running, localhost HTTP service that scores businesses on demand for the
+dashboard. The saved model is loaded once, and concurrent requests are gathered
+into micro-batches so each batch goes through the hard filters, one booster
+`inplace_predict` call and the vectorized formula score, then one batch
+explanation call for the `top_reasons` of passing businesses.
+
+Endpoints:
+    POST /score    body: one business's features, or {"businesses": [...]}
+    GET  /stats    latency percentiles, throughput and batch sizes
+    GET  /health
+
+Usage:
+    python scoring_server.py --model-dir pepe_model --port 8765
+    python scoring_server.py --load-test --concurrency 64 --requests 5000
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import time
+from typing import Dict, List, Any, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from firebase_ai_integration import FirebaseAIIntegration, SCORING_FEATURES
+
+DEFAULT_PORT = 8765
+RESPONSE_FIELDS = ['business_id', 'filter_result', 'predicted_category', 'predicted_credit_score']
+
+
+class MicroBatcher:
+    """Collects concurrent score requests into batches of up to `max_batch_size`
+
+    A batch is flushed when it is full or `max_wait_ms` after its first request
+    arrived, whichever comes first.
+    """
+
+    def __init__(self, integration: FirebaseAIIntegration, max_batch_size: int = 256, max_wait_ms: float = 5.0,
+                 latency_window: int = 100000, top_reasons: int = 3):
+        self.integration = integration
+        self.top_reasons = top_reasons
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.latencies: List[float] = []
+        self.latency_window = latency_window
+        self.batch_sizes: List[int] = []
+        self.scored = 0
+        self.started_at = time.perf_counter()
+        self.worker: Optional[asyncio.Task] = None
+
+    def start(self):
+        self.worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self.worker:
+            self.worker.cancel()
+            try:
+                await self.worker
+            except asyncio.CancelledError:
+                pass
+
+    async def score(self, business: Dict) -> Dict:
+        """Queue one business and wait for its batch to be scored"""
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((business, future, time.perf_counter()))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            businesses = [item[0] for item in batch]
+            try:
+                results = await loop.run_in_executor(None, self._score_batch, businesses)
+            except Exception:
+                # Rescore one by one so a business that breaks scoring only fails its own request
+                results = await loop.run_in_executor(None, self._score_each, businesses)
+
+            finished = time.perf_counter()
+            for (_, future, queued_at), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+                self.latencies.append(finished - queued_at)
+            if len(self.latencies) > self.latency_window:
+                del self.latencies[:len(self.latencies) - self.latency_window]
+            self.batch_sizes.append(len(batch))
+            self.scored += len(batch)
+
+    def _score_batch(self, businesses: List[Dict]) -> List[Dict]:
+        df = pd.DataFrame(businesses)
+        if 'business_id' not in df.columns:
+            df['business_id'] = None
+        # Uninstrumented: per-batch run metrics would grow with every request served
+        predictions = self.integration.score_rows(df)
+        predictions['predicted_credit_score'] = predictions['predicted_credit_score'].astype(float)
+        if not self.top_reasons:
+            return predictions[RESPONSE_FIELDS].to_dict('records')
+        predictions = self.integration.add_top_reasons(predictions, self.top_reasons)
+        return predictions[RESPONSE_FIELDS + ['top_reasons']].to_dict('records')
+
+    def _score_each(self, businesses: List[Dict]) -> List[Any]:
+        """Score businesses separately; each entry is a result or the exception it raised"""
+        results: List[Any] = []
+        for business in businesses:
+            try:
+                results.extend(self._score_batch([business]))
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        elapsed = time.perf_counter() - self.started_at
+        latencies_ms = np.array(self.latencies) * 1000
+        return {
+            'scored': self.scored,
+            'batches': len(self.batch_sizes),
+            'mean_batch_size': round(float(np.mean(self.batch_sizes)), 1) if self.batch_sizes else 0,
+            'p50_ms': round(float(np.percentile(latencies_ms, 50)), 2) if len(latencies_ms) else None,
+            'p99_ms': round(float(np.percentile(latencies_ms, 99)), 2) if len(latencies_ms) else None,
+            'throughput_per_sec': round(self.scored / elapsed, 1) if elapsed > 0 else None,
+        }
+
+
+def validate_business(business: Any) -> Tuple[Optional[Dict], Optional[str]]:
+    """`(business, None)` with its features coerced to floats, or `(None, error)` if it is not scorable
+
+    Numbers and numeric strings are accepted; booleans, nulls and non-finite
+    values are not.
+    """
+    if not isinstance(business, dict):
+        return None, "each business must be a JSON object"
+    missing = [field for field in SCORING_FEATURES if field not in business]
+    if missing:
+        return None, f"missing fields: {', '.join(missing)}"
+    business = dict(business)
+    invalid = []
+    for field in SCORING_FEATURES:
+        value = business[field]
+        try:
+            if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+                raise ValueError(value)
+            value = float(value)
+        except (ValueError, OverflowError):
+            invalid.append(field)
+            continue
+        if not math.isfinite(value):
+            invalid.append(field)
+        business[field] = value
+    if invalid:
+        return None, f"fields must be finite numbers: {', '.join(invalid)}"
+    return business, None
+
+
+class ScoringServer:
+    """Minimal HTTP/1.1 front end (keep-alive, JSON bodies) for a MicroBatcher"""
+
+    def __init__(self, batcher: MicroBatcher, host: str = '127.0.0.1', port: int = DEFAULT_PORT):
+        self.batcher = batcher
+        self.host = host
+        self.port = port
+        self.server: Optional[asyncio.base_events.Server] = None
+
+    async def start(self):
+        self.batcher.start()
+        self.server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+        await self.batcher.stop()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request = await read_http_message(reader)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                try:
+                    status, payload = await self._route(method, path, body)
+                except Exception as e:
+                    status, payload = 500, {'error': f'scoring failed: {e}'}
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                writer.write(http_response(status, payload, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            # e.g. a malformed request head; answer it instead of dropping the connection silently
+            try:
+                writer.write(http_response(500, {'error': f'bad request stream: {e}'}, keep_alive=False))
+                await writer.drain()
+            except ConnectionError:
+                pass
+        finally:
+            writer.close()
+
+    async def _route(self, method: str, path: str, body: bytes) -> Tuple[int, Any]:
+        if method == 'OPTIONS':
+            return 204, None
+        if method == 'GET' and path == '/health':
+            return 200, {'status': 'ok', 'model_loaded': self.batcher.integration.model is not None}
+        if method == 'GET' and path == '/stats':
+            return 200, self.batcher.stats()
+        if method == 'POST' and path == '/score':
+            try:
+                payload = json.loads(body or b'{}')
+            except json.JSONDecodeError:
+                return 400, {'error': 'invalid JSON'}
+            many = isinstance(payload, dict) and 'businesses' in payload
+            businesses = payload['businesses'] if many else [payload]
+            if not isinstance(businesses, list):
+                return 400, {'error': 'businesses must be a list'}
+            validated = []
+            for business in businesses:
+                business, error = validate_business(business)
+                if error:
+                    return 400, {'error': error}
+                validated.append(business)
+            businesses = validated
+            results = await asyncio.gather(*(self.batcher.score(business) for business in businesses))
+            return 200, {'results': results} if many else results[0]
+        return 404, {'error': f'no route for {method} {path}'}
+
+
+async def read_http_message(reader: asyncio.StreamReader) -> Optional[Tuple[str, str, Dict[str, str], bytes]]:
+    """Read one HTTP request (or response) from a stream; None at EOF"""
+    try:
+        head = await reader.readuntil(b'\r\n\r\n')
+    except asyncio.IncompleteReadError:
+        return None
+    lines = head.decode('latin-1').split('\r\n')
+    first = lines[0].split(' ', 2)
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+    length = int(headers.get('content-length', 0))
+    body = await reader.readexactly(length) if length else b''
+    return first[0], first[1] if len(first) > 1 else '', headers, body
+
+
+def http_response(status: int, payload: Any, keep_alive: bool = True) -> bytes:
+    reasons = {200: 'OK', 204: 'No Content', 400: 'Bad Request', 404: 'Not Found', 500: 'Internal Server Error'}
+    body = b'' if payload is None else json.dumps(payload).encode('utf-8')
+    head = (
+        f"HTTP/1.1 {status} {reasons.get(status, 'OK')}\r\n"
+        f"Content-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Access-Control-Allow-Origin: *\r\n"
+        f"Access-Control-Allow-Methods: GET, POST, OPTIONS\r\n"
+        f"Access-Control-Allow-Headers: Content-Type\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    )
+    return head.encode('latin-1') + body
+
+
+def sample_business(rng: np.random.Generator, index: int) -> Dict:
+    """Random business features for the load generator"""
+    return {
+        'business_id': f'LOAD{index:07d}',
+        'customer_number': int(rng.integers(1, 20)),
+        'customer_order': float(rng.uniform(1, 5)),
+        'amount': float(rng.uniform(1000, 50000)),
+        'days_since_last_transaction': int(rng.integers(1, 365)),
+        'customer_stickiness': float(rng.uniform(0, 0.9)),
+        'transaction_count': int(rng.integers(0, 50)),
+        'completion_rate': float(rng.uniform(0.1, 0.95)),
+        'clearance_days': float(rng.uniform(5, 30)),
+    }
+
+
+async def run_load_test(host: str, port: int, concurrency: int = 64, total_requests: int = 5000,
+                        seed: int = 42) -> Dict[str, Any]:
+    """Send `total_requests` single-business requests from `concurrency` keep-alive clients"""
+    rng = np.random.default_rng(seed)
+    bodies = [json.dumps(sample_business(rng, i)).encode('utf-8') for i in range(total_requests)]
+    latencies: List[float] = []
+    next_index = iter(range(total_requests))
+
+    async def client():
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            for index in next_index:
+                body = bodies[index]
+                start = time.perf_counter()
+                writer.write(
+                    f"POST /score HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+                    f"Content-Length: {len(body)}\r\n\r\n".encode('latin-1') + body
+                )
+                await writer.drain()
+                response = await read_http_message(reader)
+                if response is None or not response[1].startswith('200'):
+                    raise RuntimeError(f"Bad response: {response}")
+                latencies.append(time.perf_counter() - start)
+        finally:
+            writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        'requests': len(latencies),
+        'concurrency': concurrency,
+        'seconds': round(elapsed, 3),
+        'throughput_per_sec': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(float(np.percentile(latencies_ms, 50)), 2),
+        'p99_ms': round(float(np.percentile(latencies_ms, 99)), 2),
+    }
+
+
+async def serve(args: argparse.Namespace):
+    integration = FirebaseAIIntegration()
+    if not integration.load_model(args.model_dir):
+        print("⚠️  Serving formula-based categories only")
+
+    batcher = MicroBatcher(integration, args.max_batch_size, args.max_wait_ms, top_reasons=args.top_reasons)
+    # The load test picks a free ephemeral port unless one is given
+    port = args.port if args.port is not None else 0 if args.load_test else DEFAULT_PORT
+    server = ScoringServer(batcher, args.host, port)
+    await server.start()
+    print(f"✅ Scoring server listening on http://{server.host}:{server.port} "
+          f"(max batch {args.max_batch_size}, max wait {args.max_wait_ms} ms)")
+
+    try:
+        if args.load_test:
+            result = await run_load_test(server.host, server.port, args.concurrency, args.requests)
+            result['server'] = batcher.stats()
+            print(json.dumps(result, indent=2))
+        else:
+            await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PepeAI micro-batching scoring server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int,
+                        help=f"listening port (default: {DEFAULT_PORT}, or a free one with --load-test)")
+    parser.add_argument('--model-dir', default='pepe_model')
+    parser.add_argument('--max-batch-size', type=int, default=256)
+    parser.add_argument('--max-wait-ms', type=float, default=5.0)
+    parser.add_argument('--top-reasons', type=int, default=3, help="reasons returned per passing business (0 for none)")
+    parser.add_argument('--load-test', action='store_true', help="start the server, run the load generator, exit")
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--requests', type=int, default=5000)
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        print("\n👋 Scoring server stopped")
+
+
+if __name__ == "__main__":
+    main()
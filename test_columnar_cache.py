@@ -0,0 +1,112 @@
+"""
+`ColumnarCache` hits, TTL expiry, LRU eviction by size and index persistence,
+and the fetch-level features cache on `FakeFirestore` data.
+
+Run with `python -m pytest -q test_columnar_cache.py`.
+"""
+
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from fake_firestore import FakeFirestore, populate_synthetic
+from firebase_ai_integration import ColumnarCache, FirebaseAIIntegration
+
+
+def frame(rows: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({'business_id': [f'BIZ{i:05d}' for i in range(rows)], 'amount': rng.uniform(0, 1, rows)})
+
+
+def test_hit_miss_and_ttl(tmp_path):
+    cache = ColumnarCache(str(tmp_path), ttl_seconds=60)
+    df = frame(10)
+    assert cache.get('transactions', 'firestore', 'BIZ00001') is None
+    cache.put('transactions', 'firestore', 'BIZ00001', df)
+    pd.testing.assert_frame_equal(cache.get('transactions', 'firestore', 'BIZ00001'), df)
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    cache.index['transactions/firestore/BIZ00001']['created_at'] = time.time() - 61
+    assert cache.get('transactions', 'firestore', 'BIZ00001') is None
+    assert cache.stats()['entries'] == 0 and cache.stats()['bytes'] == 0
+    assert os.listdir(tmp_path) in ([], ['index.json'])
+
+
+def test_evicts_least_recently_used_by_size(tmp_path):
+    probe = ColumnarCache(str(tmp_path / 'probe'))
+    probe.put('transactions', 'firestore', 'probe', frame(10))
+    entry_bytes = probe.stats()['bytes']
+
+    cache = ColumnarCache(str(tmp_path / 'cache'), max_bytes=int(entry_bytes * 3.5))
+    for key in ('a', 'b', 'c'):
+        cache.put('transactions', 'firestore', key, frame(10))
+    cache.get('transactions', 'firestore', 'a')
+    cache.put('transactions', 'firestore', 'd', frame(10))
+
+    assert cache.evictions == 1
+    assert cache.get('transactions', 'firestore', 'b') is None
+    for key in ('a', 'c', 'd'):
+        assert cache.get('transactions', 'firestore', key) is not None
+    assert cache.stats()['bytes'] == sum(entry['bytes'] for entry in cache.index.values()) <= cache.max_bytes
+
+
+def test_index_is_saved_in_batches_and_reloaded(tmp_path):
+    cache = ColumnarCache(str(tmp_path), flush_every=4)
+    for i in range(3):
+        cache.put('transactions', 'firestore', f'BIZ{i:05d}', frame(5, seed=i))
+    assert not os.path.exists(cache.index_path)
+    cache.put('transactions', 'firestore', 'BIZ00003', frame(5, seed=3))
+    with open(cache.index_path) as f:
+        assert len(json.load(f)) == 4
+
+    cache.put('transactions', 'firestore', 'BIZ00004', frame(5, seed=4))
+    cache.flush()
+    reopened = ColumnarCache(str(tmp_path))
+    assert reopened.stats()['entries'] == 5 and reopened.stats()['bytes'] == cache.stats()['bytes']
+    pd.testing.assert_frame_equal(reopened.get('transactions', 'firestore', 'BIZ00004'), frame(5, seed=4))
+
+
+def test_features_cache_is_keyed_by_fetch_mode(tmp_path):
+    db = FakeFirestore()
+    populate_synthetic(db, 40, seed=2)
+
+    def fetch(**kwargs) -> pd.DataFrame:
+        integration = FirebaseAIIntegration(cache_dir=str(tmp_path))
+        integration.db = db
+        return integration.fetch_businesses_from_firebase(**kwargs)
+
+    per_business = fetch()
+    bulk = fetch(bulk=True)
+    features_keys = [key for key in ColumnarCache(str(tmp_path)).index if key.startswith('features/')]
+    assert len(features_keys) == 2
+
+    pd.testing.assert_frame_equal(fetch(), per_business)
+    pd.testing.assert_frame_equal(fetch(bulk=True), bulk)
+
+
+def test_cached_features_recompute_days_since_last_transaction(tmp_path):
+    db = FakeFirestore()
+    populate_synthetic(db, 20, seed=4)
+    integration = FirebaseAIIntegration(cache_dir=str(tmp_path))
+    integration.db = db
+    fetched = integration.fetch_businesses_from_firebase(bulk=True)
+
+    # Pretend the cached features were written ten days ago
+    cache = ColumnarCache(str(tmp_path))
+    (entry_key,) = [key for key in cache.index if key.startswith('features/')]
+    _, source, key = entry_key.split('/', 2)
+    stored = cache.get('features', source, key)
+    assert 'latest_invoice_us' in stored.columns
+    stored['latest_invoice_us'] -= 10 * 24 * 3600 * 10 ** 6
+    cache.put('features', source, key, stored)
+    cache.flush()
+
+    reloaded = FirebaseAIIntegration(cache_dir=str(tmp_path))
+    reloaded.db = db
+    cached = reloaded.fetch_businesses_from_firebase(bulk=True)
+    assert 'latest_invoice_us' not in cached.columns
+    assert list(cached['days_since_last_transaction']) == list(fetched['days_since_last_transaction'] + 10)
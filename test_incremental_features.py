@@ -0,0 +1,83 @@
+"""
+`update_features_incrementally` run after run against a full rebuild, on
+`FakeFirestore` data with new invoices, timestamp ties, new businesses and
+invoices without `createdAt`.
+
+Run with `python -m pytest -q test_incremental_features.py`.
+"""
+
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pytest
+
+from fake_firestore import FakeFirestore, FakeTimestamp, populate_synthetic
+from firebase_ai_integration import FirebaseAIIntegration
+
+CURRENT_DATE = datetime(2025, 3, 1)
+
+
+def add_invoices(db: FakeFirestore, business_id: str, count: int, created: datetime = None, prefix: str = 'NEW'):
+    for i in range(count):
+        data = {'businessId': business_id, 'total': 100.0 + i, 'customerEmail': f'c{i % 3}@{business_id}.my',
+                'status': 'paid', 'dueDate': (created or CURRENT_DATE) + timedelta(days=3)}
+        if created is not None:
+            data['createdAt'] = FakeTimestamp(created)
+        db.add_document('invoices', f'{business_id}-{prefix}{i:03d}', data)
+
+
+def incremental_and_rebuild(db: FakeFirestore, state_path: str):
+    incremental = FirebaseAIIntegration()
+    incremental.db = db
+    updated = incremental.update_features_incrementally(state_path, current_date=CURRENT_DATE)
+    rebuild = FirebaseAIIntegration()
+    rebuild.db = db
+    rebuilt = rebuild.update_features_incrementally(f'{state_path}.rebuild', full_rebuild=True,
+                                                    current_date=CURRENT_DATE)
+    return updated, rebuilt, incremental.fetch_stats, rebuild.fetch_stats
+
+
+def assert_same_rows(updated: pd.DataFrame, rebuilt: pd.DataFrame, ignore=()):
+    assert not rebuilt.empty
+    pd.testing.assert_frame_equal(updated.drop(columns=list(ignore)), rebuilt.drop(columns=list(ignore)))
+
+
+def test_incremental_updates_match_full_rebuild(tmp_path):
+    db = FakeFirestore()
+    populate_synthetic(db, 120, seed=5)
+    state_path = str(tmp_path / 'state.json')
+    latest = max(data['createdAt'].to_datetime() for data in db._collections['invoices'].values())
+
+    updated, rebuilt, _, _ = incremental_and_rebuild(db, state_path)
+    assert_same_rows(updated, rebuilt)
+
+    # New invoices, some at exactly the previous watermark, and a new business with old history
+    add_invoices(db, 'BIZ00003', 4, latest, prefix='TIE')
+    add_invoices(db, 'BIZ00007', 6, latest + timedelta(days=1))
+    db.add_document('businesses', 'BIZ99999', {'businessName': 'Late', 'industry': 'Retail', 'creditScore': 600})
+    add_invoices(db, 'BIZ99999', 7, datetime(2024, 2, 1))
+    updated, rebuilt, stats, rebuild_stats = incremental_and_rebuild(db, state_path)
+    assert_same_rows(updated, rebuilt)
+    assert stats['invoices_folded'] == 4 + 6 + 7
+    assert stats['reads'] < rebuild_stats['reads'] / 4
+
+    # Nothing new: nothing is folded twice
+    updated, rebuilt, stats, _ = incremental_and_rebuild(db, state_path)
+    assert_same_rows(updated, rebuilt)
+    assert stats['invoices_folded'] == 0
+
+
+def test_invoices_without_created_at_are_counted_once(tmp_path):
+    db = FakeFirestore()
+    for b in range(6):
+        business_id = f'BIZ{b:05d}'
+        db.add_document('businesses', business_id, {'businessName': business_id, 'industry': 'Retail',
+                                                    'creditScore': 500})
+        add_invoices(db, business_id, 5 + b, prefix='UNDATED')
+    state_path = str(tmp_path / 'state.json')
+
+    for _ in range(3):
+        updated, rebuilt, _, _ = incremental_and_rebuild(db, state_path)
+        # Undated invoices are dated at read time
+        assert_same_rows(updated, rebuilt, ignore=['days_since_last_transaction'])
+        assert list(updated['transaction_count']) == [5 + b for b in range(6)]
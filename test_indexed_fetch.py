@@ -0,0 +1,55 @@
+"""
+Per-business fetches with `known_counts` saved by the previous run against the
+plain fetch, on `FakeFirestore` data with businesses below the invoice minimum.
+
+Run with `python -m pytest -q test_indexed_fetch.py`.
+"""
+
+import pandas as pd
+import pytest
+
+from fake_firestore import FakeFirestore, populate_tenant
+from firebase_ai_integration import FirebaseAIIntegration
+
+
+def fetch(db: FakeFirestore, **kwargs) -> FirebaseAIIntegration:
+    integration = FirebaseAIIntegration()
+    integration.db = db
+    integration.fetched = integration.fetch_businesses_from_firebase(**kwargs)
+    return integration
+
+
+def same_rows(left: pd.DataFrame, right: pd.DataFrame):
+    columns = left.columns.drop('days_since_last_transaction')
+    pd.testing.assert_frame_equal(left[columns].reset_index(drop=True), right[columns].reset_index(drop=True))
+
+
+@pytest.mark.parametrize('max_workers', [None, 4])
+def test_fetch_with_saved_counts_matches_plain_fetch(tmp_path, max_workers):
+    db = FakeFirestore()
+    populate_tenant(db, 200, invoices_per_business=8, seed=3)
+    counts_path = str(tmp_path / 'counts.json')
+
+    first = fetch(db, max_workers=max_workers)
+    assert first.load_invoice_counts(counts_path) is None
+    first.save_invoice_counts(counts_path)
+    known_counts = first.load_invoice_counts(counts_path)
+    assert known_counts == first.invoice_counts and len(known_counts) == 200
+    small = [business_id for business_id, count in known_counts.items() if count < 5]
+    assert small
+
+    # One small business grows past the minimum
+    grown = small[0]
+    for i in range(5):
+        db.add_document('invoices', f'{grown}-GROWN{i}', {'businessId': grown, 'total': 50.0 + i,
+                                                          'customerEmail': f'c{i}@x.my', 'status': 'paid'})
+    plain = fetch(db, max_workers=max_workers)
+    indexed = fetch(db, max_workers=max_workers, known_counts=known_counts)
+    same_rows(indexed.fetched, plain.fetched)
+    assert grown in set(indexed.fetched['business_id'])
+    assert indexed.fetch_stats['stages']['counted'] == len(small) - 1
+    assert indexed.fetch_stats['stages']['grown'] == 1
+    assert indexed.fetch_stats['reads'] < plain.fetch_stats['reads']
+
+    indexed.save_invoice_counts(counts_path, known_counts)
+    assert indexed.load_invoice_counts(counts_path) == plain.invoice_counts
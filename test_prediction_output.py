@@ -0,0 +1,69 @@
+"""
+Predictions files written by `run_pipeline`: the default file keeps the
+original columns, while feature hashes for skipping unchanged businesses go to
+the score cache, and `--bookkeeping-columns` adds them to the file.
+
+Run with `python -m pytest -q test_prediction_output.py`.
+"""
+
+import json
+
+import numpy as np
+import pytest
+
+from firebase_ai_integration import (BOOKKEEPING_COLUMNS, SCORING_FEATURES, FirebaseAIIntegration, parse_args,
+                                     read_predictions, run_pipeline)
+
+PREDICTION_COLUMNS = ['business_id', 'business_name', 'industry'] + SCORING_FEATURES + [
+    'filter_result', 'predicted_credit_score', 'predicted_category'
+]
+
+
+@pytest.fixture
+def export(tmp_path, monkeypatch):
+    """A JSON export in the working directory, scored with the formula"""
+    rng = np.random.default_rng(9)
+    records = [{
+        'business_id': f'BIZ{b:05d}',
+        'business_name': f'Business {b + 1}',
+        'industry': ['Technology', 'Retail'][b % 2],
+        'customer_number': int(rng.integers(1, 20)),
+        'customer_order': float(rng.uniform(1, 5)),
+        'amount': float(rng.uniform(1000, 50000)),
+        'days_since_last_transaction': int(rng.integers(1, 365)),
+        'customer_stickiness': float(rng.uniform(0, 0.9)),
+        'transaction_count': int(rng.integers(3, 50)),
+        'completion_rate': float(rng.uniform(0.1, 1.0)),
+        'clearance_days': float(rng.uniform(5, 30)),
+    } for b in range(50)]
+    (tmp_path / 'business_ai_training_data.json').write_text(json.dumps(records))
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(FirebaseAIIntegration, 'train_xgboost_model', lambda self, df: None)
+    return tmp_path
+
+
+@pytest.mark.parametrize('output_format', ['csv', 'parquet'])
+def test_default_output_keeps_original_columns_and_reuses_scores(export, capsys, output_format):
+    argv = ['--output-format', output_format]
+    run_pipeline(FirebaseAIIntegration(), parse_args(argv))
+    first = read_predictions(f'ai_credit_predictions.{output_format}')
+    assert list(first.columns) == PREDICTION_COLUMNS
+    assert set(BOOKKEEPING_COLUMNS) <= set(read_predictions(f'ai_score_cache.{output_format}').columns)
+
+    capsys.readouterr()
+    run_pipeline(FirebaseAIIntegration(), parse_args(argv))
+    assert 'Reused 50 unchanged predictions, rescored 0' in capsys.readouterr().out
+    second = read_predictions(f'ai_credit_predictions.{output_format}')
+    assert second.equals(first)
+
+
+def test_bookkeeping_columns_flag(export):
+    run_pipeline(FirebaseAIIntegration(), parse_args(['--bookkeeping-columns']))
+    predictions = read_predictions('ai_credit_predictions.csv')
+    assert list(predictions.columns) == PREDICTION_COLUMNS + BOOKKEEPING_COLUMNS
+    assert predictions['feature_hash'].notna().all()
+
+
+def test_stream_output_keeps_original_columns(export):
+    run_pipeline(FirebaseAIIntegration(), parse_args(['--stream', '--chunk-size', '20']))
+    assert list(read_predictions('ai_credit_predictions.csv').columns) == PREDICTION_COLUMNS
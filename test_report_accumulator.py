@@ -0,0 +1,66 @@
+"""
+`ReportAccumulator` chunk-by-chunk and merged reports against the one-pass
+report, including categorical `industry` columns with nulls as produced by
+`iter_json_chunks`.
+
+Run with `python -m pytest -q test_report_accumulator.py`.
+"""
+
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from firebase_ai_integration import FirebaseAIIntegration, ReportAccumulator
+
+
+def business_records(n: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    industries = ['Technology', 'Retail', 'Services', None]
+    return [{
+        'business_id': f'BIZ{b:05d}',
+        'business_name': f'Business {b + 1}',
+        'industry': industries[b % len(industries)],
+        'customer_number': int(rng.integers(1, 20)),
+        'customer_order': float(rng.uniform(1, 5)),
+        'amount': float(rng.uniform(1000, 50000)),
+        'days_since_last_transaction': int(rng.integers(1, 365)),
+        'customer_stickiness': float(rng.uniform(0, 0.9)),
+        'transaction_count': int(rng.integers(3, 50)),
+        'completion_rate': float(rng.uniform(0.1, 1.0)),
+        'clearance_days': float(rng.uniform(5, 30)),
+    } for b in range(n)]
+
+
+@pytest.fixture(scope='module')
+def predictions() -> pd.DataFrame:
+    np.random.seed(3)
+    return FirebaseAIIntegration().predict_credit_scores(pd.DataFrame(business_records(500)))
+
+
+def test_merged_chunks_match_one_pass_report(predictions):
+    expected = ReportAccumulator().update(predictions).render()
+    merged = ReportAccumulator()
+    for start in range(0, len(predictions), 128):
+        chunk = predictions.iloc[start:start + 128].copy()
+        chunk['industry'] = chunk['industry'].astype('category')
+        part = ReportAccumulator().update(chunk)
+        merged.merge(ReportAccumulator.from_dict(json.loads(json.dumps(part.to_dict()))))
+    assert merged.render() == expected
+    assert merged.industries['Unknown']['rows'] == (predictions['industry'].isna()).sum()
+
+
+def test_score_json_stream_with_null_categorical_industry(tmp_path):
+    records = business_records(60)
+    input_path = tmp_path / 'businesses.json'
+    input_path.write_text(json.dumps(records))
+    integration = FirebaseAIIntegration()
+    chunk = next(integration.iter_json_chunks(str(input_path), chunk_size=20))
+    assert isinstance(chunk['industry'].dtype, pd.CategoricalDtype) and chunk['industry'].isna().any()
+
+    summary = integration.score_json_stream(str(input_path), str(tmp_path / 'scores.csv'), chunk_size=20)
+    report = summary['report']
+    assert summary['rows'] == report.rows == len(records)
+    assert report.industries['Unknown']['rows'] == sum(record['industry'] is None for record in records)
+    assert sum(totals['rows'] for totals in report.industries.values()) == len(records)
@@ -0,0 +1,98 @@
+"""
+Per-business fetches resumed from a scan checkpoint, after failed invoice
+queries or a crash mid-scan, against a clean fetch on `FakeFirestore` data.
+
+Run with `python -m pytest -q test_scan_checkpoint.py`.
+"""
+
+import json
+import os
+
+import pandas as pd
+import pytest
+
+from fake_firestore import FakeFirestore, populate_tenant
+from firebase_ai_integration import FirebaseAIIntegration
+
+
+@pytest.fixture(scope='module')
+def db() -> FakeFirestore:
+    db = FakeFirestore()
+    populate_tenant(db, 300, seed=3)
+    return db
+
+
+def integration_for(db: FakeFirestore, failing=()) -> FirebaseAIIntegration:
+    """An integration whose invoice queries fail for the businesses in `failing`"""
+    integration = FirebaseAIIntegration(profile_page_size=50)
+    integration.db = db
+    query = integration._query_business_transactions
+
+    def failing_query(business_id):
+        if business_id in failing:
+            raise RuntimeError(f"query failed for {business_id}")
+        return query(business_id)
+
+    integration._query_business_transactions = failing_query
+    return integration
+
+
+def rows(df: pd.DataFrame) -> pd.DataFrame:
+    return df.drop(columns='days_since_last_transaction').sort_values('business_id').reset_index(drop=True)
+
+
+@pytest.fixture(scope='module')
+def clean(db) -> pd.DataFrame:
+    return rows(integration_for(db).fetch_businesses_from_firebase())
+
+
+@pytest.mark.parametrize('max_workers', [None, 4])
+def test_failed_queries_are_retried_on_resume(db, clean, tmp_path, max_workers):
+    checkpoint_path = str(tmp_path / 'scan.json')
+    failing = set(clean['business_id'][::17]) | {'BIZ00001'}
+
+    partial = integration_for(db, failing).fetch_businesses_from_firebase(checkpoint_path=checkpoint_path,
+                                                                          max_workers=max_workers)
+    assert not set(partial['business_id']) & failing
+    assert len(partial) == len(clean) - len(failing & set(clean['business_id']))
+    with open(checkpoint_path) as f:
+        assert sorted(json.load(f)['failed']) == sorted(failing)
+
+    still_failing = integration_for(db, {'BIZ00001'})
+    still_failing.fetch_businesses_from_firebase(checkpoint_path=checkpoint_path, max_workers=max_workers)
+    assert still_failing.fetch_stats['failed_businesses'] == ['BIZ00001']
+    with open(checkpoint_path) as f:
+        assert json.load(f)['failed'] == ['BIZ00001']
+
+    resumed = integration_for(db).fetch_businesses_from_firebase(checkpoint_path=checkpoint_path,
+                                                                 max_workers=max_workers)
+    assert not os.path.exists(checkpoint_path)
+    pd.testing.assert_frame_equal(rows(resumed), clean)
+
+
+def test_resume_after_crash_mid_scan(db, clean, tmp_path):
+    checkpoint_path = str(tmp_path / 'scan.json')
+    failing = set(clean['business_id'][::23])
+    crashing = integration_for(db, failing)
+    pages = crashing.iter_business_profiles
+
+    def crash_on_fourth_page(*args, **kwargs):
+        for n, page in enumerate(pages(*args, **kwargs)):
+            if n == 3:
+                raise RuntimeError("process killed")
+            yield page
+
+    crashing.iter_business_profiles = crash_on_fourth_page
+    assert crashing.fetch_businesses_concurrent(checkpoint_path=checkpoint_path, max_workers=4,
+                                                max_retries=0).empty
+    with open(checkpoint_path) as f:
+        checkpoint = json.load(f)
+    # Pages whose queries were still running when it crashed are not checkpointed
+    assert 0 < checkpoint['profiles'] <= 150 and checkpoint['failed']
+
+    db.reset_stats()
+    resumed = integration_for(db)
+    df = resumed.fetch_businesses_from_firebase(checkpoint_path=checkpoint_path)
+    assert resumed.fetch_stats['reads'] == db.stats['reads']
+    assert not os.path.exists(checkpoint_path)
+    pd.testing.assert_frame_equal(rows(df), clean)
@@ -0,0 +1,79 @@
+"""
+`MicroBatcher` responses under concurrent requests: each request gets its own
+business's result, the same as scoring all of them in one frame, and a
+business that breaks scoring only fails its own request.
+
+Run with `python -m pytest -q test_scoring_server.py`.
+"""
+
+import argparse
+import asyncio
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from firebase_ai_integration import FirebaseAIIntegration
+from scoring_server import RESPONSE_FIELDS, MicroBatcher, sample_business, serve
+
+
+@pytest.fixture(autouse=True)
+def no_score_noise(monkeypatch):
+    """Formula scores without their random noise, so batches of any size score alike"""
+    monkeypatch.setattr(np.random, 'normal', lambda loc, scale, size: np.zeros(size))
+
+
+def score_concurrently(batcher: MicroBatcher, businesses):
+    async def run():
+        batcher.start()
+        try:
+            return await asyncio.gather(*(batcher.score(business) for business in businesses),
+                                        return_exceptions=True)
+        finally:
+            await batcher.stop()
+    return asyncio.run(run())
+
+
+def test_responses_follow_requests_across_batches():
+    rng = np.random.default_rng(5)
+    businesses = [sample_business(rng, i) for i in range(300)]
+    integration = FirebaseAIIntegration()
+    batcher = MicroBatcher(integration, max_batch_size=32, max_wait_ms=2.0)
+
+    responses = score_concurrently(batcher, businesses)
+    expected = integration.add_top_reasons(integration.score_rows(pd.DataFrame(businesses)))
+    expected['predicted_credit_score'] = expected['predicted_credit_score'].astype(float)
+    assert responses == expected[RESPONSE_FIELDS + ['top_reasons']].to_dict('records')
+    assert len(batcher.batch_sizes) > 1 and max(batcher.batch_sizes) <= 32
+    # Serving does not add run metrics per batch
+    assert integration.metrics.summary()['stages'] == {}
+
+
+def test_failing_business_only_fails_its_own_request():
+    rng = np.random.default_rng(6)
+    businesses = [sample_business(rng, i) for i in range(40)]
+    integration = FirebaseAIIntegration()
+    score_rows = integration.score_rows
+
+    def failing_score_rows(df):
+        if (df['business_id'] == 'LOAD0000007').any():
+            raise ValueError("cannot score LOAD0000007")
+        return score_rows(df)
+
+    integration.score_rows = failing_score_rows
+    batcher = MicroBatcher(integration, max_batch_size=64, max_wait_ms=20.0, top_reasons=0)
+
+    responses = score_concurrently(batcher, businesses)
+    assert isinstance(responses[7], ValueError)
+    expected = score_rows(pd.DataFrame(businesses[:7] + businesses[8:]))
+    expected['predicted_credit_score'] = expected['predicted_credit_score'].astype(float)
+    assert responses[:7] + responses[8:] == expected[RESPONSE_FIELDS].to_dict('records')
+
+
+def test_load_test_uses_an_ephemeral_port(tmp_path, capsys):
+    args = argparse.Namespace(model_dir=str(tmp_path / 'no-model'), host='127.0.0.1', port=None, load_test=True,
+                              max_batch_size=64, max_wait_ms=2.0, top_reasons=3, concurrency=8, requests=200)
+    asyncio.run(serve(args))
+    output = capsys.readouterr().out
+    assert 'http://127.0.0.1:8765 ' not in output
+    assert '"requests": 200' in output
@@ -0,0 +1,91 @@
+"""
+Parity of the vectorized feature, filter and scoring paths with the original
+per-business functions, on `fake_firestore.populate_synthetic` data.
+
+Run with `python -m pytest -q test_vectorized_parity.py`.
+"""
+
+from datetime import datetime
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from fake_firestore import FakeFirestore, populate_synthetic
+from firebase_ai_integration import SCORING_FEATURES, FirebaseAIIntegration
+
+CURRENT_DATE = datetime(2025, 3, 1)
+
+
+@pytest.fixture(scope='module')
+def integration() -> FirebaseAIIntegration:
+    integration = FirebaseAIIntegration()
+    integration.db = FakeFirestore()
+    populate_synthetic(integration.db, 300, seed=7)
+    return integration
+
+
+@pytest.fixture(scope='module')
+def transaction_dicts(integration) -> Dict[str, List[Dict]]:
+    """Invoices of each business as the transaction dicts the original code computed features from"""
+    by_business: Dict[str, List[Dict]] = {}
+    for invoice_doc in integration.db.collection('invoices').stream():
+        invoice_data = invoice_doc.to_dict()
+        by_business.setdefault(invoice_data['businessId'], []).append(
+            integration._invoice_to_transaction(invoice_data['businessId'], invoice_data)
+        )
+    return by_business
+
+
+@pytest.fixture(scope='module')
+def scalar_features(integration, transaction_dicts) -> pd.DataFrame:
+    """`calculate_ai_features_from_firebase` on transaction dicts, one row per business"""
+    return pd.DataFrame.from_dict({
+        business_id: integration.calculate_ai_features_from_firebase(transactions, current_date=CURRENT_DATE)
+        for business_id, transactions in transaction_dicts.items()
+    }, orient='index')[SCORING_FEATURES]
+
+
+def test_feature_paths_match_scalar_features(integration, transaction_dicts, scalar_features):
+    _, transactions, _, _ = integration.scan_invoices(integration.db)
+    columns = integration.calculate_ai_features_columns(transactions, current_date=CURRENT_DATE)
+    frame = integration.calculate_ai_features_frame(
+        integration.transactions_to_frame([t for ts in transaction_dicts.values() for t in ts]),
+        current_date=CURRENT_DATE
+    )
+    per_business = pd.DataFrame.from_dict({
+        business_id: integration.calculate_ai_features_from_firebase(business_transactions, current_date=CURRENT_DATE)
+        for business_id, business_transactions in transactions.split().items()
+    }, orient='index')[SCORING_FEATURES]
+
+    expected = scalar_features.sort_index()
+    for features in (columns, frame, per_business):
+        pd.testing.assert_frame_equal(features[SCORING_FEATURES].sort_index().rename_axis(None), expected,
+                                      check_dtype=False)
+
+
+def test_bulk_fetch_matches_per_business_rows(integration):
+    vectorized = integration.fetch_businesses_bulk(vectorized=True)
+    rows = integration.fetch_businesses_bulk(vectorized=False)
+    pd.testing.assert_frame_equal(vectorized.drop(columns='days_since_last_transaction'),
+                                  rows.drop(columns='days_since_last_transaction'), check_dtype=False)
+
+
+def test_hard_filters_batch_matches_scalar(integration, scalar_features):
+    batch = integration.apply_hard_filters_batch(scalar_features)
+    scalar = [integration.apply_hard_filters(features) for features in scalar_features.to_dict('records')]
+    assert list(batch) == scalar
+    assert len(set(scalar)) > 1
+
+
+def test_credit_scores_batch_matches_scalar(integration, scalar_features):
+    np.random.seed(11)
+    scalar = np.array([integration.calculate_credit_score_from_features(features)
+                       for features in scalar_features.to_dict('records')])
+    np.random.seed(11)
+    batch = integration.calculate_credit_scores_batch(scalar_features)
+    np.testing.assert_allclose(batch, scalar)
+    assert list(integration.categorize_credit_scores_batch(batch)) == [
+        integration.categorize_credit_score(score) for score in scalar
+    ]